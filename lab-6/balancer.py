@@ -3,76 +3,163 @@ import requests
 import threading
 import time
 
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from health import HealthChecker, init_health
+from registry import InstanceRegistry
+from strategies import DEFAULT_STRATEGY, MAX_WEIGHT, STRATEGIES, create_strategy, init_balancing
+from upstream import UpstreamPool
+
 app = Flask(__name__)
 
+# Какую долю серверов выключатели могут исключить одновременно (хотя бы один сервер)
+MAX_EJECTED_SHARE = 0.5
+
 
 # Класс для балансировки нагрузки между серверами
 class LoadBalancer:
-    def __init__(self):
-        # Список всех серверов (инстансов)
-        self.instances = []
-        # Текущий индекс для алгоритма Round Robin
-        self.current_index = 0
-
-    # Добавляет новый сервер в пул
-    def add_instance(self, ip, port):
-        instance = {"ip": ip, "port": port, "active": False}
-        self.instances.append(instance)
-        # При добавлении сервера сразу проверяем его статус
-        self.check_instance_health(instance)
-
-    # Удаляет сервер из пула по индексу
-    def remove_instance(self, index_inst):
-        # Проверка, что индекс неотрицательный и не превышает кол-во серверов
-        if 0 <= index_inst < len(self.instances):
-            self.instances.pop(index_inst)
-            # Сбрасываем индекс, если он вышел за границы после удаления
-            if self.current_index >= len(self.instances):
-                self.current_index = 0
-
-    # Возвращает следующий сервер по алгоритму Round Robin
-    def get_next_instance(self):
-        if not self.instances:
-            return None
-
-        # Сохраняем начальный индекс для прохождения одного круга
-        start_index = self.current_index
-
-        # Ищем следующий активный сервер
-        while True:
-            instance = self.instances[self.current_index]
-            # Увеличиваем индекс для каждого следующего вызова
-            self.current_index = (self.current_index + 1) % len(self.instances)
-
-            if instance["active"]:
-                return instance
-
-            # Если прошли полный круг и все серверы неактивны, выходим
-            if self.current_index == start_index:
-                return None
-
-    # Проверяет статус конкретного сервера
-    @staticmethod
-    def check_instance_health(instance):
-        try:
-            url = f"http://{instance['ip']}:{instance['port']}/health"
-            response = requests.get(url, timeout=3)
-            instance["active"] = (response.status_code == 200)
-            return instance["active"]
-        except requests.exceptions.RequestException:
-            instance["active"] = False
+    # health_checks=False - без фоновых проверок здоровья, состояние серверов задается вручную (нагрузочные проверки)
+    def __init__(self, strategy=DEFAULT_STRATEGY, health_checks=True):
+        # Алгоритм выбора сервера (strategies.py)
+        self.strategy = create_strategy(strategy)
+        # Список всех серверов (инстансов) с копированием при записи (registry.py)
+        # Стратегия перестраивается при каждом изменении списка под его блокировкой
+        self.registry = InstanceRegistry(on_change=lambda instances: self.strategy.update(instances))
+        # Проверки здоровья серверов в фоне, параллельно в пуле потоков
+        # При изменении состояния сервера стратегия перестраивается
+        self.health_checker = HealthChecker(self.registry.snapshot, on_change=lambda instance: self.refresh())
+        self.health_checks = health_checks
+        # Когда ближайший исключенный сервер можно пробовать снова (time.monotonic())
+        self.breaker_deadline = float("inf")
+        self.breaker_lock = threading.Lock()
+
+    # Снимок списка серверов: кортеж, который не меняется, пока по нему идет проход
+    @property
+    def instances(self):
+        return self.registry.snapshot()
+
+    # Перестраивает стратегию по текущему списку серверов и их состоянию
+    def refresh(self):
+        self.registry.refresh()
+
+    # Меняет алгоритм выбора сервера
+    def set_strategy(self, name):
+        strategy = create_strategy(name)
+
+        def replace(instances):
+            strategy.update(instances)
+            self.strategy = strategy
+
+        self.registry.locked(replace)
+
+    # Добавляет новый сервер в пул, возвращает его идентификатор
+    def add_instance(self, ip, port, weight=1):
+        instance = init_balancing(init_health({"ip": ip, "port": port, "active": False}), weight)
+        # Постоянные соединения с сервером: через них идут запросы клиентов и проверки здоровья
+        instance["pool"] = UpstreamPool(ip, port)
+        # Автоматический выключатель по результатам запросов клиентов
+        instance["breaker"] = CircuitBreaker()
+        instance_id = self.registry.add(instance)
+        # При добавлении сервера сразу планируем проверку его статуса, не дожидаясь ее в запросе
+        # Планировщик запускается с первым сервером, если еще не запущен
+        if self.health_checks:
+            self.health_checker.start()
+            self.health_checker.schedule_now(instance)
+        return instance_id
+
+    # Удаляет сервер из пула по идентификатору, возвращает, был ли такой сервер
+    # Запросы, которые уже выбрали этот сервер, завершаются со своим снимком списка
+    def remove_instance(self, instance_id):
+        instance = self.registry.remove(instance_id)
+        if instance is None:
             return False
-
-    # Проверяет статус всех серверов
-    def check_all_instances_health(self):
-        for instance in self.instances:
-            self.check_instance_health(instance)
-
-    # Фоновая проверка здоровья всех серверов
-    def health_check(self):
-        while True:
-            self.check_all_instances_health()
-            time.sleep(5)
+        instance["pool"].close()
+        return True
+
+    # Возвращает следующий сервер по выбранной стратегии и учитывает начало запроса к нему
+    # После запроса нужно вызвать release_instance
+    # key - ключ запроса для стратегии consistent_hash
+    #
+    # Выключатель сервера может не пропустить запрос: в half_open идут только пробные запросы,
+    # а после замыкания - лишь часть запросов (плавный возврат нагрузки). Тогда выбирается другой
+    # сервер, уже без ключа. Отклоненные серверы остаются учтенными до конца выбора, иначе
+    # least_outstanding снова выбрал бы тот же сервер. Если все попытки отклонены только плавным
+    # возвратом, запрос идет на последний из таких серверов, чтобы не отказывать клиенту при рабочих серверах.
+    def get_next_instance(self, key=None):
+        self.update_breakers()
+        strategy = self.strategy
+        chosen = None
+        rejected = []
+        for _ in range(len(self.instances)):
+            instance = strategy.acquire(key)
+            if instance is None:
+                break
+            if instance["breaker"].allow():
+                chosen = instance
+                break
+            rejected.append(instance)
+            key = None
+        if chosen is None:
+            # Запрос к запасному серверу уже учтен его отклоненной попыткой
+            for position in range(len(rejected) - 1, -1, -1):
+                if rejected[position]["breaker"].state == CLOSED:
+                    chosen = rejected.pop(position)
+                    break
+        for instance in rejected:
+            strategy.cancel(instance)
+        return chosen
+
+    # Учитывает завершение запроса к серверу: время ответа и был ли ответ
+    def release_instance(self, instance, seconds, ok):
+        self.strategy.release(instance, seconds, ok)
+        if instance["breaker"].record(seconds, ok, can_open=lambda: self.can_eject(instance)):
+            self.breaker_changed(instance)
+
+    # Можно ли исключить сервер: исключенных не больше MAX_EJECTED_SHARE серверов
+    # Сервер в half_open считается исключенным, пока выключатель не замкнется, хотя и получает
+    # пробные запросы: иначе за время проб успел бы разомкнуться другой выключатель, и после
+    # неудачной пробы исключенными оказались бы все серверы. Сам сервер не считается: повторное
+    # размыкание после пробы не добавляет исключенных
+    # Проверка и отметка сервера исключенным идут под одной блокировкой, поэтому одновременные
+    # размыкания выключателей не превысят ограничение
+    def can_eject(self, instance):
+        with self.breaker_lock:
+            instances = self.instances
+            ejected = sum(1 for other in instances if other is not instance
+                          and (other["ejected"] or other["breaker"].state == HALF_OPEN))
+            if ejected >= max(1, int(len(instances) * MAX_EJECTED_SHARE)):
+                return False
+            instance["ejected"] = True
+            return True
+
+    # Выключатель сервера сменил состояние: сервер исключается из стратегии или возвращается в нее
+    def breaker_changed(self, instance):
+        breaker = instance["breaker"]
+        with self.breaker_lock:
+            instance["ejected"] = breaker.state == OPEN
+            if breaker.state == OPEN:
+                self.breaker_deadline = min(self.breaker_deadline, breaker.retry_at)
+        self.refresh()
+
+    # Переводит в half_open выключатели, у которых прошло время исключения
+    # Проверка времени без блокировки, поэтому в обычном случае это одно сравнение на запрос
+    # Выключатели переключаются вне self.breaker_lock: can_eject берет ее под блокировкой выключателя
+    def update_breakers(self):
+        if time.monotonic() < self.breaker_deadline:
+            return
+        now = time.monotonic()
+        instances = self.instances
+        half_open = [instance for instance in instances if instance["breaker"].try_half_open(now)]
+        with self.breaker_lock:
+            for instance in half_open:
+                instance["ejected"] = instance["breaker"].state == OPEN
+            deadline = float("inf")
+            for instance in instances:
+                breaker = instance["breaker"]
+                if breaker.state == OPEN:
+                    deadline = min(deadline, breaker.retry_at)
+            self.breaker_deadline = deadline
+        if half_open:
+            self.refresh()
 
 
 # Создаем экземпляр балансировщика
@@ -82,7 +169,8 @@ lb = LoadBalancer()
 @app.route('/')
 def index():
     # Рендерим главную страницу для управления серверами
-    return render_template("index.html", instances=lb.instances)
+    return render_template("index.html", instances=lb.instances, strategy=lb.strategy.name,
+                           strategies=list(STRATEGIES), max_weight=MAX_WEIGHT)
 
 
 # Обрабатывает добавление нового сервера
@@ -90,53 +178,87 @@ def index():
 def add_instance():
     ip = request.form['ip']
     port = int(request.form['port'])
-    lb.add_instance(ip, port)
+    weight = min(max(int(request.form.get('weight', 1)), 1), MAX_WEIGHT)
+    lb.add_instance(ip, port, weight)
     return redirect('/')
 
 
 # Обрабатывает удаление сервера
 @app.route('/remove_instance', methods=['POST'])
 def remove_instance():
-    index_inst = int(request.form['index'])
-    lb.remove_instance(index_inst)
+    instance_id = int(request.form['id'])
+    lb.remove_instance(instance_id)
+    return redirect('/')
+
+
+# Меняет алгоритм выбора сервера
+@app.route('/strategy', methods=['POST'])
+def strategy():
+    name = request.form['strategy']
+    if name not in STRATEGIES:
+        return f"Неизвестная стратегия {name}", 400
+    lb.set_strategy(name)
     return redirect('/')
 
 
 # Возвращает статус всех серверов в формате JSON
+# Отдается состояние по последним фоновым проверкам, сам запрос серверы не проверяет
 @app.route('/health')
 def health():
-    # При запросе статуса проверяем актуальное состояние
-    lb.check_all_instances_health()
     return jsonify([{
+        "id": i["id"],
         "ip": i["ip"],
         "port": i["port"],
-        "active": i["active"]
+        "active": i["active"],
+        "last_checked": i["last_checked"],
+        "failures": i["failures"],
+        "weight": i["weight"],
+        "outstanding": i["outstanding"],
+        "latency_ewma": round(i["latency_ewma"], 6),
+        "breaker": i["breaker"].status(),
+        "pool": i["pool"].stats()
     } for i in lb.instances])
 
 
+# Ключ запроса для стратегии consistent_hash: заголовок X-Balance-Key или адрес клиента
+def request_key():
+    return request.headers.get('X-Balance-Key') or request.remote_addr
+
+
+# Отправляет запрос на сервер и учитывает его в стратегии балансировки
+def forward(instance, path):
+    started = time.perf_counter()
+    ok = False
+    try:
+        # Запрос идет через постоянное соединение из пула сервера, ответ ожидаем 3 секунды
+        response = instance["pool"].request(path, timeout=3)
+        # Для выключателя ошибка сервера (5xx) - такая же неудача, как отсутствие ответа
+        ok = response.status_code < 500
+        return response
+    finally:
+        lb.release_instance(instance, time.perf_counter() - started, ok)
+
+
 # Обрабатывает запросы клиентов, перенаправляя их на серверы
 @app.route('/process')
 def process():
+    # Снимок списка серверов: добавление и удаление серверов во время запроса его не меняют
+    instances = lb.instances
     # Если нет доступных серверов, возвращаем ошибку
-    if not lb.instances:
+    if not instances:
         return "Нет доступных серверов", 500
 
     # Пробуем найти работающий сервер
-    for _ in range(len(lb.instances)):
-        # Получаем следующий сервер по алгоритму Round Robin
-        instance = lb.get_next_instance()
+    for _ in range(len(instances)):
+        # Получаем следующий сервер по выбранной стратегии
+        instance = lb.get_next_instance(request_key())
         if not instance:
             break
         try:
-            response = requests.get(
-                f"http://{instance['ip']}:{instance['port']}/process",
-                # Ожидаем ответ 3 секунды
-                timeout=3
-            )
+            response = forward(instance, "/process")
             return response.json()
         except requests.exceptions.RequestException:
-            # Помечаем этот инстанс как неактивный и пробуем следующий
-            instance["active"] = False
+            # Ошибку учел выключатель сервера (в forward), пробуем следующий
             continue
 
     return "Нет доступных серверов", 500
@@ -145,34 +267,27 @@ def process():
 # Перехватывает запросы и перенаправляет их на доступные инстансы
 @app.route('/<path:path>')
 def intercept(path):
-    if not lb.instances:
+    instances = lb.instances
+    if not instances:
         return "Нет доступных серверов", 500
 
-    for _ in range(len(lb.instances)):
-        instance = lb.get_next_instance()
+    for _ in range(len(instances)):
+        instance = lb.get_next_instance(request_key())
         if not instance:
             break
         try:
-            response = requests.get(
-                f"http://{instance['ip']}:{instance['port']}/{path}",
-                timeout=3
-            )
+            response = forward(instance, f"/{path}")
             if response.status_code == 200:
                 return response.json()
             elif response.status_code == 404:
                 return jsonify({"error": f"Путь не найден на сервере {instance['ip']}:{instance['port']}"})
         except requests.exceptions.RequestException:
-            instance["active"] = False
             continue
 
     return "Нет доступных серверов", 500
 
 
 if __name__ == '__main__':
-    # Запускаем поток для проверки здоровья серверов в фоне
-    # Завершается при завершении потока программы из-за daemon
-    health_thread = threading.Thread(target=lb.health_check, daemon=True)
-    health_thread.start()
-
+    # Проверки здоровья запускает сам балансировщик при добавлении первого сервера
     # Запускаем Flask-приложение балансировщика
     app.run(port=5000, debug=True)
\ No newline at end of file
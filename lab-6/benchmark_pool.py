@@ -0,0 +1,141 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+# Запросов в секунду и задержки (p50/p99) запросов через балансировщик
+# с постоянными соединениями до серверов (LB_POOLING=1) и с новым соединением на каждый запрос (LB_POOLING=0)
+#
+# Запускаются несколько серверов server.py и балансировщик balancer.py, серверы добавляются
+# через панель управления. Клиенты держат постоянные соединения с балансировщиком
+# и отправляют запросы /process друг за другом, поэтому разница между режимами -
+# только в соединениях балансировщика с серверами.
+#
+# Запуск: python benchmark_pool.py [секунд на замер] [количество серверов]
+
+# Количество параллельных клиентов
+CLIENTS = [1, 8, 32]
+# Режимы: название -> значение LB_POOLING
+MODES = {
+    "pool": "1",
+    "no pool": "0",
+}
+
+BALANCER_PORT = 5000
+FIRST_SERVER_PORT = 5401
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+# Запускает скрипт в отдельном процессе и ждет, пока он ответит на /health
+def start(arguments, port, env=None):
+    # Своя группа процессов: отладочный сервер Flask запускает дочерний процесс перезагрузчика
+    process = subprocess.Popen(
+        [sys.executable, *arguments],
+        cwd=DIRECTORY,
+        env=dict(os.environ, **(env or {})),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return process
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    stop(process)
+    raise RuntimeError(f"{' '.join(arguments)} не запустился")
+
+
+def stop(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait()
+
+
+# Запускает балансировщик, добавляет серверы и ждет, пока все они станут активными
+def start_balancer(pooling, ports):
+    process = start(["balancer.py"], BALANCER_PORT, {"LB_POOLING": pooling})
+    for port in ports:
+        requests.post(f"http://127.0.0.1:{BALANCER_PORT}/add_instance", data={"ip": "127.0.0.1", "port": port})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        instances = requests.get(f"http://127.0.0.1:{BALANCER_PORT}/health").json()
+        if all(instance["active"] for instance in instances):
+            return process
+        time.sleep(0.1)
+    stop(process)
+    raise RuntimeError("Серверы не стали активными")
+
+
+# Один клиент: отправляет запросы до истечения времени и записывает задержку каждого
+def client(deadline, latencies, errors):
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        response = session.get(f"http://127.0.0.1:{BALANCER_PORT}/process", timeout=10)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+    session.close()
+
+
+def measure(clients, seconds):
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + seconds
+    threads = [threading.Thread(target=client, args=(deadline, latencies, errors)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return (
+        len(latencies) / seconds,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        len(errors),
+    )
+
+
+# Сколько соединений с серверами открыл балансировщик (по статистике пулов)
+def pool_connections():
+    instances = requests.get(f"http://127.0.0.1:{BALANCER_PORT}/health").json()
+    return sum(instance["pool"]["connections_opened"] for instance in instances)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    servers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    ports = [FIRST_SERVER_PORT + i for i in range(servers)]
+
+    print(f"Серверов: {servers}, секунд на замер: {seconds}")
+    print(f"{'режим':<9}{'клиенты':>8}{'запросов/с':>12}{'p50, мс':>10}{'p99, мс':>10}{'ошибок':>8}"
+          f"{'соединений':>12}")
+    server_processes = [start(["server.py", str(port)], port) for port in ports]
+    try:
+        for mode, pooling in MODES.items():
+            balancer = start_balancer(pooling, ports)
+            try:
+                for clients in CLIENTS:
+                    # Короткий прогрев, чтобы открытие соединений не попало в замер
+                    measure(clients, 0.3)
+                    before = pool_connections()
+                    rps, p50, p99, errors = measure(clients, seconds)
+                    # С пулом соединения открываются только при прогреве, без пула - на каждый запрос
+                    opened = pool_connections() - before
+                    print(f"{mode:<9}{clients:>8}{rps:>12.0f}{p50:>10.2f}{p99:>10.2f}{errors:>8}{opened:>12}",
+                          flush=True)
+            finally:
+                stop(balancer)
+    finally:
+        for process in server_processes:
+            stop(process)
+
+
+if __name__ == "__main__":
+    main()
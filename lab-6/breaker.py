@@ -0,0 +1,236 @@
+import random
+import threading
+import time
+from collections import deque
+
+# Автоматический выключатель (circuit breaker) сервера по результатам запросов клиентов
+#
+# Проверки здоровья видят только /health, а выключатель - настоящие запросы: сервер исключается
+# из балансировки (состояние open), если
+# - BREAKER_FAILURES запросов подряд закончились ошибкой,
+# - за последние BREAKER_WINDOW секунд ошибок не меньше BREAKER_ERROR_RATE от запросов,
+# - за последние BREAKER_WINDOW секунд p99 времени ответа больше BREAKER_P99.
+# Доля ошибок и p99 считаются, только когда в окне не меньше BREAKER_MIN_REQUESTS запросов.
+#
+# Через BREAKER_OPEN_TIME секунд (при повторных отключениях - вдвое дольше, до BREAKER_MAX_OPEN_TIME)
+# сервер переходит в состояние half_open: на него идут не больше HALF_OPEN_PROBES пробных запросов
+# одновременно. Если HALF_OPEN_PROBES пробных запросов подряд прошли успешно и быстро, выключатель
+# замыкается (closed), но сервер получает нагрузку постепенно: доля пропускаемых к нему запросов
+# растет от SLOW_START_MIN до 1 за SLOW_START секунд. Ошибка пробного запроса снова размыкает выключатель.
+#
+# Окно хранится по секундам: в каждой секунде количество запросов, ошибок и гистограмма времени ответа,
+# а суммы по окну обновляются при добавлении и удалении секунд. Поэтому учет запроса и проверка
+# условий не зависят от количества запросов в окне.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Сколько ошибок подряд размыкают выключатель
+BREAKER_FAILURES = 3
+# Длина скользящего окна (секунды)
+BREAKER_WINDOW = 10
+# Доля ошибок в окне, при которой выключатель размыкается
+BREAKER_ERROR_RATE = 0.5
+# Сколько запросов должно быть в окне, чтобы судить о доле ошибок и p99
+BREAKER_MIN_REQUESTS = 20
+# Наибольшее допустимое p99 времени ответа в окне (секунды)
+BREAKER_P99 = 1.0
+# На сколько секунд сервер исключается при первом отключении и наибольшее время исключения
+BREAKER_OPEN_TIME = 5
+BREAKER_MAX_OPEN_TIME = 60
+# Сколько пробных запросов в состоянии half_open нужно для замыкания (и сколько идет одновременно)
+HALF_OPEN_PROBES = 3
+# За сколько секунд после замыкания нагрузка на сервер возвращается к полной
+SLOW_START = 10
+# С какой доли запросов начинается возврат нагрузки
+SLOW_START_MIN = 0.1
+# Верхние границы интервалов гистограммы времени ответа (секунды), в последний попадает и все, что дольше
+LATENCY_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Номер интервала гистограммы для времени ответа seconds
+def latency_bucket(seconds):
+    for index, bound in enumerate(LATENCY_BOUNDS):
+        if seconds <= bound:
+            return index
+    return len(LATENCY_BOUNDS) - 1
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        # Почему выключатель разомкнулся в последний раз
+        self.reason = None
+        self.consecutive_failures = 0
+        # Окно: секунды [секунда, запросов, ошибок, гистограмма] и суммы по ним
+        self.window = deque()
+        self.requests = 0
+        self.errors = 0
+        self.histogram = [0] * len(LATENCY_BOUNDS)
+        # Сколько раз подряд выключатель размыкался (от этого зависит время исключения) и всего
+        self.ejections = 0
+        self.total_ejections = 0
+        # Когда можно перейти в half_open (time.monotonic())
+        self.retry_at = None
+        # Пробные запросы в состоянии half_open: выполняются сейчас и успешных подряд
+        self.probes = 0
+        self.probe_successes = 0
+        # Когда выключатель замкнулся после отключения (начало плавного возврата нагрузки)
+        self.closed_at = None
+
+    # Доля запросов, которую получает сервер при плавном возврате нагрузки
+    def weight_factor(self, now=None):
+        if self.closed_at is None:
+            return 1.0
+        elapsed = (now or time.monotonic()) - self.closed_at
+        if elapsed >= SLOW_START:
+            return 1.0
+        return max(SLOW_START_MIN, elapsed / SLOW_START)
+
+    # Можно ли отправить запрос на сервер; в half_open занимает место пробного запроса,
+    # которое освобождается в record()
+    def allow(self, now=None):
+        if self.state == CLOSED:
+            factor = self.weight_factor(now)
+            return factor >= 1.0 or random.random() < factor
+        if self.state == HALF_OPEN:
+            with self.lock:
+                if self.state == HALF_OPEN and self.probes < HALF_OPEN_PROBES:
+                    self.probes += 1
+                    return True
+        return False
+
+    # Учитывает результат запроса: seconds - время ответа, ok - был ли успешный ответ
+    # can_open() проверяется перед размыканием, в том числе после ошибки пробного запроса:
+# балансировщик ограничивает число исключенных серверов
+    # Вызывается под self.lock, и если возвращает True, выключатель размыкается сразу
+    # Возвращает True, если состояние выключателя изменилось
+    def record(self, seconds, ok, now=None, can_open=None):
+        now = now or time.monotonic()
+        with self.lock:
+            self.add_to_window(seconds, ok, now)
+
+            if self.state == HALF_OPEN:
+                self.probes = max(0, self.probes - 1)
+                if not ok or seconds > BREAKER_P99:
+                    # Если разомкнуть нельзя, сервер остается в half_open, и пробы начинаются заново
+                    if can_open is not None and not can_open():
+                        self.probe_successes = 0
+                        return False
+                    self.open(now, "ошибка пробного запроса" if not ok else "медленный пробный запрос")
+                    return True
+                self.probe_successes += 1
+                if self.probe_successes >= HALF_OPEN_PROBES:
+                    self.close(now)
+                    return True
+                return False
+
+            if self.state == OPEN:
+                # Ответ на запрос, отправленный до размыкания
+                return False
+
+            self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+            reason = self.trip_reason()
+            if reason is None or (can_open is not None and not can_open()):
+                return False
+            self.open(now, reason)
+            return True
+
+    # Почему выключатель нужно разомкнуть (None - не нужно)
+    def trip_reason(self):
+        if self.consecutive_failures >= BREAKER_FAILURES:
+            return f"{self.consecutive_failures} ошибок подряд"
+        if self.requests < BREAKER_MIN_REQUESTS:
+            return None
+        if self.errors / self.requests >= BREAKER_ERROR_RATE:
+            return f"ошибок {self.errors} из {self.requests} за {BREAKER_WINDOW} с"
+        p99 = self.p99()
+        if p99 > BREAKER_P99:
+            return f"p99 времени ответа {p99} с больше {BREAKER_P99} с"
+        return None
+
+    # Переходит в half_open, если время исключения прошло; возвращает True при переходе
+    def try_half_open(self, now=None):
+        now = now or time.monotonic()
+        with self.lock:
+            if self.state != OPEN or now < self.retry_at:
+                return False
+            self.state = HALF_OPEN
+            self.probes = 0
+            self.probe_successes = 0
+            return True
+
+    # Дальше методы вызываются под self.lock
+
+    def open(self, now, reason):
+        # Если после прошлого замыкания сервер долго работал без отключений, время исключения сбрасывается
+        if self.closed_at is not None and now - self.closed_at > BREAKER_MAX_OPEN_TIME:
+            self.ejections = 0
+        self.ejections += 1
+        self.total_ejections += 1
+        self.state = OPEN
+        self.reason = reason
+        self.retry_at = now + min(BREAKER_OPEN_TIME * 2 ** (self.ejections - 1), BREAKER_MAX_OPEN_TIME)
+        self.consecutive_failures = 0
+        self.reset_window()
+
+    def close(self, now):
+        self.state = CLOSED
+        self.closed_at = now
+        self.retry_at = None
+        self.reset_window()
+
+    def add_to_window(self, seconds, ok, now):
+        second = int(now)
+        while self.window and self.window[0][0] <= second - BREAKER_WINDOW:
+            _, requests, errors, histogram = self.window.popleft()
+            self.requests -= requests
+            self.errors -= errors
+            for index, count in enumerate(histogram):
+                self.histogram[index] -= count
+        if not self.window or self.window[-1][0] != second:
+            self.window.append([second, 0, 0, [0] * len(LATENCY_BOUNDS)])
+        current = self.window[-1]
+        bucket = latency_bucket(seconds)
+        current[1] += 1
+        self.requests += 1
+        current[3][bucket] += 1
+        self.histogram[bucket] += 1
+        if not ok:
+            current[2] += 1
+            self.errors += 1
+
+    def reset_window(self):
+        self.window.clear()
+        self.requests = 0
+        self.errors = 0
+        self.histogram = [0] * len(LATENCY_BOUNDS)
+
+    # p99 времени ответа в окне: верхняя граница интервала гистограммы, в который попал 99-й перцентиль
+    def p99(self):
+        if not self.requests:
+            return 0.0
+        rank = self.requests * 99 // 100
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if seen > rank:
+                return LATENCY_BOUNDS[index]
+        return LATENCY_BOUNDS[-1]
+
+    # Состояние для /health и панели управления
+    def status(self):
+        now = time.monotonic()
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "consecutive_failures": self.consecutive_failures,
+            "window_requests": self.requests,
+            "error_rate": round(self.errors / self.requests, 3) if self.requests else 0.0,
+            "p99": self.p99(),
+            "retry_in": round(max(0.0, self.retry_at - now), 1) if self.state == OPEN else None,
+            "weight_factor": round(self.weight_factor(now), 2),
+            "ejections": self.total_ejections,
+        }
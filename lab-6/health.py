@@ -0,0 +1,145 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Проверка здоровья серверов в фоне
+#
+# Каждый сервер проверяется по своему расписанию: раз в HEALTH_INTERVAL секунд со случайным
+# отклонением до HEALTH_JITTER, чтобы проверки всех серверов не приходили одновременно.
+# Проверки выполняются в пуле потоков, поэтому зависший сервер не задерживает проверку остальных,
+# а полный проход по N серверам занимает около одного таймаута, а не N.
+# Поток планировщика запускается один раз методом start() при добавлении первого сервера,
+# поэтому проверки идут при любом способе запуска приложения (python balancer.py, flask run, импорт app).
+#
+# Состояние меняется не от одной проверки, а от нескольких подряд:
+# неактивный сервер становится активным после HEALTH_RISE успешных проверок подряд,
+# активный - неактивным после HEALTH_FALL неудачных подряд. Первая проверка сервера
+# сразу определяет его состояние.
+
+# Как часто проверять каждый сервер (секунды)
+HEALTH_INTERVAL = 5
+# Случайное отклонение интервала: доля от HEALTH_INTERVAL в обе стороны
+HEALTH_JITTER = 0.2
+# Сколько ждать ответа сервера (секунды)
+HEALTH_TIMEOUT = 3
+# Сколько успешных проверок подряд нужно, чтобы сервер стал активным
+HEALTH_RISE = 2
+# Сколько неудачных проверок подряд нужно, чтобы сервер стал неактивным
+HEALTH_FALL = 3
+# Сколько проверок может выполняться одновременно
+HEALTH_WORKERS = 64
+
+
+# Добавляет в описание сервера поля для проверок здоровья
+def init_health(instance):
+    # Успешные и неудачные проверки подряд
+    instance["successes"] = 0
+    instance["failures"] = 0
+    # Сколько всего проверок завершилось
+    instance["checks"] = 0
+    # Когда завершилась последняя проверка (time.time(), None - еще не проверялся)
+    instance["last_checked"] = None
+    # Когда проверить в следующий раз (time.monotonic(), 0 - как можно скорее)
+    instance["next_check"] = 0
+    # Выполняется ли сейчас проверка этого сервера
+    instance["checking"] = False
+    return instance
+
+
+# Проверяет, отвечает ли сервер на /health
+# Запрос идет через пул соединений сервера (UpstreamPool), как и запросы клиентов
+def probe(instance, timeout=HEALTH_TIMEOUT):
+    try:
+        response = instance["pool"].health(timeout)
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+# Учитывает результат проверки и меняет состояние сервера по порогам HEALTH_RISE и HEALTH_FALL
+def record_result(instance, healthy):
+    if healthy:
+        instance["successes"] += 1
+        instance["failures"] = 0
+    else:
+        instance["failures"] += 1
+        instance["successes"] = 0
+
+    if instance["checks"] == 0:
+        instance["active"] = healthy
+    elif healthy and not instance["active"] and instance["successes"] >= HEALTH_RISE:
+        instance["active"] = True
+    elif not healthy and instance["active"] and instance["failures"] >= HEALTH_FALL:
+        instance["active"] = False
+
+    instance["checks"] += 1
+    instance["last_checked"] = time.time()
+
+
+# Интервал до следующей проверки со случайным отклонением
+def next_interval():
+    return HEALTH_INTERVAL * random.uniform(1 - HEALTH_JITTER, 1 + HEALTH_JITTER)
+
+
+# Фоновые проверки серверов из списка get_instances()
+# on_change(instance) вызывается, когда проверка изменила состояние сервера (active)
+class HealthChecker:
+    def __init__(self, get_instances, workers=HEALTH_WORKERS, on_change=None):
+        self.get_instances = get_instances
+        self.on_change = on_change
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="health")
+        # Будит планировщик раньше времени, например когда добавлен сервер
+        self.wakeup = threading.Event()
+        # Поток планировщика, запускается в start()
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    # Запускает поток планировщика, если он еще не запущен
+    # Поток фоновый (daemon) и завершается вместе с программой
+    def start(self):
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="health-scheduler", daemon=True)
+                self.thread.start()
+
+    # Проверяет сервер в потоке пула и планирует следующую проверку
+    def check(self, instance):
+        try:
+            was_active = instance["active"]
+            record_result(instance, probe(instance))
+            if instance["active"] != was_active and self.on_change is not None:
+                self.on_change(instance)
+        finally:
+            instance["next_check"] = time.monotonic() + next_interval()
+            instance["checking"] = False
+
+    # Запускает проверки серверов, которым пора проверяться
+    # Возвращает, через сколько секунд наступит следующая проверка
+    def run_due_checks(self):
+        now = time.monotonic()
+        wait_time = HEALTH_INTERVAL
+        for instance in list(self.get_instances()):
+            if instance["checking"]:
+                continue
+            if instance["next_check"] <= now:
+                instance["checking"] = True
+                self.pool.submit(self.check, instance)
+            else:
+                wait_time = min(wait_time, instance["next_check"] - now)
+        return wait_time
+
+    # Цикл планировщика (выполняется в отдельном потоке)
+    def run(self):
+        while True:
+            # Сбрасываем до прохода, чтобы не потерять сигнал, пришедший во время прохода
+            self.wakeup.clear()
+            wait_time = self.run_due_checks()
+            self.wakeup.wait(wait_time)
+
+    # Просит проверить сервер как можно скорее
+    def schedule_now(self, instance):
+        instance["next_check"] = 0
+        self.wakeup.set()
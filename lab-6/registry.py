@@ -0,0 +1,68 @@
+import itertools
+import threading
+
+# Список серверов балансировщика с копированием при записи
+#
+# Серверы хранятся в неизменяемом кортеже (снимке). Добавление и удаление сервера
+# создают новый кортеж и подменяют ссылку на него одним присваиванием под блокировкой,
+# поэтому читатели (обработчики запросов, проверки здоровья) берут снимок без блокировки
+# и проходят по нему, не боясь, что список сдвинется посреди прохода.
+#
+# У каждого сервера постоянный идентификатор "id", удаление идет по нему, а не по индексу в списке.
+# После каждого изменения вызывается on_change(snapshot) под той же блокировкой:
+# так стратегия балансировки перестраивается вместе с изменением списка, атомарно.
+
+
+class InstanceRegistry:
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.instances = ()
+        self.by_id = {}
+
+    # Текущий снимок: кортеж серверов, читается без блокировки
+    def snapshot(self):
+        return self.instances
+
+    def get(self, instance_id):
+        return self.by_id.get(instance_id)
+
+    def __len__(self):
+        return len(self.instances)
+
+    def __iter__(self):
+        return iter(self.instances)
+
+    # Добавляет сервер и выдает ему идентификатор
+    def add(self, instance):
+        with self.lock:
+            instance["id"] = next(self.ids)
+            self.publish(self.instances + (instance,))
+        return instance["id"]
+
+    # Удаляет сервер по идентификатору, возвращает его описание (None - такого нет)
+    def remove(self, instance_id):
+        with self.lock:
+            instance = self.by_id.get(instance_id)
+            if instance is not None:
+                self.publish(tuple(other for other in self.instances if other["id"] != instance_id))
+        return instance
+
+    # Повторяет on_change с текущим снимком, например после изменения состояния сервера
+    def refresh(self):
+        with self.lock:
+            if self.on_change is not None:
+                self.on_change(self.instances)
+
+    # Выполняет action(snapshot) под блокировкой списка, пока список не может измениться
+    def locked(self, action):
+        with self.lock:
+            return action(self.instances)
+
+    # Подменяет снимок (вызывается под self.lock)
+    def publish(self, instances):
+        if self.on_change is not None:
+            self.on_change(instances)
+        self.by_id = {instance["id"]: instance for instance in instances}
+        self.instances = instances
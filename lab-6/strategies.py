@@ -0,0 +1,268 @@
+import bisect
+import hashlib
+import heapq
+import itertools
+import os
+import random
+import threading
+
+# Алгоритмы выбора сервера (стратегии балансировки)
+#
+# Стратегия хранит свой снимок активных серверов и структуры для выбора, которые строятся заново
+# в update() при изменении списка серверов или их состояния. Поэтому сам выбор сервера
+# не проходит по всем серверам: O(1) для round_robin, weighted и p2c, O(log n) для least_outstanding
+# и consistent_hash. Снимок заменяется одним присваиванием, и выбор, начатый до замены,
+# дорабатывает со старым снимком.
+#
+# Балансировщик вызывает acquire() перед запросом к серверу и release() после него:
+# так стратегия знает, сколько запросов к серверу выполняется сейчас и как быстро он отвечает.
+
+# Стратегия по умолчанию
+DEFAULT_STRATEGY = os.getenv("LB_STRATEGY", "round_robin")
+# Наибольший вес сервера
+MAX_WEIGHT = 100
+# Доля нового замера в скользящем среднем (EWMA) времени ответа
+EWMA_ALPHA = 0.3
+# Время ответа, которое учитывается при ошибке запроса (секунды)
+FAILURE_LATENCY = 3.0
+# Сколько точек на кольце у сервера с весом 1 (consistent_hash)
+VIRTUAL_NODES = 64
+
+
+# Добавляет в описание сервера поля для балансировки
+def init_balancing(instance, weight=1):
+    instance["weight"] = weight
+    # Сколько запросов к серверу выполняется сейчас
+    instance["outstanding"] = 0
+    # Скользящее среднее времени ответа (секунды), 0 - еще нет замеров
+    instance["latency_ewma"] = 0.0
+    # Исключен ли сервер автоматическим выключателем (breaker.py)
+    instance["ejected"] = False
+    return instance
+
+
+# Базовая стратегия: учет запросов и времени ответа, выбор - в подклассах
+class Strategy:
+    name = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = ()
+
+    # Строит структуры выбора по списку серверов (вызывается под блокировкой балансировщика)
+    # Выбираются только активные серверы, которые не исключены выключателем
+    def update(self, instances):
+        self.active = tuple(instance for instance in instances if instance["active"] and not instance["ejected"])
+        self.rebuild()
+
+    def rebuild(self):
+        pass
+
+    # Выбирает сервер для запроса, key - ключ запроса (нужен consistent_hash)
+    # Возвращает None, если активных серверов нет
+    def pick(self, key=None):
+        raise NotImplementedError
+
+    # Выбирает сервер и учитывает начало запроса к нему
+    def acquire(self, key=None):
+        instance = self.pick(key)
+        if instance is not None:
+            self.reserve(instance)
+        return instance
+
+    # Учитывает начало запроса к уже выбранному серверу
+    def reserve(self, instance):
+        with self.lock:
+            instance["outstanding"] += 1
+            self.changed(instance)
+
+    # Отменяет выбор сервера, если запрос к нему так и не был отправлен
+    def cancel(self, instance):
+        with self.lock:
+            instance["outstanding"] -= 1
+            self.changed(instance)
+
+    # Учитывает завершение запроса: seconds - время ответа, ok - был ли ответ
+    def release(self, instance, seconds, ok):
+        with self.lock:
+            instance["outstanding"] -= 1
+            sample = seconds if ok else max(seconds, FAILURE_LATENCY)
+            if instance["latency_ewma"]:
+                instance["latency_ewma"] += EWMA_ALPHA * (sample - instance["latency_ewma"])
+            else:
+                instance["latency_ewma"] = sample
+            self.changed(instance)
+
+    # Вызывается под self.lock, когда у сервера изменилось число выполняющихся запросов
+    def changed(self, instance):
+        pass
+
+
+# Round Robin: серверы по очереди
+class RoundRobin(Strategy):
+    name = "round_robin"
+
+    def __init__(self):
+        super().__init__()
+        # next() у itertools.count атомарен, поэтому счетчик не требует блокировки
+        self.counter = itertools.count()
+
+    def pick(self, key=None):
+        active = self.active
+        if not active:
+            return None
+        return active[next(self.counter) % len(active)]
+
+
+# Плавный взвешенный Round Robin: сервер с весом w выбирается w раз за цикл,
+# и его выборы распределены по циклу равномерно, а не идут подряд
+# Цикл строится при обновлении: сервер с весом w занимает моменты 0.5/w, 1.5/w, ..., (w - 0.5)/w
+class SmoothWeightedRoundRobin(Strategy):
+    name = "weighted"
+
+    def __init__(self):
+        super().__init__()
+        self.counter = itertools.count()
+        self.sequence = ()
+
+    def rebuild(self):
+        active = self.active
+        heap = [(0.5 / instance["weight"], position) for position, instance in enumerate(active)]
+        heapq.heapify(heap)
+        sequence = []
+        for _ in range(sum(instance["weight"] for instance in active)):
+            moment, position = heapq.heappop(heap)
+            sequence.append(active[position])
+            heapq.heappush(heap, (moment + 1 / active[position]["weight"], position))
+        self.sequence = tuple(sequence)
+
+    def pick(self, key=None):
+        sequence = self.sequence
+        if not sequence:
+            return None
+        return sequence[next(self.counter) % len(sequence)]
+
+
+# Наименьшее число выполняющихся запросов с учетом веса: outstanding / weight
+# Серверы лежат в куче; при изменении outstanding в кучу добавляется новая запись,
+# а устаревшие записи удаляются, когда оказываются на вершине
+class LeastOutstanding(Strategy):
+    name = "least_outstanding"
+
+    def __init__(self):
+        super().__init__()
+        self.heap = []
+        self.positions = {}
+        self.sequence = itertools.count()
+
+    @staticmethod
+    def score(instance):
+        return instance["outstanding"] / instance["weight"]
+
+    # Снимок и куча меняются вместе под блокировкой, чтобы выбор не увидел кучу от другого снимка
+    def update(self, instances):
+        with self.lock:
+            super().update(instances)
+
+    def rebuild(self):
+        self.positions = {id(instance): position for position, instance in enumerate(self.active)}
+        self.heap = [(self.score(instance), next(self.sequence), position)
+                     for position, instance in enumerate(self.active)]
+        heapq.heapify(self.heap)
+
+    def changed(self, instance):
+        position = self.positions.get(id(instance))
+        if position is None:
+            return
+        heapq.heappush(self.heap, (self.score(instance), next(self.sequence), position))
+        # Устаревших записей стало слишком много - строим кучу заново
+        if len(self.heap) > 2 * len(self.active) + 16:
+            self.heap = [(self.score(active), next(self.sequence), position)
+                         for position, active in enumerate(self.active)]
+            heapq.heapify(self.heap)
+
+    def pick(self, key=None):
+        heap = self.heap
+        while heap:
+            score, _, position = heap[0]
+            instance = self.active[position]
+            if score == self.score(instance):
+                return instance
+            heapq.heappop(heap)
+        return None
+
+    # Выбор и учет запроса под одной блокировкой, иначе параллельные запросы выберут один и тот же сервер
+    def acquire(self, key=None):
+        with self.lock:
+            instance = self.pick(key)
+            if instance is not None:
+                instance["outstanding"] += 1
+                self.changed(instance)
+        return instance
+
+
+# Выбор лучшего из двух случайных серверов (power of two choices)
+# Оценка сервера - скользящее среднее времени ответа, умноженное на число выполняющихся запросов + 1
+class PowerOfTwoChoices(Strategy):
+    name = "p2c"
+
+    @staticmethod
+    def cost(instance):
+        return instance["latency_ewma"] * (instance["outstanding"] + 1) / instance["weight"]
+
+    def pick(self, key=None):
+        active = self.active
+        if not active:
+            return None
+        if len(active) == 1:
+            return active[0]
+        first = random.randrange(len(active))
+        second = random.randrange(len(active) - 1)
+        if second >= first:
+            second += 1
+        first, second = active[first], active[second]
+        return first if self.cost(first) <= self.cost(second) else second
+
+
+# Согласованное хеширование по ключу запроса: запросы с одним ключом идут на один сервер,
+# а при добавлении или отключении сервера меняется сервер только у части ключей
+# Сервер с весом w занимает на кольце VIRTUAL_NODES * w точек
+class ConsistentHash(Strategy):
+    name = "consistent_hash"
+
+    def __init__(self):
+        super().__init__()
+        self.ring = ((), ())
+
+    @staticmethod
+    def ring_hash(text):
+        return int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:8], "big")
+
+    def rebuild(self):
+        points = []
+        for instance in self.active:
+            for node in range(VIRTUAL_NODES * instance["weight"]):
+                points.append((self.ring_hash(f"{instance['ip']}:{instance['port']}#{node}"), instance))
+        points.sort(key=lambda point: point[0])
+        self.ring = (tuple(point[0] for point in points), tuple(point[1] for point in points))
+
+    def pick(self, key=None):
+        hashes, instances = self.ring
+        if not hashes:
+            return None
+        if key is None:
+            return instances[random.randrange(len(instances))]
+        index = bisect.bisect(hashes, self.ring_hash(key)) % len(hashes)
+        return instances[index]
+
+
+# Стратегии по названию
+STRATEGIES = {strategy.name: strategy for strategy in (
+    RoundRobin, SmoothWeightedRoundRobin, LeastOutstanding, PowerOfTwoChoices, ConsistentHash
+)}
+
+
+def create_strategy(name):
+    if name not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия {name}, доступны: {', '.join(STRATEGIES)}")
+    return STRATEGIES[name]()
@@ -0,0 +1,175 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+from balancer import LoadBalancer
+from strategies import STRATEGIES
+
+# Нагрузочная проверка списка серверов и стратегий при параллельной работе
+#
+# Запросы к серверам не отправляются: потоки-клиенты только выбирают сервер и сразу его освобождают.
+# 1. Постоянный список: THREADS потоков делают по PICKS выборов через round_robin и weighted.
+#    Ни один выбор не должен потеряться, а распределение должно совпасть с весами точно
+#    (round_robin - разница не больше одного выбора на сервер, weighted - не больше веса сервера).
+# 2. Список меняется: пока клиенты выбирают серверы, отдельный поток добавляет и удаляет
+#    временные серверы и включает и выключает их. Для каждой стратегии проверяется, что
+#    выбор не падает с ошибкой, не возвращает удаленный раньше начала выбора сервер,
+#    а после работы у всех серверов не осталось незавершенных запросов.
+#
+# Запуск: python stress_registry.py [потоков] [выборов на поток]
+
+THREADS = 16
+PICKS = 20000
+# Постоянные серверы: порт -> вес
+STABLE = {6001: 1, 6002: 2, 6003: 3}
+# Пауза между изменениями списка во второй части (секунды)
+CHURN_INTERVAL = 0.001
+
+
+# Балансировщик с постоянными серверами, которые считаются активными без проверок здоровья
+def create_balancer(strategy):
+    lb = LoadBalancer(strategy, health_checks=False)
+    for port, weight in STABLE.items():
+        lb.add_instance("127.0.0.1", port, weight)
+    for instance in lb.instances:
+        instance["active"] = True
+    lb.refresh()
+    return lb
+
+
+# Запускает threads потоков target(number) и ждет их завершения
+def run_threads(threads, target):
+    workers = [threading.Thread(target=target, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+# Часть 1: постоянный список, выборы считаются по серверам
+def check_fairness(strategy, threads, picks):
+    lb = create_balancer(strategy)
+    counters = [Counter() for _ in range(threads)]
+
+    def client(number):
+        for _ in range(picks):
+            instance = lb.get_next_instance()
+            counters[number][instance["port"]] += 1
+            lb.release_instance(instance, 0.0, True)
+
+    started = time.perf_counter()
+    run_threads(threads, client)
+    seconds = time.perf_counter() - started
+
+    counts = sum(counters, Counter())
+    total = threads * picks
+    weights = {port: weight if strategy == "weighted" else 1 for port, weight in STABLE.items()}
+    errors = []
+    if sum(counts.values()) != total:
+        errors.append(f"выборов {sum(counts.values())} вместо {total}")
+    for port, weight in weights.items():
+        expected = total * weight / sum(weights.values())
+        if abs(counts[port] - expected) > weight:
+            errors.append(f"сервер {port}: {counts[port]} выборов вместо {expected:.0f}")
+    print(f"{strategy:<18}{total:>10}{total / seconds:>12.0f}  {dict(sorted(counts.items()))}")
+    return errors
+
+
+# Часть 2: список меняется во время выборов
+def check_churn(strategy, threads, picks):
+    lb = create_balancer(strategy)
+    removed = {}
+    errors = []
+    stop = threading.Event()
+    changes = Counter()
+
+    def churn():
+        temporary = []
+        port = 7000
+        while not stop.is_set():
+            if len(temporary) < 5:
+                port += 1
+                instance_id = lb.add_instance("127.0.0.1", port)
+                lb.registry.get(instance_id)["active"] = True
+                lb.refresh()
+                temporary.append(instance_id)
+                changes["add"] += 1
+            else:
+                instance_id = temporary.pop(0)
+                instance = lb.registry.get(instance_id)
+                lb.remove_instance(instance_id)
+                removed[instance_id] = (time.perf_counter(), instance)
+                changes["remove"] += 1
+            # Один из временных серверов выключается и снова включается
+            if temporary:
+                instance = lb.registry.get(temporary[-1])
+                if instance is not None:
+                    instance["active"] = not instance["active"]
+                    lb.refresh()
+                    changes["toggle"] += 1
+            time.sleep(CHURN_INTERVAL)
+
+    def client(number):
+        for index in range(picks):
+            started = time.perf_counter()
+            try:
+                instance = lb.get_next_instance(f"key-{number}-{index}")
+            except Exception as error:
+                errors.append(f"ошибка выбора: {error!r}")
+                return
+            if instance is None:
+                errors.append("не выбран ни один сервер")
+                continue
+            removed_at, _ = removed.get(instance["id"], (None, None))
+            if removed_at is not None and removed_at < started:
+                errors.append(f"выбран сервер {instance['id']}, удаленный до начала выбора")
+            lb.release_instance(instance, 0.0, True)
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    started = time.perf_counter()
+    try:
+        run_threads(threads, client)
+    finally:
+        stop.set()
+        writer.join()
+    seconds = time.perf_counter() - started
+
+    ids = [instance["id"] for instance in lb.instances]
+    if len(ids) != len(set(ids)) or set(ids) != set(lb.registry.by_id):
+        errors.append("снимок списка и словарь идентификаторов не совпадают")
+    for instance in list(lb.instances) + [instance for _, instance in removed.values()]:
+        if instance["outstanding"] != 0:
+            errors.append(f"у сервера {instance['id']} осталось {instance['outstanding']} незавершенных запросов")
+    print(f"{strategy:<18}{threads * picks:>10}{threads * picks / seconds:>12.0f}  "
+          f"добавлено {changes['add']}, удалено {changes['remove']}, переключено {changes['toggle']}, "
+          f"ошибок {len(errors)}")
+    return errors
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else THREADS
+    picks = int(sys.argv[2]) if len(sys.argv) > 2 else PICKS
+    # Частое переключение потоков, чтобы гонки проявлялись чаще
+    sys.setswitchinterval(1e-5)
+
+    errors = []
+    print(f"Потоков: {threads}, выборов на поток: {picks}")
+    print("Постоянный список:")
+    print(f"{'стратегия':<18}{'выборов':>10}{'выборов/с':>12}  распределение")
+    for strategy in ("round_robin", "weighted"):
+        errors += check_fairness(strategy, threads, picks)
+    print("Список меняется:")
+    print(f"{'стратегия':<18}{'выборов':>10}{'выборов/с':>12}  изменения")
+    for strategy in STRATEGIES:
+        errors += check_churn(strategy, threads, picks // 4)
+
+    for error in errors[:20]:
+        print(error)
+    print("Ошибок нет" if not errors else f"Ошибок: {len(errors)}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import time
+
+from balancer import LoadBalancer
+from breaker import BREAKER_FAILURES, CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+# Балансировщик с двумя активными серверами без проверок здоровья
+def create_balancer():
+    lb = LoadBalancer("round_robin", health_checks=False)
+    for port in (6001, 6002):
+        lb.add_instance("127.0.0.1", port)
+    for instance in lb.instances:
+        instance["active"] = True
+    lb.refresh()
+    return lb
+
+
+def fail(lb, instance, count=BREAKER_FAILURES):
+    for _ in range(count):
+        lb.release_instance(instance, 0.01, False)
+
+
+# Пока первый сервер в half_open, второй не исключается, а неудачная проба не оставляет балансировщик без серверов
+def test_failed_probe_keeps_ejection_limit():
+    lb = create_balancer()
+    first, second = lb.instances
+
+    fail(lb, first)
+    assert first["breaker"].state == OPEN
+    # Время исключения прошло
+    first["breaker"].retry_at = time.monotonic() - 1
+    lb.breaker_deadline = 0
+    lb.update_breakers()
+    assert first["breaker"].state == HALF_OPEN
+
+    fail(lb, second)
+    assert second["breaker"].state == CLOSED
+
+    assert first["breaker"].allow()
+    lb.release_instance(first, 0.01, False)
+    assert first["breaker"].state == OPEN
+    assert second["breaker"].state == CLOSED
+
+    chosen = lb.get_next_instance()
+    assert chosen is second
+    lb.release_instance(chosen, 0.01, True)
+
+
+# Если разомкнуть после неудачной пробы нельзя, выключатель остается в half_open и пробы начинаются заново
+def test_failed_probe_stays_half_open_when_refused():
+    breaker = CircuitBreaker()
+    for _ in range(BREAKER_FAILURES):
+        breaker.record(0.01, False)
+    assert breaker.try_half_open(breaker.retry_at)
+
+    assert breaker.allow()
+    breaker.record(0.01, True)
+    assert breaker.allow()
+    assert breaker.record(0.01, False, can_open=lambda: False) is False
+    assert breaker.state == HALF_OPEN
+    assert breaker.probe_successes == 0
+    assert breaker.probes == 0
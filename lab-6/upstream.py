@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Постоянные (keep-alive) соединения с серверами
+#
+# У каждого сервера свой пул соединений - сессия requests с адаптером на POOL_SIZE соединений.
+# Через пул идут и запросы клиентов, и проверки здоровья, поэтому новое TCP-соединение
+# открывается только когда все соединения пула заняты.
+# Если к серверу долго не было запросов клиентов (POOL_IDLE_TIMEOUT), пул закрывается
+# вместе с соединениями: у отладочного сервера Flask каждое открытое соединение занимает поток.
+# Пул закрывается при очередной проверке здоровья, а следующий запрос клиента откроет его заново.
+# Пока пул закрыт, проверки здоровья идут через отдельные соединения и пул не открывают,
+# а пул удаленного сервера закрывается насовсем.
+
+# Включены ли постоянные соединения (LB_POOLING=0 - новое соединение на каждый запрос, как раньше)
+POOLING = os.getenv("LB_POOLING", "1") != "0"
+# Сколько соединений с одним сервером держать открытыми
+POOL_SIZE = int(os.getenv("LB_POOL_SIZE", "10"))
+# Через сколько секунд без запросов клиентов пул закрывается
+POOL_IDLE_TIMEOUT = float(os.getenv("LB_POOL_IDLE_TIMEOUT", "60"))
+# Сколько ждать ответа сервера (секунды)
+UPSTREAM_TIMEOUT = 3
+
+
+# Пул соединений с одним сервером
+class UpstreamPool:
+    def __init__(self, ip, port, size=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.base_url = f"http://{ip}:{port}"
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.session = None
+        # Закрыт ли пул насовсем (сервер удален): новые сессии не создаются
+        self.closed = False
+        # Когда был последний запрос клиента (time.monotonic())
+        self.last_used = time.monotonic()
+        # Статистика закрытых сессий: запросов и открытых соединений
+        self.closed_requests = 0
+        self.closed_connections = 0
+        # Сколько раз пул закрывался из-за простоя
+        self.idle_closes = 0
+
+    # Сессия пула, при create=True открывается, если пул закрыт (но не закрыт насовсем)
+    # None - запрос нужно отправить через отдельное соединение
+    def get_session(self, create=True):
+        with self.lock:
+            if self.session is None and create and not self.closed:
+                session = requests.Session()
+                # Соединения только с одним сервером, поэтому в адаптере один пул на POOL_SIZE соединений
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.size)
+                session.mount("http://", adapter)
+                self.session = session
+            return self.session
+
+    # GET-запрос к серверу по пути path (например, "/process")
+    # reopen=False - не открывать закрытый пул ради этого запроса
+    def get(self, path, timeout=UPSTREAM_TIMEOUT, reopen=True):
+        session = self.get_session(reopen) if POOLING else None
+        if session is None:
+            # Запрос открывает и закрывает свое соединение, учитываем его в статистике
+            self.closed_requests += 1
+            self.closed_connections += 1
+            return requests.get(self.base_url + path, timeout=timeout)
+        return session.get(self.base_url + path, timeout=timeout)
+
+    # Запрос клиента: отмечает время использования пула
+    def request(self, path, timeout=UPSTREAM_TIMEOUT):
+        self.last_used = time.monotonic()
+        return self.get(path, timeout)
+
+    # Проверка здоровья через тот же пул, если он открыт; заодно закрывает пул, если он простаивает
+    def health(self, timeout=UPSTREAM_TIMEOUT):
+        self.close_if_idle()
+        return self.get("/health", timeout, reopen=False)
+
+    def close_if_idle(self):
+        if self.session is not None and time.monotonic() - self.last_used > self.idle_timeout:
+            self.idle_closes += 1
+            self.drop_session()
+
+    # Закрывает пул насовсем, например при удалении сервера
+    def close(self):
+        with self.lock:
+            self.closed = True
+        self.drop_session()
+
+    # Закрывает сессию с ее соединениями, следующий запрос клиента откроет новую
+    def drop_session(self):
+        with self.lock:
+            session, self.session = self.session, None
+        if session is not None:
+            requests_count, connections, _ = session_counters(session)
+            self.closed_requests += requests_count
+            self.closed_connections += connections
+            session.close()
+
+    # Статистика для панели управления
+    def stats(self):
+        session = self.session
+        requests_count, connections, idle = session_counters(session) if session is not None else (0, 0, 0)
+        return {
+            "requests": self.closed_requests + requests_count,
+            "connections_opened": self.closed_connections + connections,
+            "idle_connections": idle,
+            "idle_closes": self.idle_closes,
+        }
+
+
+# Счетчики пулов urllib3 в сессии: (запросов, открыто соединений, свободных соединений в пуле)
+def session_counters(session):
+    requests_count = connections = idle = 0
+    for adapter in session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_count += pool.num_requests
+            connections += pool.num_connections
+            # В очереди пула лежат и пустые места (None), считаем только соединения
+            idle += sum(1 for connection in list(pool.pool.queue) if connection is not None)
+    return requests_count, connections, idle
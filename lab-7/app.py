@@ -1,53 +1,141 @@
-import json
 import os
+import sys
+import time
 from flask import Flask, request, jsonify
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from engine import ShardedEngine, ValueTooLarge, set_record
+from replication import ReplicationFollower, ReplicationPrimary
+
+# Ограничения запросов, общие для обоих режимов (app.py и asgi.py)
+# Общее ограничение для каждого маршрута: 100 запросов в сутки
+default_limit = os.getenv('KV_DEFAULT_LIMIT', '100 per day')
+# Ограничение на изменения (/set и /mset, /delete и /mdelete)
+mutation_limit = os.getenv('KV_MUTATION_LIMIT', '10 per minute')
+# Включены ли ограничения запросов
+rate_limit_enabled = os.getenv('KV_RATE_LIMIT', '1') == '1'
 
 # Инициализация Flask-приложения
 app = Flask(__name__)
+app.config['RATELIMIT_ENABLED'] = rate_limit_enabled
 
 # Настройка ограничителя запросов (flask-limiter)
 limiter = Limiter(
     # Функция для идентификации пользователей по их IP-адресу
     get_remote_address,
     app=app,
-    # Общее ограничение для всех маршрутов: 100 запросов в сутки
-    default_limits=["100 per day"]
+    default_limits=[default_limit]
+)
+
+# Максимальное количество элементов в одном пакетном запросе (/mset, /mget, /mdelete)
+max_batch_items = int(os.getenv('KV_MAX_BATCH_ITEMS', '1000'))
+# Отдельное ограничение на общее количество элементов во всех пакетных запросах
+batch_item_limit = os.getenv('KV_BATCH_ITEM_LIMIT', '1000 per minute')
+
+
+# Количество элементов в теле пакетного запроса (стоимость запроса для ограничения по элементам)
+def batch_items_count():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return 1
+    items = body.get('items', body.get('keys'))
+    if not isinstance(items, list):
+        return 1
+    return max(len(items), 1)
+
+
+# Ограничения на изменения общие для одиночных и пакетных маршрутов,
+# поэтому пакетный запрос расходует один вызов из лимита /set или /delete
+set_limit = limiter.shared_limit(mutation_limit, scope='set')
+delete_limit = limiter.shared_limit(mutation_limit, scope='delete')
+# Ограничение по элементам: каждый пакетный запрос расходует столько единиц, сколько в нем элементов
+# override_defaults=False оставляет общее ограничение 100 запросов в сутки
+batch_items_limit = limiter.shared_limit(
+    batch_item_limit, scope='batch_items', cost=batch_items_count, override_defaults=False
+)
+
+# Хранилище ключ-значение из нескольких шардов со своими блокировками и файлами
+engine = ShardedEngine(
+    # Количество шардов, ключ попадает в шард по хешу
+    shard_count=int(os.getenv('KV_SHARDS', '1')),
+    # Папка с файлами хранилища, у каждого экземпляра на одной машине должна быть своя
+    data_dir=os.getenv('KV_DATA_DIR', '.'),
+    # Режим сохранения данных:
+    # 'wal' - изменения дописываются в журнал, который периодически сворачивается в data.json
+    # 'snapshot' - весь словарь перезаписывается в data.json после каждого изменения
+    persistence_mode=os.getenv('KV_PERSISTENCE', 'wal'),
+    # Формат снимка: 'json' (data.json) или 'binary' (data.snap, открывается через mmap
+    # за постоянное время, значения читаются по требованию)
+    snapshot_format=os.getenv('KV_SNAPSHOT_FORMAT', 'json'),
+    # Минимальное количество записей в журнале перед сворачиванием в снимок
+    compact_every=int(os.getenv('KV_COMPACT_EVERY', '10000')),
+    # Сбрасывать ли каждую запись на диск (os.fsync)
+    fsync=os.getenv('KV_FSYNC', '1') == '1',
+    # Групповой коммит: изменения параллельных запросов сохраняются общими пакетами
+    group_commit=os.getenv('KV_GROUP_COMMIT', '1') == '1',
+    # Максимальное количество изменений в одном пакете
+    commit_batch=int(os.getenv('KV_COMMIT_BATCH', '512')),
+    # Сколько миллисекунд ждать новых изменений перед сохранением пакета
+    commit_delay=float(os.getenv('KV_COMMIT_DELAY_MS', '0')) / 1000,
+    # Ограничение размера хранилища, 0 - без ограничения
+    # Максимальное количество ключей
+    max_keys=int(os.getenv('KV_MAX_KEYS', '0')),
+    # Максимальный приблизительный объем данных в байтах
+    max_bytes=int(os.getenv('KV_MAX_BYTES', '0')),
+    # Политика вытеснения при переполнении: 'lru', 'lfu' или 'sample' (приближенный LRU как в Redis)
+    eviction_policy=os.getenv('KV_EVICTION', 'lru'),
+    # Раз в сколько секунд фоновая очистка ищет истекшие ключи
+    expire_interval=float(os.getenv('KV_EXPIRE_INTERVAL', '0.1')),
+    # Сколько ключей фоновая очистка удаляет за один захват блокировки
+    expire_batch=int(os.getenv('KV_EXPIRE_BATCH', '200'))
 )
 
-# Переменная с именем файла для хранения данных
-file_name = 'data.json'
 
+# Роль экземпляра в репликации:
+# '' - самостоятельный экземпляр
+# 'primary' - рассылает поток изменений ведомым по локальному сокету KV_REPLICATION_PORT
+# 'follower' - получает изменения от KV_PRIMARY (host:port) и обслуживает только чтение
+replication_role = os.getenv('KV_ROLE', '')
+replication = None
+if replication_role == 'primary':
+    replication = ReplicationPrimary(
+        engine,
+        port=int(os.getenv('KV_REPLICATION_PORT', '6001')),
+        # Сколько последних изменений хранится для догоняющих ведомых
+        backlog_size=int(os.getenv('KV_REPLICATION_BACKLOG', '100000'))
+    )
+elif replication_role == 'follower':
+    primary_host, primary_port = os.getenv('KV_PRIMARY', '127.0.0.1:6001').split(':')
+    replication = ReplicationFollower(engine, primary_host, int(primary_port))
 
-# Загрузка данных из файла при старте приложения
-def load_data():
-    # Проверяем существование файла data.json
-    if os.path.exists(file_name):
-        # Открываем файл в режиме чтения
-        with open(file_name, 'r') as file:
-            # Загружаем JSON данные из файла
-            return json.load(file)
-    # Возвращаем пустой словарь если файл не существует
-    return {}
 
+# Запускает репликацию в процессе, который обслуживает запросы
+def start_replication():
+    if replication is not None:
+        replication.start()
 
-# Загрузка данных при запуске приложения
-data = load_data()
 
+# Ответ на попытку изменить данные на ведомом экземпляре
+def read_only_error():
+    return jsonify({'error': 'Экземпляр работает только на чтение (follower)'}), 403
 
-# Сохранение данных в файл
-# Вызывается после каждой операции добавления или удаления
-def save_data():
-    with open(file_name, 'w') as file:
-        # Преобразуем текущий словарь в JSON и записываем в файл
-        json.dump(data, file)
+
+# Переводит TTL из запроса (в секундах) в абсолютное время истечения
+# Возвращает (время истечения или None, текст ошибки или None)
+def parse_ttl(ttl):
+    if ttl is None:
+        return None, None
+    if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0:
+        return None, 'TTL должен быть положительным числом секунд'
+    return time.time() + ttl, None
 
 
 # Маршрут для сохранения ключа и значения
 @app.route('/set', methods=['POST'])
-@limiter.limit("10 per minute")  # 10 запросов в минуту только для этого маршрута
+@set_limit  # 10 запросов в минуту, общие с /mset
 def set_value():
+    if replication_role == 'follower':
+        return read_only_error()
     if not request.is_json:
         return jsonify({'error': 'Content-Type должен быть application/json'}), 400
     # Ожидает JSON в теле запроса с полями 'key' и 'value'
@@ -56,18 +144,23 @@ def set_value():
         key = request.json.get('key')
         # Получаем значение из тела запроса
         value = request.json.get('value')
+        # Необязательный срок жизни ключа в секундах
+        expire_at, ttl_error = parse_ttl(request.json.get('ttl'))
 
         # Проверяем, что ключ не пустой
         if not key:
             return jsonify({'error': 'Ключ является обязательным полем'}), 400
+        if ttl_error:
+            return jsonify({'error': ttl_error}), 400
 
-        # Сохраняем ключ-значение в словаре data
-        data[key] = value
-        # Сохраняем изменения в файл
-        save_data()
+        # Сохраняем ключ-значение в хранилище
+        # Ответ возвращается только после того, как изменение сохранено на диск
+        engine.set(key, value, expire_at)
 
         # Возвращаем сообщение об успешном выполнении
         return jsonify({'message': 'Данные успешно сохранены'}), 200
+    except ValueTooLarge as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
         # Обрабатываем любые ошибки
         return jsonify({'error': f'Ошибка: {e}'}), 500
@@ -78,11 +171,13 @@ def set_value():
 def get_value(key):
     try:
         # Проверяем существование ключа в хранилище
-        if key not in data:
+        # Истекший ключ удаляется при обращении к нему
+        found, value = engine.get(key)
+        if not found:
             return jsonify({'error': 'Ключ не найден'}), 404
 
         # Возвращаем значение по ключу
-        return jsonify({'value': data[key]}), 200
+        return jsonify({'value': value}), 200
     except Exception as e:
         # Обрабатываем ошибки
         return jsonify({'error': f'Ошибка при получении данных: {e}'}), 500
@@ -90,18 +185,16 @@ def get_value(key):
 
 # Маршрут для удаления ключа
 @app.route('/delete/<key>', methods=['DELETE'])
-@limiter.limit("10 per minute")  # 10 запросов в минуту только для этого маршрута
+@delete_limit  # 10 запросов в минуту, общие с /mdelete
 def delete_value(key):
+    if replication_role == 'follower':
+        return read_only_error()
     try:
-        # Проверяем существование ключа перед удалением
-        if key not in data:
+        # Удаляем ключ, если он существует
+        # Ответ возвращается только после того, как изменение сохранено на диск
+        if not engine.delete(key):
             return jsonify({'error': 'Ключ не найден'}), 404
 
-        # Удаляем ключ из словаря
-        del data[key]
-        # Сохраняем изменения в файл
-        save_data()
-
         # Возвращаем сообщение об успешном удалении
         return jsonify({'message': 'Ключ успешно удален'}), 200
     except Exception as e:
@@ -114,8 +207,8 @@ def delete_value(key):
 def check_exists(key):
     # Возвращает bool значение в exists
     try:
-        # Проверяем наличие ключа в словаре
-        exists = key in data
+        # Проверяем наличие ключа в хранилище
+        exists = engine.exists(key)
         # Возвращаем результат проверки
         return jsonify({'exists': exists}), 200
     except Exception as e:
@@ -123,6 +216,138 @@ def check_exists(key):
         return jsonify({'error': f'Ошибка при проверке ключа: {e}'}), 500
 
 
+# Достает из JSON тела пакетного запроса список по имени поля
+# Возвращает (список, None) или (None, ответ с ошибкой)
+def read_batch(field):
+    if not request.is_json:
+        return None, (jsonify({'error': 'Content-Type должен быть application/json'}), 400)
+    body = request.get_json(silent=True)
+    items = body.get(field) if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        return None, (jsonify({'error': f'Поле {field} должно быть списком'}), 400)
+    if len(items) > max_batch_items:
+        return None, (jsonify({'error': f'Не больше {max_batch_items} элементов в одном запросе'}), 400)
+    return items, None
+
+
+# Маршрут для сохранения нескольких пар ключ-значение одним запросом
+# Ожидает JSON вида {"items": [{"key": ..., "value": ...}, ...]}
+@app.route('/mset', methods=['POST'])
+@set_limit  # Весь пакет считается одним вызовом /set
+@batch_items_limit
+def mset_values():
+    if replication_role == 'follower':
+        return read_only_error()
+    try:
+        items, error = read_batch('items')
+        if error:
+            return error
+
+        # Проверяем весь пакет до изменений, чтобы не сохранить его частично
+        records = []
+        for item in items:
+            if not isinstance(item, dict) or not item.get('key'):
+                return jsonify({'error': 'Каждый элемент должен содержать непустой ключ'}), 400
+            expire_at, ttl_error = parse_ttl(item.get('ttl'))
+            if ttl_error:
+                return jsonify({'error': ttl_error}), 400
+            records.append(set_record(item['key'], item.get('value'), expire_at))
+
+        # Изменения пакета сохраняются одной записью на диск в каждом затронутом шарде
+        engine.mset(records)
+
+        return jsonify({'results': [{'key': record['key'], 'saved': True} for record in records]}), 200
+    except ValueTooLarge as e:
+        # Пакет проверяется до изменений, поэтому не сохраняется ни одна пара
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        return jsonify({'error': f'Ошибка: {e}'}), 500
+
+
+# Маршрут для получения значений нескольких ключей одним запросом
+# Ожидает JSON вида {"keys": [...]}, для каждого ключа сообщает, найден ли он
+@app.route('/mget', methods=['POST'])
+@batch_items_limit
+def mget_values():
+    try:
+        keys, error = read_batch('keys')
+        if error:
+            return error
+
+        # Нестроковые ключи не могут храниться в хранилище и считаются отсутствующими
+        string_keys = [key for key in keys if isinstance(key, str)]
+        found_values = iter(engine.mget(string_keys))
+
+        results = []
+        for key in keys:
+            found, value = next(found_values) if isinstance(key, str) else (False, None)
+            if found:
+                results.append({'key': key, 'found': True, 'value': value})
+            else:
+                results.append({'key': key, 'found': False})
+
+        return jsonify({'results': results}), 200
+    except Exception as e:
+        return jsonify({'error': f'Ошибка при получении данных: {e}'}), 500
+
+
+# Маршрут для удаления нескольких ключей одним запросом
+# Ожидает JSON вида {"keys": [...]}, для каждого ключа сообщает, был ли он найден
+@app.route('/mdelete', methods=['DELETE'])
+@delete_limit  # Весь пакет считается одним вызовом /delete
+@batch_items_limit
+def mdelete_values():
+    if replication_role == 'follower':
+        return read_only_error()
+    try:
+        keys, error = read_batch('keys')
+        if error:
+            return error
+
+        # Удаления пакета сохраняются одной записью на диск в каждом затронутом шарде
+        # Повторный ключ в пакете считается уже отсутствующим
+        string_keys = [key for key in keys if isinstance(key, str)]
+        found_flags = iter(engine.mdelete(string_keys))
+
+        results = [{'key': key, 'found': isinstance(key, str) and next(found_flags)} for key in keys]
+
+        return jsonify({'results': results}), 200
+    except Exception as e:
+        return jsonify({'error': f'Ошибка при удалении: {e}'}), 500
+
+
+# Маршрут со статистикой хранилища: количество ключей, объем данных и удаление истекших ключей
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    try:
+        return jsonify(engine.get_stats()), 200
+    except Exception as e:
+        return jsonify({'error': f'Ошибка при получении статистики: {e}'}), 500
+
+
+# Маршрут состояния репликации: номер изменения, ведомые и их отставание
+@app.route('/replication', methods=['GET'])
+def get_replication():
+    if replication is None:
+        return jsonify({'role': 'standalone'}), 200
+    return jsonify(replication.status()), 200
+
+
+# Эндпоинт для проверки состояния сервера (его опрашивает балансировщик из lab-6)
+@app.route('/health')
+@limiter.exempt
+def health():
+    return jsonify({
+        "status": "ОК",
+        "role": replication_role or 'standalone'
+    })
+
+
 if __name__ == '__main__':
-    # Запускаем в режиме отладки
-    app.run(debug=True)
\ No newline at end of file
+    # Порт можно передать аргументом, чтобы запустить на одной машине primary и ведомых
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    start_replication()
+    # Запускаем в режиме отладки без перезагрузчика: он запускает второй процесс, который тоже
+    # импортирует этот модуль, открывает те же файлы хранилища со своей фоновой очисткой TTL
+    # и дописывает в тот же журнал, а при репликации еще и занимает тот же сокет
+    app.run(port=port, debug=True, use_reloader=False)
\ No newline at end of file
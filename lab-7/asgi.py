@@ -0,0 +1,364 @@
+import asyncio
+import json
+import sys
+
+# Быстрый кодировщик JSON, если установлен, иначе стандартный модуль json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from app import (batch_item_limit, default_limit, engine, max_batch_items, mutation_limit, parse_ttl,
+                 rate_limit_enabled, replication, replication_role, start_replication)
+from engine import ValueTooLarge, set_record
+from ratelimit import RateLimiter, parse_limit
+
+# Асинхронный (ASGI) режим того же API хранилища
+# Запуск: python asgi.py [порт] или uvicorn asgi:app --port 5000
+#
+# Маршруты, ответы и ограничения запросов те же, что в app.py, и хранилище то же (engine из app.py)
+# Отличия:
+# - запросы обслуживает один цикл событий asyncio без WSGI и Flask
+# - сохранения на диск запрос ждет, не блокируя цикл:
+#   групповой коммит сообщает о сохранении пакета через add_done_callback билета
+# - чтение и изменение идут в пуле потоков (asyncio.to_thread): они берут блокировки шардов, а шард
+#   может быть занят, например, вытеснением или копированием изменений для снимка, и цикл не должен этого ждать
+# - ограничения запросов проверяет RateLimiter внутри процесса по правилам flask_limiter
+
+# Ограничитель запросов с теми же ограничениями, что у flask_limiter в app.py
+limiter = RateLimiter(enabled=rate_limit_enabled)
+default_rate = parse_limit(default_limit)
+mutation_rate = parse_limit(mutation_limit)
+batch_items_rate = parse_limit(batch_item_limit)
+
+
+def dumps(obj):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson не кодирует целые числа длиннее 64 бит, их кодирует стандартный json
+            pass
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+# Разобранный HTTP-запрос
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        # Клиент определяется по IP-адресу, как get_remote_address во flask_limiter
+        self.client = scope['client'][0] if scope.get('client') else '127.0.0.1'
+        self.headers = dict(scope['headers'])
+        self.body = body
+        self.key = None
+        self.parsed = False
+        self.json = None
+
+    # Тип содержимого application/json (или +json), как request.is_json во Flask
+    def is_json(self):
+        mimetype = self.headers.get(b'content-type', b'').split(b';')[0].strip().lower()
+        return mimetype == b'application/json' or mimetype.endswith(b'+json')
+
+    # Тело запроса в JSON или None, если его не удалось разобрать
+    def get_json(self):
+        if not self.parsed:
+            self.parsed = True
+            try:
+                self.json = loads(self.body)
+            except ValueError:
+                self.json = None
+        return self.json
+
+
+def error(message, status):
+    return {'error': message}, status
+
+
+# Ответ на попытку изменить данные на ведомом экземпляре
+def read_only_error():
+    return error('Экземпляр работает только на чтение (follower)', 403)
+
+
+# Количество элементов в теле пакетного запроса (стоимость запроса для ограничения по элементам)
+def batch_items_count(request):
+    body = request.get_json()
+    if not isinstance(body, dict):
+        return 1
+    items = body.get('items', body.get('keys'))
+    if not isinstance(items, list):
+        return 1
+    return max(len(items), 1)
+
+
+# Достает из JSON тела пакетного запроса список по имени поля
+# Возвращает (список, None) или (None, ответ с ошибкой)
+def read_batch(request, field):
+    if not request.is_json():
+        return None, error('Content-Type должен быть application/json', 400)
+    body = request.get_json()
+    items = body.get(field) if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        return None, error(f'Поле {field} должно быть списком', 400)
+    if len(items) > max_batch_items:
+        return None, error(f'Не больше {max_batch_items} элементов в одном запросе', 400)
+    return items, None
+
+
+# Помечает future выполненным (вызывается в цикле событий)
+def resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+# Ждет, пока изменения окажутся на диске, не блокируя цикл событий
+async def wait_saved(tickets):
+    loop = asyncio.get_running_loop()
+    for ticket in tickets:
+        if ticket is None:
+            continue
+        future = loop.create_future()
+        # Поток-писатель будит цикл событий после сохранения пакета
+        ticket.add_done_callback(lambda _, future=future: loop.call_soon_threadsafe(resolve, future))
+        await future
+        if ticket.error is not None:
+            raise ticket.error
+
+
+# Сохраняет записи set_record и ждет их сохранения
+async def save_records(records):
+    if engine.shards[0].group_commit:
+        # Изменения применяются в потоке, а сохранения пакета ждем в цикле событий
+        await wait_saved(await asyncio.to_thread(engine.mset_nowait, records))
+    else:
+        # Без группового коммита запись на диск идет прямо в вызове, поэтому выносим ее в поток
+        await asyncio.to_thread(engine.mset, records)
+
+
+# Удаляет ключи и ждет сохранения, возвращает флаги "ключ был найден"
+async def delete_keys(keys):
+    if engine.shards[0].group_commit:
+        results, tickets = await asyncio.to_thread(engine.mdelete_nowait, keys)
+        await wait_saved(tickets)
+        return results
+    return await asyncio.to_thread(engine.mdelete, keys)
+
+
+# Сохранение ключа и значения (POST /set)
+async def set_value(request):
+    if replication_role == 'follower':
+        return read_only_error()
+    if not request.is_json():
+        return error('Content-Type должен быть application/json', 400)
+    body = request.get_json()
+    if not isinstance(body, dict):
+        return error('Тело запроса должно быть JSON-объектом', 400)
+
+    key = body.get('key')
+    expire_at, ttl_error = parse_ttl(body.get('ttl'))
+    if not key:
+        return error('Ключ является обязательным полем', 400)
+    if ttl_error:
+        return error(ttl_error, 400)
+
+    # Ответ возвращается только после того, как изменение сохранено на диск
+    await save_records([set_record(key, body.get('value'), expire_at)])
+    return {'message': 'Данные успешно сохранены'}, 200
+
+
+# Получение значения по ключу (GET /get/<key>)
+async def get_value(request):
+    found, value = await asyncio.to_thread(engine.get, request.key)
+    if not found:
+        return error('Ключ не найден', 404)
+    return {'value': value}, 200
+
+
+# Удаление ключа (DELETE /delete/<key>)
+async def delete_value(request):
+    if replication_role == 'follower':
+        return read_only_error()
+    results = await delete_keys([request.key])
+    if not results[0]:
+        return error('Ключ не найден', 404)
+    return {'message': 'Ключ успешно удален'}, 200
+
+
+# Проверка существования ключа (GET /exists/<key>)
+async def check_exists(request):
+    return {'exists': await asyncio.to_thread(engine.exists, request.key)}, 200
+
+
+# Сохранение нескольких пар ключ-значение (POST /mset)
+async def mset_values(request):
+    if replication_role == 'follower':
+        return read_only_error()
+    items, batch_error = read_batch(request, 'items')
+    if batch_error:
+        return batch_error
+
+    # Проверяем весь пакет до изменений, чтобы не сохранить его частично
+    records = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get('key'):
+            return error('Каждый элемент должен содержать непустой ключ', 400)
+        expire_at, ttl_error = parse_ttl(item.get('ttl'))
+        if ttl_error:
+            return error(ttl_error, 400)
+        records.append(set_record(item['key'], item.get('value'), expire_at))
+
+    await save_records(records)
+    return {'results': [{'key': record['key'], 'saved': True} for record in records]}, 200
+
+
+# Получение значений нескольких ключей (POST /mget)
+async def mget_values(request):
+    keys, batch_error = read_batch(request, 'keys')
+    if batch_error:
+        return batch_error
+
+    # Нестроковые ключи не могут храниться в хранилище и считаются отсутствующими
+    found_values = iter(await asyncio.to_thread(engine.mget, [key for key in keys if isinstance(key, str)]))
+    results = []
+    for key in keys:
+        found, value = next(found_values) if isinstance(key, str) else (False, None)
+        if found:
+            results.append({'key': key, 'found': True, 'value': value})
+        else:
+            results.append({'key': key, 'found': False})
+    return {'results': results}, 200
+
+
+# Удаление нескольких ключей (DELETE /mdelete)
+async def mdelete_values(request):
+    if replication_role == 'follower':
+        return read_only_error()
+    keys, batch_error = read_batch(request, 'keys')
+    if batch_error:
+        return batch_error
+
+    found_flags = iter(await delete_keys([key for key in keys if isinstance(key, str)]))
+    return {'results': [{'key': key, 'found': isinstance(key, str) and next(found_flags)} for key in keys]}, 200
+
+
+async def get_stats(request):
+    return await asyncio.to_thread(engine.get_stats), 200
+
+
+async def get_replication(request):
+    if replication is None:
+        return {'role': 'standalone'}, 200
+    return replication.status(), 200
+
+
+async def health(request):
+    return {'status': 'ОК', 'role': replication_role or 'standalone'}, 200
+
+
+# Маршруты: путь -> (метод, обработчик, ограничения)
+# Ограничение - (область, ограничение, считать ли стоимость по элементам пакета)
+# Как во flask_limiter: общее ограничение действует на каждый маршрут отдельно (область - имя маршрута),
+# изменения делят общие области 'set' и 'delete', а пакетные маршруты - область 'batch_items'
+ROUTES = {
+    '/set': ('POST', set_value, [('set', mutation_rate, False)]),
+    '/mset': ('POST', mset_values, [('set', mutation_rate, False), ('batch_items', batch_items_rate, True)]),
+    '/mget': ('POST', mget_values, [('mget_values', default_rate, False), ('batch_items', batch_items_rate, True)]),
+    '/mdelete': ('DELETE', mdelete_values, [('delete', mutation_rate, False), ('batch_items', batch_items_rate, True)]),
+    '/stats': ('GET', get_stats, [('get_stats', default_rate, False)]),
+    '/replication': ('GET', get_replication, [('get_replication', default_rate, False)]),
+    '/health': ('GET', health, []),
+}
+# Маршруты с ключом в пути: /get/<key>
+KEY_ROUTES = {
+    'get': ('GET', get_value, [('get_value', default_rate, False)]),
+    'delete': ('DELETE', delete_value, [('delete', mutation_rate, False)]),
+    'exists': ('GET', check_exists, [('check_exists', default_rate, False)]),
+}
+
+
+# Находит маршрут запроса и вызывает обработчик, возвращает (ответ, статус)
+async def dispatch(request):
+    route = ROUTES.get(request.path)
+    if route is None:
+        # Ключ в пути не может быть пустым и содержать '/', как <key> во Flask
+        parts = request.path.split('/')
+        if len(parts) == 3 and parts[2]:
+            route = KEY_ROUTES.get(parts[1])
+            request.key = parts[2]
+    if route is None:
+        return error('Маршрут не найден', 404)
+
+    method, handler, limits = route
+    if request.method != method:
+        return error('Метод не поддерживается', 405)
+
+    exceeded = limiter.hit(request.client, [
+        (scope, rate, batch_items_count(request) if by_items else 1)
+        for scope, rate, by_items in limits
+    ])
+    if exceeded is not None:
+        return error(f'Слишком много запросов: {exceeded}', 429)
+
+    try:
+        return await handler(request)
+    except ValueTooLarge as e:
+        return error(str(e), 413)
+    except Exception as e:
+        return error(f'Ошибка: {e}', 500)
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+# Запуск и остановка приложения: репликация запускается в процессе, который обслуживает запросы
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_replication()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# ASGI-приложение
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    request = Request(scope, await read_body(receive))
+    payload, status = await dispatch(request)
+    body = dumps(payload)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+if __name__ == '__main__':
+    # Сервер ASGI нужен только для запуска, само приложение от него не зависит
+    import uvicorn
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    uvicorn.run(app, host='127.0.0.1', port=port)
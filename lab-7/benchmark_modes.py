@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Сравнение задержек (p50/p99) и запросов в секунду для двух режимов сервера:
+# - flask: python app.py (Flask, отладочный сервер, как запускается сейчас)
+# - asgi: python asgi.py (asyncio + uvicorn, тот же API)
+#
+# Каждый режим запускается отдельным процессом со своей временной папкой данных,
+# клиенты держат постоянные соединения (keep-alive) и отправляют запросы друг за другом.
+# Ограничения запросов остаются включенными, но с огромными лимитами, чтобы учесть их стоимость.
+# Ключи выбираются генератором с фиксированным seed, поэтому нагрузка повторяется от запуска к запуску.
+#
+# Запуск: python benchmark_modes.py [секунд на замер] [количество ключей в хранилище]
+
+# Количество параллельных клиентов
+CLIENTS = [1, 16, 64]
+
+# Сценарии: название -> доля запросов /set (остальные - /get)
+SCENARIOS = {
+    "get": 0.0,
+    "set": 1.0,
+    "mixed": 0.1,
+}
+
+# Режимы: название -> скрипт сервера
+MODES = {
+    "flask": "app.py",
+    "asgi": "asgi.py",
+}
+
+PORT = 5310
+# Ограничение, которое не сработает за время замера
+UNLIMITED = "1000000000 per day"
+
+
+# Запускает сервер в отдельном процессе и ждет, пока он ответит на /health
+def start_server(script, data_dir):
+    env = dict(
+        os.environ,
+        KV_DATA_DIR=data_dir,
+        KV_DEFAULT_LIMIT=UNLIMITED,
+        KV_MUTATION_LIMIT=UNLIMITED,
+        KV_BATCH_ITEM_LIMIT=UNLIMITED,
+    )
+    # Своя группа процессов: отладочный сервер Flask запускает дочерний процесс перезагрузчика
+    process = subprocess.Popen(
+        [sys.executable, script, str(PORT)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{PORT}/health", timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.1)
+    stop_server(process)
+    raise RuntimeError(f"Сервер {script} не запустился")
+
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait()
+
+
+# Заполняет хранилище ключами через /mset
+def preload(keys):
+    for start in range(0, keys, 1000):
+        items = [{"key": f"key-{i}", "value": "x" * 32} for i in range(start, min(start + 1000, keys))]
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{PORT}/mset",
+            data=json.dumps({"items": items}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request).read()
+
+
+# Отправляет один запрос HTTP/1.1 по открытому соединению
+# Возвращает (код ответа, закрыл ли сервер соединение)
+async def send_request(reader, writer, method, path, body=None):
+    head = f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+    if body is not None:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    writer.write(head.encode() + b"\r\n" + (body or b""))
+
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    close = status_line.startswith(b"HTTP/1.0")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection":
+            close = value.strip().lower() == b"close"
+    await reader.readexactly(length)
+    return status, close
+
+
+# Один клиент: отправляет запросы до истечения времени и записывает задержку каждого
+async def client(rng, keys, write_ratio, deadline, latencies):
+    connection = None
+    while time.monotonic() < deadline:
+        if connection is None:
+            connection = await asyncio.open_connection("127.0.0.1", PORT)
+        key = f"key-{rng.randrange(keys)}"
+        if rng.random() < write_ratio:
+            request = ("POST", "/set", json.dumps({"key": key, "value": "y" * 32}).encode())
+        else:
+            request = ("GET", f"/get/{key}", None)
+
+        started = time.perf_counter()
+        status, close = await send_request(*connection, *request)
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            raise RuntimeError(f"Неожиданный ответ {status} на {request[0]} {request[1]}")
+        if close:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def measure(clients, keys, write_ratio, seconds):
+    latencies = []
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*(
+        client(random.Random(i), keys, write_ratio, deadline, latencies) for i in range(clients)
+    ))
+    latencies.sort()
+    return (
+        len(latencies) / seconds,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+    )
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    keys = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    print(f"Ключей в хранилище: {keys}, секунд на замер: {seconds}")
+    print(f"{'режим':<7}{'сценарий':<10}{'клиенты':>8}{'запросов/с':>12}{'p50, мс':>10}{'p99, мс':>10}")
+    for mode, script in MODES.items():
+        process = start_server(script, tempfile.mkdtemp(prefix="kv-bench-"))
+        try:
+            preload(keys)
+            for scenario, write_ratio in SCENARIOS.items():
+                for clients in CLIENTS:
+                    # Короткий прогрев, чтобы соединения и кэши не попали в замер
+                    asyncio.run(measure(clients, keys, write_ratio, 0.3))
+                    rps, p50, p99 = asyncio.run(measure(clients, keys, write_ratio, seconds))
+                    print(f"{mode:<7}{scenario:<10}{clients:>8}{rps:>12.0f}{p50:>10.2f}{p99:>10.2f}", flush=True)
+        finally:
+            stop_server(process)
+
+
+if __name__ == "__main__":
+    main()
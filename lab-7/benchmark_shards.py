@@ -0,0 +1,81 @@
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Модуль engine лежит рядом со скриптом
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engine import ShardedEngine, set_record  # noqa: E402
+
+# Масштабирование хранилища по количеству шардов
+# Несколько потоков одновременно читают и пишут ключи напрямую через движок (без Flask),
+# для каждого количества шардов печатается число операций в секунду
+#
+# Запуск: python benchmark_shards.py [потоков] [секунд на замер] [доля записей]
+
+# Количество шардов для сравнения
+SHARD_COUNTS = [1, 2, 4, 8, 16]
+# Количество ключей, с которыми работают потоки
+KEYS = 10000
+# Режимы сохранения: с групповым коммитом запись ждет диск вне блокировки шарда,
+# без него fsync выполняется под блокировкой, и один шард сериализует все записи
+MODES = [("групповой коммит", True), ("запись под блокировкой", False)]
+
+
+# Один поток: случайные чтения и записи до истечения времени
+def worker(engine, seed, write_ratio, deadline, counts, index):
+    rng = random.Random(seed)
+    done = 0
+    while time.monotonic() < deadline:
+        key = f"key-{rng.randrange(KEYS)}"
+        if rng.random() < write_ratio:
+            engine.set(key, done)
+        else:
+            engine.get(key)
+        done += 1
+    counts[index] = done
+
+
+def run(shard_count, group_commit, threads, seconds, write_ratio):
+    # Каждый замер в своей временной папке, чтобы файлы шардов не смешивались;
+    # папка удаляется после замера вместе с файлами
+    with tempfile.TemporaryDirectory(prefix="kv-shards-") as data_dir:
+        engine = ShardedEngine(shard_count=shard_count, data_dir=data_dir, group_commit=group_commit)
+        try:
+            engine.mset([set_record(f"key-{i}", i) for i in range(KEYS)])
+
+            counts = [0] * threads
+            deadline = time.monotonic() + seconds
+            workers = [
+                threading.Thread(target=worker, args=(engine, i, write_ratio, deadline, counts, i))
+                for i in range(threads)
+            ]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+        finally:
+            engine.close()
+    return sum(counts) / seconds
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    write_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+
+    print(f"Потоков: {threads}, секунд на замер: {seconds}, доля записей: {write_ratio}")
+    for name, group_commit in MODES:
+        print(f"\n{name}:")
+        baseline = None
+        for shard_count in SHARD_COUNTS:
+            ops = run(shard_count, group_commit, threads, seconds, write_ratio)
+            baseline = baseline or ops
+            print(f"шардов: {shard_count:>3}  {ops:>10.0f} оп/с  (x{ops / baseline:.2f})")
+
+
+if __name__ == "__main__":
+    main()
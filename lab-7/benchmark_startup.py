@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import time
+
+# Модуль engine лежит рядом со скриптом
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engine import Shard, shard_files  # noqa: E402
+from snapshot import convert_json  # noqa: E402
+from wal import atomic_write_json  # noqa: E402
+
+# Время запуска шарда (загрузка снимка) для снимков в JSON и в бинарном формате
+#
+# Запуск: python benchmark_startup.py [размеры через запятую]
+
+
+def measure(snapshot_format):
+    start = time.perf_counter()
+    shard = Shard(shard_files(0, 1, snapshot_format), snapshot_format=snapshot_format)
+    elapsed = time.perf_counter() - start
+    # Первое обращение к ключу в бинарном формате читает значение из файла
+    start = time.perf_counter()
+    shard.lookup("key-0")
+    lookup = time.perf_counter() - start
+    return elapsed, lookup
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10 ** 4, 10 ** 5, 10 ** 6]
+
+    print(f"{'ключей':>10} {'json':>12} {'binary':>12} {'первое чтение binary':>24}")
+    for size in sizes:
+        os.chdir(tempfile.mkdtemp(prefix="kv-startup-"))
+        atomic_write_json("data.json", {f"key-{i}": {"id": i, "name": "x" * 40} for i in range(size)})
+        convert_json("data.json", "data.snap")
+
+        json_time, _ = measure("json")
+        binary_time, lookup = measure("binary")
+        print(f"{size:>10} {json_time * 1000:>10.1f}мс {binary_time * 1000:>10.1f}мс {lookup * 1e6:>20.1f}мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Сравнение скорости записи (запросов /set в секунду) для разных способов сохранения:
+# - save_data: весь словарь перезаписывается после каждого запроса (исходное поведение)
+# - wal: каждый запрос дописывается в журнал и отдельно сбрасывается на диск
+# - group: запросы сохраняются в журнал общими пакетами (групповой коммит)
+#
+# Запуск: python benchmark_writes.py [количество ключей в хранилище] [секунд на замер]
+
+# Количество параллельных клиентов
+CLIENTS = [1, 8, 64]
+
+# Режимы: (название, KV_PERSISTENCE, KV_GROUP_COMMIT)
+MODES = [
+    ("save_data", "snapshot", "0"),
+    ("wal", "wal", "0"),
+    ("group", "wal", "1"),
+]
+
+
+# Загружает приложение с хранилищем в папке data_dir и нужными настройками
+def load_app(data_dir, persistence, group_commit, preload):
+    os.environ["KV_DATA_DIR"] = data_dir
+    os.environ["KV_PERSISTENCE"] = persistence
+    os.environ["KV_GROUP_COMMIT"] = group_commit
+    os.environ["KV_SHARDS"] = "1"
+
+    sys.modules.pop("app", None)
+    module = importlib.import_module("app")
+    from engine import set_record
+    # Ограничение запросов мешает замеру, отключаем его
+    module.limiter.enabled = False
+
+    # Заполняем хранилище, чтобы была видна зависимость от его размера
+    engine = module.engine
+    engine.mset([set_record(f"preload-{i}", "x" * 32) for i in range(preload)])
+    for shard in engine.shards:
+        shard.save_snapshot()
+    return module
+
+
+# Один клиент: отправляет запросы /set до истечения времени
+def client(module, client_id, deadline, counts):
+    test_client = module.app.test_client()
+    done = 0
+    while time.monotonic() < deadline:
+        response = test_client.post("/set", json={"key": f"c{client_id}-{done}", "value": done})
+        assert response.status_code == 200
+        done += 1
+    counts[client_id] = done
+
+
+def run(module, clients, seconds):
+    counts = [0] * clients
+    deadline = time.monotonic() + seconds
+    threads = [threading.Thread(target=client, args=(module, i, deadline, counts)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def main():
+    preload = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    # Модуль app лежит рядом со скриптом
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    print(f"Ключей в хранилище: {preload}, секунд на замер: {seconds}")
+    print(f"{'режим':<10}" + "".join(f"{f'{c} клиент(ов)':>16}" for c in CLIENTS))
+    for name, persistence, group_commit in MODES:
+        row = f"{name:<10}"
+        for clients in CLIENTS:
+            # Каждый замер в своей временной папке, которая удаляется вместе с файлами хранилища
+            with tempfile.TemporaryDirectory(prefix="kv-bench-") as data_dir:
+                module = load_app(data_dir, persistence, group_commit, preload)
+                try:
+                    row += f"{run(module, clients, seconds):>13.0f}/с "
+                finally:
+                    module.engine.close()
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,693 @@
+import json
+import os
+import threading
+import time
+import zlib
+from eviction import create_policy
+from expiry import ExpirationIndex
+from group_commit import GroupCommitter
+from snapshot import BinarySnapshot, merge_entries, write_snapshot
+from wal import WriteAheadLog, atomic_write_json, load_json
+
+
+# Приблизительный размер пары ключ-значение в байтах (по длине JSON)
+def item_size(key, value):
+    return len(key) + len(json.dumps(value, ensure_ascii=False))
+
+
+# Создает запись об изменении ключа, expire_at добавляется только для ключей с TTL
+def set_record(key, value, expire_at=None):
+    record = {'op': 'set', 'key': key, 'value': value}
+    if expire_at is not None:
+        record['expire_at'] = expire_at
+    return record
+
+
+# Значение не помещается в хранилище даже после вытеснения всех остальных ключей
+class ValueTooLarge(ValueError):
+    pass
+
+
+# Ждет, пока изменения окажутся на диске
+def wait_saved(ticket):
+    if ticket is not None:
+        ticket.wait()
+
+
+# Имена файлов шарда: (снимок, журнал, время истечения ключей)
+# Для одного шарда остаются прежние имена data.json, data.log и expires.json
+# В именах остальных раскладок есть общее число шардов, поэтому файлы разных раскладок
+# не пересекаются и смена количества шардов не затирает старые данные до конца переноса
+# В бинарном формате сроки жизни хранятся в самом снимке data.snap
+def shard_files(index, count, snapshot_format='json'):
+    suffix = '' if count == 1 else f'-{index}-of-{count}'
+    snapshot_extension = 'snap' if snapshot_format == 'binary' else 'json'
+    return f'data{suffix}.{snapshot_extension}', f'data{suffix}.log', f'expires{suffix}.json'
+
+
+# Доля общего ограничения для шарда index из count: ограничение делится нацело,
+# а остаток достается первым шардам, поэтому в сумме получается ровно total
+def split_limit(total, count, index):
+    return total // count + (1 if index < total % count else 0)
+
+
+# Сколько ключей бинарного снимка фоновый поток добавляет в политику вытеснения за один захват блокировки
+SEED_BATCH = 1000
+
+
+# Одна часть (шард) хранилища: свой словарь, своя блокировка и свои файлы
+class Shard:
+    def __init__(self, files, persistence_mode='wal', snapshot_format='json', group_commit=True,
+                 commit_batch=512, commit_delay=0.0, compact_every=10000, fsync=True,
+                 max_keys=0, max_bytes=0, eviction_policy='lru'):
+        self.file_name, self.log_file_name, self.expires_file_name = files
+        # 'wal' - журнал операций со снимками, 'snapshot' - перезапись снимка после каждого изменения
+        self.persistence_mode = persistence_mode
+        # 'json' - снимок в data.json читается целиком при запуске,
+        # 'binary' - бинарный снимок открывается через mmap, значения читаются по требованию
+        self.snapshot_format = snapshot_format
+        # Блокировка шарда: операции с разными шардами друг друга не ждут
+        # RLock, потому что сохранение без группового коммита вызывается уже под ней
+        self.lock = threading.RLock()
+        self.wal = WriteAheadLog(
+            self.log_file_name,
+            self.file_name,
+            self.expires_file_name,
+            compact_every=compact_every,
+            fsync=fsync
+        )
+        # Групповой коммит: у каждого шарда свой поток-писатель
+        self.group_commit = group_commit
+        self.committer = GroupCommitter(self.flush_changes, max_batch=commit_batch, max_delay=commit_delay)
+
+        # Ограничения размера шарда, 0 - без ограничения
+        self.max_keys = max_keys
+        self.max_bytes = max_bytes
+        # Без ограничения размера порядок обращений не отслеживается
+        self.eviction = create_policy(eviction_policy) if max_keys or max_bytes else None
+
+        # Статистика шарда
+        self.stats = {
+            # Приблизительный объем данных в байтах
+            'data_bytes': 0,
+            # Сколько ключей удалено при обращении к ним и фоновой очисткой
+            'expired_lazy': 0,
+            'expired_active': 0,
+            # Сколько байт освобождено удалением истекших ключей
+            'reclaimed_bytes': 0,
+            # Попадания и промахи при чтении ключей
+            'hits': 0,
+            'misses': 0,
+            # Сколько ключей и байт вытеснено при переполнении
+            'evictions': 0,
+            'evicted_bytes': 0,
+        }
+
+        # Бинарный снимок, поверх которого лежат изменения (только в формате 'binary')
+        self.base = None
+        # Ключи снимка, удаленные после его записи
+        self.deleted = set()
+        # Сколько ключей снимка перекрыто словарем data или удалено
+        self.base_shadowed = 0
+        # Ключи, измененные во время записи бинарного снимка (None - снимок не пишется)
+        self.snapshot_changes = None
+        # Номер следующего ключа бинарного снимка, который нужно добавить в политику вытеснения
+        # (None - все ключи снимка уже в ней)
+        self.seed_position = None
+        # В формате 'json' здесь все данные шарда, в формате 'binary' - только
+        # прочитанные из снимка или измененные после него значения
+        self.data = {}
+        self.expirations = ExpirationIndex()
+        self.load_data()
+        # Функция, которой передаются все изменения шарда (например, для репликации)
+        # Вызывается под блокировкой шарда, поэтому изменения одного ключа приходят по порядку
+        self.on_change = None
+
+        # Если ограничения уменьшились с прошлого запуска, сразу вытесняем лишние ключи
+        with self.lock:
+            evicted = self.evict_overflow()
+        if evicted:
+            self.flush_changes(evicted)
+        if self.seed_position is not None:
+            threading.Thread(target=self.seed_in_background, daemon=True).start()
+
+    # Загрузка данных шарда из файлов
+    def load_data(self):
+        if self.snapshot_format == 'binary':
+            # Открытие бинарного снимка не зависит от его размера: читаются заголовок
+            # и раздел сроков жизни, а журнал применяется поверх как обычные изменения
+            if os.path.exists(self.file_name):
+                self.base = BinarySnapshot(self.file_name)
+                self.stats['data_bytes'] = self.base.data_bytes
+                self.expirations = ExpirationIndex(self.base.expire_times())
+                # С ограничением размера политике вытеснения нужны все ключи снимка, иначе ключи,
+                # к которым не обращались, нельзя будет вытеснить. Чтобы запуск не зависел от
+                # размера снимка, они добавляются фоновым потоком (seed_in_background)
+                if self.eviction is not None and len(self.base):
+                    self.seed_position = 0
+            if self.persistence_mode == 'wal':
+                self.wal.recover(self.apply_record)
+            return
+
+        # В режиме журнала читаем снимок и применяем к нему журнал
+        if self.persistence_mode == 'wal':
+            self.data, expire_times = self.wal.load()
+        else:
+            self.data, expire_times = load_json(self.file_name), load_json(self.expires_file_name)
+        self.expirations = ExpirationIndex(expire_times)
+        self.stats['data_bytes'] = sum(item_size(key, value) for key, value in self.data.items())
+        if self.eviction is not None:
+            for key in self.data:
+                self.eviction.touch(key)
+
+    # Количество ключей в шарде
+    def key_count(self):
+        base_count = len(self.base) if self.base is not None else 0
+        return len(self.data) + base_count - self.base_shadowed
+
+    # Номер ключа в бинарном снимке, если ключ еще не перекрыт изменениями, иначе -1
+    def base_index(self, key):
+        if self.base is None or key in self.data or key in self.deleted:
+            return -1
+        return self.base.find(key)
+
+    # Приблизительный размер пары ключ-значение, 0 - если ключа нет
+    def present_size(self, key):
+        if key in self.data:
+            return item_size(key, self.data[key])
+        index = self.base_index(key)
+        return self.base.entry_size(index) if index >= 0 else 0
+
+    # Возвращает (найден ли ключ, значение)
+    # Значение из бинарного снимка разбирается при первом обращении и остается в словаре data
+    def lookup(self, key):
+        if key in self.data:
+            return True, self.data[key]
+        index = self.base_index(key)
+        if index < 0:
+            return False, None
+        value = json.loads(self.base.raw_value(index))
+        self.data[key] = value
+        self.base_shadowed += 1
+        return True, value
+
+    # Все ключи шарда
+    def keys(self):
+        if self.base is None:
+            return list(self.data)
+        return [key for key, _ in merge_entries(self.base, self.data, self.deleted)]
+
+    # Все пары (ключ, значение) шарда, значения из снимка разбираются по мере обхода
+    def items(self):
+        if self.base is None:
+            return list(self.data.items())
+        return [(key, json.loads(value_bytes))
+                for key, value_bytes in merge_entries(self.base, self.data, self.deleted)]
+
+    # Копия словаря и сроков жизни, снятая под блокировкой
+    def copy_data(self):
+        with self.lock:
+            return dict(self.items()), dict(self.expirations.expire_times)
+
+    # Сохраняет все данные шарда в снимок и очищает журнал
+    def save_snapshot(self):
+        if self.snapshot_format != 'binary':
+            data, expire_times = self.copy_data()
+            atomic_write_json(self.expires_file_name, expire_times)
+            atomic_write_json(self.file_name, data)
+            self.truncate_log()
+            return
+
+        # Под блокировкой шарда копируются только изменения поверх старого снимка,
+        # а сам снимок пишется без блокировки: значения старого снимка копируются байтами без разбора
+        with self.lock:
+            if self.snapshot_changes is not None:
+                # Снимок уже пишется, журнал свернется в следующий раз
+                return
+            # Номера ключей в новом снимке будут другими, поэтому оставшиеся ключи старого
+            # добавляются в политику вытеснения сейчас
+            if self.seed_position is not None:
+                self.seed_eviction(len(self.base))
+            base, data, deleted = self.base, dict(self.data), set(self.deleted)
+            expire_times = dict(self.expirations.expire_times)
+            self.snapshot_changes = set()
+        try:
+            write_snapshot(self.file_name, merge_entries(base, data, deleted), expire_times)
+        except BaseException:
+            with self.lock:
+                self.snapshot_changes = None
+            raise
+
+        with self.lock:
+            changed, self.snapshot_changes = self.snapshot_changes, None
+            if self.base is not None:
+                self.base.close()
+            self.base = BinarySnapshot(self.file_name)
+            # Остальные значения теперь в новом снимке, поверх него остаются только ключи,
+            # измененные за время записи
+            data = {key: self.data[key] for key in changed if key in self.data}
+            self.deleted = {key for key in changed if key not in data and self.base.find(key) >= 0}
+            self.data = data
+            self.base_shadowed = len(self.deleted) + sum(1 for key in data if self.base.find(key) >= 0)
+            self.truncate_log()
+            # Изменения за время записи могли попасть в журнал до его очистки, поэтому
+            # текущее состояние этих ключей записывается в журнал заново
+            if changed and self.persistence_mode == 'wal':
+                expire_times = self.expirations.expire_times
+                self.wal.append(*(
+                    set_record(key, data[key], expire_times.get(key)) if key in data
+                    else {'op': 'delete', 'key': key}
+                    for key in sorted(changed)
+                ))
+
+    # Добавляет в политику вытеснения следующие count ключей бинарного снимка как самые холодные
+    # Ключи, к которым уже обращались, в политике есть, а удаленные пропускаются
+    # Вызывается под блокировкой шарда, возвращает, остались ли еще ключи
+    def seed_eviction(self, count):
+        if self.seed_position is None:
+            return False
+        end = min(self.seed_position + count, len(self.base))
+        for index in range(self.seed_position, end):
+            key = self.base.key(index)
+            if key not in self.deleted:
+                self.eviction.add_cold(key)
+        self.seed_position = end if end < len(self.base) else None
+        return self.seed_position is not None
+
+    # Фоновое заполнение политики вытеснения ключами снимка, по SEED_BATCH ключей за захват блокировки
+    def seed_in_background(self):
+        while True:
+            with self.lock:
+                if not self.seed_eviction(SEED_BATCH):
+                    return
+
+    # Дожидается сохранения очереди группового коммита и закрывает файлы шарда
+    def close(self):
+        self.committer.close()
+        with self.lock:
+            self.seed_position = None
+            self.wal.close()
+            if self.base is not None:
+                self.base.close()
+                self.base = None
+
+    # Очищает журнал, когда все его записи попали в снимок
+    # Если сбой случится до очистки, при запуске журнал применится к снимку повторно
+    # и даст тот же результат
+    def truncate_log(self):
+        if self.persistence_mode == 'wal':
+            self.wal.truncate()
+
+    # Надежно сохраняет список изменений одной записью на диск
+    # record - запись вида {'op': 'set', 'key': ..., 'value': ...} или {'op': 'delete', 'key': ...}
+    def flush_changes(self, records):
+        if self.persistence_mode == 'wal':
+            # Дописываем изменения в конец журнала
+            self.wal.append(*records)
+            # Периодически сворачиваем журнал в снимок
+            if self.wal.needs_compaction(self.key_count()):
+                self.save_snapshot()
+        else:
+            self.save_snapshot()
+
+    # Применяет изменения к словарю и отправляет их на сохранение
+    # Вызывается под блокировкой шарда, чтобы порядок в журнале совпадал с порядком изменений
+    # Возвращает билет, который нужно дождаться уже после снятия блокировки
+    def apply_changes(self, records):
+        for record in records:
+            self.apply_record(record)
+        # Если шард переполнился, вытесненные ключи сохраняются в том же пакете
+        # Только что записанные ключи не вытесняются, пока есть другие
+        written = {record['key'] for record in records if record['op'] == 'set'}
+        records = records + self.evict_overflow(written)
+        if self.on_change is not None:
+            self.on_change(records)
+        if self.group_commit:
+            return self.committer.submit(records)
+        # Без группового коммита сохраняем сразу
+        self.flush_changes(records)
+        return None
+
+    # Применяет одно изменение к словарю, индексу сроков жизни и статистике
+    def apply_record(self, record):
+        key = record['key']
+        if self.snapshot_changes is not None:
+            self.snapshot_changes.add(key)
+        self.stats['data_bytes'] -= self.present_size(key)
+        # Ключ снимка впервые перекрывается изменением
+        in_base = self.base_index(key) >= 0
+        if in_base:
+            self.base_shadowed += 1
+
+        if record['op'] == 'set':
+            self.deleted.discard(key)
+            self.data[key] = record['value']
+            self.stats['data_bytes'] += item_size(key, record['value'])
+            # Запись без expire_at снимает прежний TTL
+            self.expirations.set(key, record.get('expire_at'))
+            if self.eviction is not None:
+                self.eviction.touch(key)
+        else:
+            self.data.pop(key, None)
+            # Удаленный ключ снимка запоминаем, чтобы не читать его из файла
+            if in_base or (self.base is not None and key not in self.deleted and self.base.find(key) >= 0):
+                self.deleted.add(key)
+            self.expirations.remove(key)
+            if self.eviction is not None:
+                self.eviction.remove(key)
+
+    # Превышен ли допустимый размер шарда
+    def over_capacity(self):
+        return ((self.max_keys and self.key_count() > self.max_keys)
+                or (self.max_bytes and self.stats['data_bytes'] > self.max_bytes))
+
+    # Вытесняет ключи по выбранной политике, пока шард не уложится в ограничения
+    # protected - ключи, которые вытесняются только если других не осталось
+    # (пакет записи больше, чем помещается в шард)
+    # Вызывается под блокировкой шарда, возвращает записи об удалении для журнала
+    def evict_overflow(self, protected=()):
+        records = []
+        if self.eviction is None:
+            return records
+        # Если ключи снимка еще не все в политике вытеснения, добавляем остальные сразу,
+        # чтобы вытеснялись самые холодные ключи, а не только те, к которым обращались
+        if self.seed_position is not None and self.over_capacity():
+            self.seed_eviction(len(self.base))
+        while self.over_capacity():
+            key = self.eviction.victim(protected)
+            if key is None and protected:
+                key = self.eviction.victim()
+            if key is None:
+                break
+            self.stats['evictions'] += 1
+            self.stats['evicted_bytes'] += self.present_size(key)
+            record = {'op': 'delete', 'key': key}
+            self.apply_record(record)
+            records.append(record)
+        return records
+
+    # Удаляет истекшие ключи (вызывается под блокировкой шарда)
+    # Удаление записывается в журнал, но запросы не ждут его сохранения
+    def expire_keys(self, keys, counter):
+        records = []
+        for key in keys:
+            size = self.present_size(key)
+            if key in self.data or self.base_index(key) >= 0:
+                self.stats['reclaimed_bytes'] += size
+                records.append({'op': 'delete', 'key': key})
+        self.stats[counter] += len(records)
+        if records:
+            self.apply_changes(records)
+
+    # Ленивое удаление: проверяет срок жизни ключа при обращении к нему (под блокировкой шарда)
+    def check_expired(self, key):
+        if self.expirations.is_expired(key, time.time()):
+            self.expire_keys([key], 'expired_lazy')
+
+    # Фоновая очистка: забирает из кучи только истекшие ключи, не обходя весь словарь
+    # Возвращает количество удаленных ключей
+    def sweep(self, limit):
+        with self.lock:
+            keys = self.expirations.pop_expired(time.time(), limit)
+            self.expire_keys(keys, 'expired_active')
+        return len(keys)
+
+    # Читает значение ключа с учетом срока жизни, статистики и политики вытеснения
+    # Вызывается под блокировкой шарда, возвращает (найден ли ключ, значение)
+    def read_key(self, key):
+        self.check_expired(key)
+        found, value = self.lookup(key)
+        if not found:
+            self.stats['misses'] += 1
+            return False, None
+        self.stats['hits'] += 1
+        if self.eviction is not None:
+            self.eviction.touch(key)
+        return True, value
+
+    # Есть ли ключ в шарде (вызывается под блокировкой шарда)
+    def contains(self, key):
+        self.check_expired(key)
+        return key in self.data or self.base_index(key) >= 0
+
+
+# Хранилище из N шардов: ключ попадает в шард по хешу
+# Каждый шард защищен своей блокировкой, поэтому чтение из одного шарда
+# не блокирует запись в другой
+class ShardedEngine:
+    def __init__(self, shard_count=1, data_dir='.', expire_interval=0.1, expire_batch=200,
+                 max_keys=0, max_bytes=0, **shard_options):
+        self.shard_count = shard_count
+        # Папка с файлами хранилища, у каждого экземпляра (например, ведомого) своя
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        # Раз в сколько секунд фоновая очистка ищет истекшие ключи
+        self.expire_interval = expire_interval
+        # Сколько ключей фоновая очистка удаляет за один захват блокировки шарда
+        self.expire_batch = expire_batch
+        # Общие ограничения размера делятся между шардами (split_limit), в сумме не больше заданных
+        # Ограничение 0 у шарда означало бы "без ограничения", поэтому шардов не может быть больше,
+        # чем ключей или байт в ограничении
+        for name, limit in (('KV_MAX_KEYS', max_keys), ('KV_MAX_BYTES', max_bytes)):
+            if 0 < limit < shard_count:
+                raise ValueError(f'{name}={limit} меньше количества шардов ({shard_count})')
+        self.max_keys = max_keys
+        self.max_bytes = max_bytes
+        self.shard_options = shard_options
+
+        # Количество шардов, с которым данные сохранялись в прошлый раз
+        self.meta_file_name = os.path.join(data_dir, 'shards.json')
+        stored_count = load_json(self.meta_file_name).get('shards', 1)
+        if stored_count != shard_count:
+            # Файлы новой раскладки могли остаться от прерванного переноса: пока shards.json
+            # указывает на старую раскладку, они не считаются данными и строятся заново
+            self.remove_layout_files(shard_count)
+        self.shards = [self.create_shard(i, shard_count) for i in range(shard_count)]
+        if stored_count != shard_count:
+            self.reshard(stored_count)
+
+        # Поток фоновой очистки, запускается при появлении первого ключа с TTL
+        self.sweeper_thread = None
+        self.sweeper_lock = threading.Lock()
+        # Останавливает фоновую очистку при закрытии хранилища
+        self.stopped = threading.Event()
+        if any(len(shard.expirations) for shard in self.shards):
+            self.start_sweeper()
+
+    def create_shard(self, index, count, **options):
+        limits = {
+            'max_keys': split_limit(self.max_keys, self.shard_count, index),
+            'max_bytes': split_limit(self.max_bytes, self.shard_count, index),
+        }
+        options = dict(self.shard_options, **dict(limits, **options))
+        files = shard_files(index, count, options.get('snapshot_format', 'json'))
+        return Shard([os.path.join(self.data_dir, name) for name in files], **options)
+
+    # Удаляет файлы раскладки из count шардов в обоих форматах снимка
+    def remove_layout_files(self, count):
+        for index in range(count):
+            for snapshot_format in ('json', 'binary'):
+                for name in shard_files(index, count, snapshot_format):
+                    path = os.path.join(self.data_dir, name)
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    # Переносит данные из раскладки с другим количеством шардов
+    # Запись shards.json - момент переключения: до нее действует старая раскладка,
+    # а недописанные файлы новой удаляются при следующем запуске
+    def reshard(self, stored_count):
+        # Старые шарды читаем без ограничений размера, вытеснение делают уже новые
+        old_shards = [self.create_shard(i, stored_count, max_keys=0, max_bytes=0) for i in range(stored_count)]
+        for old_shard in old_shards:
+            for key, value in old_shard.items():
+                record = set_record(key, value, old_shard.expirations.expire_times.get(key))
+                self.shard_for(key).apply_record(record)
+
+        # Сначала надежно записываем новую раскладку и только потом переключаемся на нее
+        for shard in self.shards:
+            with shard.lock:
+                shard.evict_overflow()
+            shard.save_snapshot()
+        atomic_write_json(self.meta_file_name, {'shards': self.shard_count})
+
+        # Файлы старой раскладки больше не нужны
+        for old_shard in old_shards:
+            old_shard.close()
+            for path in (old_shard.file_name, old_shard.log_file_name, old_shard.expires_file_name):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # Шард, в котором хранится ключ
+    # crc32 вместо hash(), потому что hash() строк меняется между запусками Python
+    def shard_for(self, key):
+        return self.shards[zlib.crc32(key.encode('utf-8')) % self.shard_count]
+
+    # Раскладывает ключи по шардам, сохраняя их позиции в исходном списке
+    def group_by_shard(self, keys):
+        groups = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(self.shard_for(key), []).append((position, key))
+        return groups
+
+    def start_sweeper(self):
+        with self.sweeper_lock:
+            if self.sweeper_thread is None:
+                self.sweeper_thread = threading.Thread(target=self.sweep_expired, daemon=True)
+                self.sweeper_thread.start()
+
+    # Фоновая очистка истекших ключей: шарды обходятся по очереди,
+    # и за раз блокируется только один из них
+    def sweep_expired(self):
+        while not self.stopped.is_set():
+            busy = False
+            for shard in self.shards:
+                if shard.sweep(self.expire_batch) >= self.expire_batch:
+                    busy = True
+            # Если где-то удалили полный пакет, вероятно, истекших ключей еще много
+            if not busy:
+                self.stopped.wait(self.expire_interval)
+
+    # Останавливает фоновую очистку, сохраняет ожидающие изменения и закрывает файлы всех шардов
+    def close(self):
+        self.stopped.set()
+        with self.sweeper_lock:
+            sweeper = self.sweeper_thread
+        if sweeper is not None:
+            sweeper.join()
+        for shard in self.shards:
+            shard.close()
+
+    # Передает все будущие изменения во всех шардах функции listener
+    def set_change_listener(self, listener):
+        for shard in self.shards:
+            with shard.lock:
+                shard.on_change = listener
+
+    # Раскладывает записи изменений по шардам, сохраняя их порядок
+    def group_records(self, records):
+        groups = {}
+        for record in records:
+            groups.setdefault(self.shard_for(record['key']), []).append(record)
+        if any(record.get('expire_at') is not None for record in records):
+            self.start_sweeper()
+        return groups
+
+    # Применяет готовые записи изменений (например, полученные от primary)
+    # Изменения сохраняются на диск, но вызывающий не ждет этого
+    def apply_records(self, records):
+        for shard, shard_records in self.group_records(records).items():
+            with shard.lock:
+                shard.apply_changes(shard_records)
+
+    # Заменяет все содержимое хранилища записями set_record
+    def replace_all(self, records):
+        groups = self.group_records(records)
+        for shard in self.shards:
+            with shard.lock:
+                deletes = [{'op': 'delete', 'key': key} for key in shard.keys()]
+                shard.apply_changes(deletes + groups.get(shard, []))
+
+    # Возвращает (найден ли ключ, значение)
+    def get(self, key):
+        shard = self.shard_for(key)
+        with shard.lock:
+            return shard.read_key(key)
+
+    def exists(self, key):
+        shard = self.shard_for(key)
+        with shard.lock:
+            return shard.contains(key)
+
+    # Сохраняет значение и ждет, пока изменение окажется на диске
+    def set(self, key, value, expire_at=None):
+        self.mset([set_record(key, value, expire_at)])
+
+    # Удаляет ключ, возвращает False, если ключа не было
+    def delete(self, key):
+        return self.mdelete([key])[0]
+
+    # Проверяет, что каждая пара помещается в ограничение объема своего шарда
+    # Иначе запись вытеснила бы все ключи шарда и затем саму себя
+    def check_sizes(self, records):
+        for record in records:
+            limit = self.shard_for(record['key']).max_bytes
+            if limit and item_size(record['key'], record['value']) > limit:
+                raise ValueTooLarge(f"Пара с ключом {record['key']} больше допустимого объема шарда ({limit} байт)")
+
+    # Сохраняет несколько записей set_record: по одной записи на диск для каждого затронутого шарда
+    def mset(self, records):
+        # Отвечаем только после того, как все изменения сохранены
+        for ticket in self.mset_nowait(records):
+            wait_saved(ticket)
+
+    # Применяет записи set_record к памяти и возвращает билеты их сохранения, не дожидаясь диска
+    # Без группового коммита изменения сохраняются сразу, а билеты равны None
+    def mset_nowait(self, records):
+        self.check_sizes(records)
+        tickets = []
+        for shard, shard_records in self.group_records(records).items():
+            with shard.lock:
+                tickets.append(shard.apply_changes(shard_records))
+        return tickets
+
+    # Возвращает список пар (найден ли ключ, значение) в порядке ключей
+    def mget(self, keys):
+        results = [(False, None)] * len(keys)
+        for shard, entries in self.group_by_shard(keys).items():
+            with shard.lock:
+                for position, key in entries:
+                    results[position] = shard.read_key(key)
+        return results
+
+    # Удаляет ключи, возвращает список флагов "ключ был найден" в порядке ключей
+    # Повторный ключ в одном запросе считается уже отсутствующим
+    def mdelete(self, keys):
+        results, tickets = self.mdelete_nowait(keys)
+        for ticket in tickets:
+            wait_saved(ticket)
+        return results
+
+    # Удаляет ключи из памяти, возвращает (флаги "ключ был найден", билеты сохранения)
+    def mdelete_nowait(self, keys):
+        results = [False] * len(keys)
+        tickets = []
+        for shard, entries in self.group_by_shard(keys).items():
+            records = []
+            deleted = set()
+            with shard.lock:
+                for position, key in entries:
+                    if shard.contains(key) and key not in deleted:
+                        records.append({'op': 'delete', 'key': key})
+                        deleted.add(key)
+                        results[position] = True
+                if records:
+                    tickets.append(shard.apply_changes(records))
+        return results, tickets
+
+    # Суммарная статистика по всем шардам
+    def get_stats(self):
+        result = {
+            'shards': self.shard_count,
+            'keys': 0,
+            'keys_with_ttl': 0,
+            # Размер куч сроков жизни вместе с еще не удаленными устаревшими записями
+            'expiration_index_size': 0,
+            'keys_per_shard': [],
+            'materialized_keys': 0,
+        }
+        for shard in self.shards:
+            with shard.lock:
+                result['keys'] += shard.key_count()
+                result['keys_per_shard'].append(shard.key_count())
+                # Значения в памяти: в формате 'binary' только прочитанные и измененные
+                result['materialized_keys'] += len(shard.data)
+                result['keys_with_ttl'] += len(shard.expirations)
+                result['expiration_index_size'] += len(shard.expirations.heap)
+                for name, value in shard.stats.items():
+                    result[name] = result.get(name, 0) + value
+        result['expired_total'] = result['expired_lazy'] + result['expired_active']
+        eviction = self.shards[0].eviction
+        result['eviction_policy'] = eviction.name if eviction is not None else None
+        result['max_keys'] = self.max_keys
+        result['max_bytes'] = self.max_bytes
+        return result
@@ -0,0 +1,192 @@
+import random
+from collections import OrderedDict
+
+
+# Политики вытеснения ключей при переполнении хранилища
+# У всех политик одинаковый интерфейс, и каждая операция выполняется за O(1):
+# touch(key) - к ключу обратились (чтение или запись), новый ключ добавляется
+# add_cold(key) - добавляет ключ как самый холодный (первый кандидат на вытеснение), если его еще нет;
+# так в политику попадают ключи бинарного снимка, к которым после запуска не обращались
+# remove(key) - ключ удален из хранилища
+# victim(exclude) - ключ, который нужно вытеснить следующим, кроме ключей из exclude
+# exclude - ключи, которые только что записаны: иначе новый ключ в LFU (с наименьшей частотой)
+# вытеснялся бы той же записью. Перебор exclude добавляет к выбору не больше len(exclude) шагов
+
+
+# LRU: вытесняется ключ, к которому дольше всего не обращались
+class LRUPolicy:
+    name = 'lru'
+
+    def __init__(self):
+        # Ключи в порядке обращения: в начале самые старые
+        self.order = OrderedDict()
+
+    def touch(self, key):
+        if key in self.order:
+            self.order.move_to_end(key)
+        else:
+            self.order[key] = None
+
+    def add_cold(self, key):
+        if key not in self.order:
+            self.order[key] = None
+            self.order.move_to_end(key, last=False)
+
+    def remove(self, key):
+        self.order.pop(key, None)
+
+    def victim(self, exclude=()):
+        for key in self.order:
+            if key not in exclude:
+                return key
+        return None
+
+
+# Узел списка частот для LFU: все ключи с одинаковым числом обращений
+class FrequencyNode:
+    def __init__(self, frequency):
+        self.frequency = frequency
+        # Ключи узла в порядке добавления, поэтому при равной частоте вытесняется самый старый
+        self.keys = OrderedDict()
+        self.prev = None
+        self.next = None
+
+
+# LFU: вытесняется ключ с наименьшим числом обращений
+# Узлы частот связаны в список по возрастанию, поэтому минимальная частота всегда в начале
+class LFUPolicy:
+    name = 'lfu'
+
+    def __init__(self):
+        # Фиктивный узел - начало и конец кольцевого списка частот
+        self.head = FrequencyNode(0)
+        self.head.prev = self.head
+        self.head.next = self.head
+        # Узел, в котором сейчас находится каждый ключ
+        self.nodes = {}
+
+    # Вставляет новый узел с заданной частотой после узла prev
+    def insert_after(self, prev, frequency):
+        node = FrequencyNode(frequency)
+        node.prev = prev
+        node.next = prev.next
+        prev.next.prev = node
+        prev.next = node
+        return node
+
+    # Убирает узел из списка, если в нем не осталось ключей
+    @staticmethod
+    def unlink_if_empty(node):
+        if not node.keys:
+            node.prev.next = node.next
+            node.next.prev = node.prev
+
+    def touch(self, key):
+        node = self.nodes.get(key)
+        if node is None:
+            # Новый ключ получает частоту 1
+            prev, frequency = self.head, 1
+        else:
+            prev, frequency = node, node.frequency + 1
+
+        target = prev.next
+        if target is self.head or target.frequency != frequency:
+            target = self.insert_after(prev, frequency)
+        target.keys[key] = None
+        self.nodes[key] = target
+
+        if node is not None:
+            del node.keys[key]
+            self.unlink_if_empty(node)
+
+    def add_cold(self, key):
+        if key in self.nodes:
+            return
+        # Частота 1 - наименьшая, а в начале узла - самые старые ключи
+        target = self.head.next
+        if target is self.head or target.frequency != 1:
+            target = self.insert_after(self.head, 1)
+        target.keys[key] = None
+        target.keys.move_to_end(key, last=False)
+        self.nodes[key] = target
+
+    def remove(self, key):
+        node = self.nodes.pop(key, None)
+        if node is not None:
+            del node.keys[key]
+            self.unlink_if_empty(node)
+
+    def victim(self, exclude=()):
+        node = self.head.next
+        while node is not self.head:
+            for key in node.keys:
+                if key not in exclude:
+                    return key
+            node = node.next
+        return None
+
+
+# Приближенный LRU, как в Redis: из нескольких случайных ключей вытесняется самый давний
+# Не нужно поддерживать порядок всех ключей, только время последнего обращения
+class SampledLRUPolicy:
+    name = 'sample'
+
+    def __init__(self, samples=5):
+        # Сколько случайных ключей сравнивать при выборе
+        self.samples = samples
+        # Список ключей и позиция каждого ключа в нем для случайного выбора и удаления за O(1)
+        self.keys = []
+        self.positions = {}
+        # Логическое время последнего обращения к каждому ключу
+        self.last_access = {}
+        self.clock = 0
+
+    def touch(self, key):
+        self.clock += 1
+        if key not in self.positions:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+        self.last_access[key] = self.clock
+
+    def add_cold(self, key):
+        if key not in self.positions:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+            # Время 0 раньше любого обращения
+            self.last_access[key] = 0
+
+    def remove(self, key):
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        del self.last_access[key]
+        # Переносим последний ключ на место удаленного
+        last = self.keys.pop()
+        if last != key:
+            self.keys[position] = last
+            self.positions[last] = position
+
+    def victim(self, exclude=()):
+        if not self.keys:
+            return None
+        candidates = [key for key in (random.choice(self.keys) for _ in range(self.samples)) if key not in exclude]
+        if candidates:
+            return min(candidates, key=self.last_access.__getitem__)
+        # Все случайные ключи оказались исключенными: берем самый давний из остальных
+        others = [key for key in self.keys if key not in exclude]
+        return min(others, key=self.last_access.__getitem__) if others else None
+
+
+# Доступные политики вытеснения по названию
+POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+    'sample': SampledLRUPolicy,
+}
+
+
+# Создает политику вытеснения по названию
+def create_policy(name):
+    if name not in POLICIES:
+        raise ValueError(f'Неизвестная политика вытеснения: {name}')
+    return POLICIES[name]()
@@ -0,0 +1,58 @@
+import heapq
+
+
+# Индекс сроков жизни ключей
+# Хранит время истечения каждого ключа и кучу (heap) по этому времени,
+# поэтому найти истекшие ключи можно без обхода всего словаря
+class ExpirationIndex:
+    def __init__(self, expire_times=None):
+        # Время истечения (секунды эпохи) для каждого ключа с TTL
+        self.expire_times = dict(expire_times or {})
+        # Куча пар (время истечения, ключ)
+        # Устаревшие пары (ключ удален или получил новый срок) не удаляются сразу,
+        # а пропускаются, когда оказываются на вершине кучи
+        self.heap = [(expire_at, key) for key, expire_at in self.expire_times.items()]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.expire_times)
+
+    # Задает время истечения ключа, None снимает ограничение
+    def set(self, key, expire_at):
+        if expire_at is None:
+            self.remove(key)
+            return
+        self.expire_times[key] = expire_at
+        heapq.heappush(self.heap, (expire_at, key))
+        self.compact()
+
+    # Снимает ограничение срока жизни с ключа
+    def remove(self, key):
+        if self.expire_times.pop(key, None) is not None:
+            self.compact()
+
+    # Истек ли срок жизни ключа к моменту now
+    def is_expired(self, key, now):
+        expire_at = self.expire_times.get(key)
+        return expire_at is not None and expire_at <= now
+
+    # Возвращает до limit ключей, срок которых истек к моменту now
+    # Работа пропорциональна количеству истекших ключей, а не размеру словаря
+    def pop_expired(self, now, limit):
+        expired = []
+        while self.heap and len(expired) < limit:
+            expire_at, key = self.heap[0]
+            if expire_at > now:
+                break
+            heapq.heappop(self.heap)
+            # Пропускаем устаревшие пары
+            if self.expire_times.get(key) == expire_at:
+                del self.expire_times[key]
+                expired.append(key)
+        return expired
+
+    # Перестраивает кучу, если устаревших пар в ней стало больше, чем актуальных
+    def compact(self):
+        if len(self.heap) > 2 * len(self.expire_times) + 64:
+            self.heap = [(expire_at, key) for key, expire_at in self.expire_times.items()]
+            heapq.heapify(self.heap)
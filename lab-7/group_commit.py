@@ -0,0 +1,136 @@
+import threading
+import time
+
+
+# Билет одного изменения, по которому можно дождаться сохранения пакета с ним
+class CommitTicket:
+    def __init__(self):
+        self.event = threading.Event()
+        self.error = None
+        # Функции, которые нужно вызвать после сохранения (для асинхронного ожидания)
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    # Отмечает, что пакет сохранен (или сохранить его не удалось)
+    def done(self, error=None):
+        with self.lock:
+            self.error = error
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    # Вызывает callback(билет) в потоке-писателе после сохранения пакета,
+    # или сразу, если пакет уже сохранен
+    def add_done_callback(self, callback):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    # Блокирует поток, пока пакет не окажется на диске
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+
+
+# Групповой коммит: изменения из параллельных запросов собираются в очередь,
+# а один поток-писатель сохраняет их общим пакетом (одна запись и один fsync на пакет)
+class GroupCommitter:
+    def __init__(self, flush, max_batch=512, max_delay=0.0):
+        # Функция, которая надежно сохраняет список записей
+        self.flush = flush
+        # Максимальное количество записей в одном пакете
+        self.max_batch = max_batch
+        # Сколько секунд писатель ждет новых записей перед сохранением пакета
+        # При 0 пакет составляется из всего, что накопилось, пока шла прошлая запись
+        self.max_delay = max_delay
+        # Очередь ожидающих сохранения пар (записи, билет)
+        self.pending = []
+        self.pending_records = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        # Закрыт ли писатель: новые записи не принимаются, поток завершается, сохранив очередь
+        self.closed = False
+        # Статистика: сколько пакетов и записей сохранено
+        self.batches = 0
+        self.records = 0
+
+    # Ставит записи в очередь и возвращает билет для ожидания
+    def submit(self, records):
+        ticket = CommitTicket()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('Групповой коммит уже закрыт')
+            # Поток-писатель запускается при первом изменении
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.pending.append((records, ticket))
+            self.pending_records += len(records)
+            self.condition.notify()
+        return ticket
+
+    # Ставит записи в очередь и ждет, пока они будут сохранены
+    def commit(self, records):
+        self.submit(records).wait()
+
+    # Сохраняет оставшуюся очередь и завершает поток-писатель
+    def close(self):
+        with self.condition:
+            self.closed = True
+            thread = self.thread
+            self.condition.notify()
+        if thread is not None:
+            thread.join()
+
+    # Забирает из очереди очередной пакет, None - писатель закрыт и очередь пуста
+    def take_batch(self):
+        with self.condition:
+            while not self.pending:
+                if self.closed:
+                    return None
+                self.condition.wait()
+
+            # Ждем, пока пакет заполнится или истечет окно ожидания
+            if self.max_delay > 0 and not self.closed:
+                deadline = time.monotonic() + self.max_delay
+                while self.pending_records < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self.closed:
+                        break
+                    self.condition.wait(remaining)
+
+            # Берем записи, пока не превысим размер пакета (но хотя бы одно изменение)
+            count = 0
+            size = 0
+            for records, _ in self.pending:
+                if count and size + len(records) > self.max_batch:
+                    break
+                size += len(records)
+                count += 1
+            batch = self.pending[:count]
+            del self.pending[:count]
+            self.pending_records -= size
+            return batch
+
+    # Основной цикл потока-писателя
+    def run(self):
+        while True:
+            batch = self.take_batch()
+            if batch is None:
+                return
+            records = [record for entry, _ in batch for record in entry]
+            error = None
+            try:
+                self.flush(records)
+            except Exception as e:
+                error = e
+
+            self.batches += 1
+            self.records += len(records)
+            # Отвечаем всем запросам пакета только после сохранения
+            for _, ticket in batch:
+                ticket.done(error)
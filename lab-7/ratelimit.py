@@ -0,0 +1,79 @@
+import re
+import time
+
+# Ограничитель запросов внутри процесса для асинхронного режима (asgi.py)
+# Работает по тем же правилам, что flask_limiter со стратегией по умолчанию (fixed window):
+# окно начинается с первого запроса клиента и длится весь период ограничения,
+# а за окно разрешено не больше amount единиц (обычно запросов)
+
+# Длительность периодов в секундах
+PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+    'month': 30 * 86400,
+    'year': 365 * 86400,
+}
+
+# Запись ограничения: "100 per day", "10 per 2 minutes" или "10/minute"
+LIMIT_PATTERN = re.compile(r'^\s*(\d+)\s*(?:per|/)\s*(\d+)?\s*(second|minute|hour|day|month|year)s?\s*$')
+
+
+# Ограничение: amount единиц за period секунд
+class RateLimit:
+    def __init__(self, amount, period, text):
+        self.amount = amount
+        self.period = period
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+
+# Разбирает запись ограничения в том же формате, что и flask_limiter
+def parse_limit(text):
+    match = LIMIT_PATTERN.match(text.lower())
+    if not match:
+        raise ValueError(f'Неверная запись ограничения: {text}')
+    amount, multiplier, period = match.groups()
+    return RateLimit(int(amount), int(multiplier or 1) * PERIODS[period], text)
+
+
+class RateLimiter:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # Окна клиентов: (область, клиент) -> [время окончания окна, израсходовано единиц]
+        self.windows = {}
+        # Когда в следующий раз удалять закончившиеся окна
+        self.next_cleanup = 0.0
+
+    # Проверяет и расходует ограничения запроса
+    # limits - список троек (область, ограничение, стоимость запроса в единицах)
+    # Возвращает нарушенное ограничение или None, если запрос разрешен
+    # Единицы расходуются, только если разрешены все ограничения сразу
+    def hit(self, client, limits):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        if now >= self.next_cleanup:
+            self.cleanup(now)
+
+        windows = []
+        for scope, limit, cost in limits:
+            window = self.windows.get((scope, client))
+            if window is None or window[0] <= now:
+                window = [now + limit.period, 0]
+                self.windows[(scope, client)] = window
+            if window[1] + cost > limit.amount:
+                return limit
+            windows.append((window, cost))
+
+        for window, cost in windows:
+            window[1] += cost
+        return None
+
+    # Удаляет закончившиеся окна, чтобы память не росла с числом клиентов
+    def cleanup(self, now):
+        self.windows = {key: window for key, window in self.windows.items() if window[0] > now}
+        self.next_cleanup = now + 60
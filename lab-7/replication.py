@@ -0,0 +1,258 @@
+import json
+import socket
+import threading
+import time
+import uuid
+
+# Репликация хранилища между процессами на одной машине
+#
+# Основной экземпляр (primary) нумерует каждое изменение и рассылает поток изменений
+# по локальному TCP-сокету. Ведомые экземпляры (followers) подключаются, применяют
+# изменения к своей копии данных и обслуживают только чтение.
+#
+# Протокол - строки JSON:
+# follower -> primary: {"sync": последний примененный номер, "run_id": идентификатор primary}
+# primary -> follower:
+#   {"snapshot": номер, "run_id": ...} ... {"record": ...} ... {"snapshot_end": номер} - полная копия
+#   {"seq": номер, "time": время на primary, "record": {...}} - одно изменение
+#   {"heartbeat": последний номер, "time": время на primary} - если изменений нет
+
+# Раз в сколько секунд primary сообщает свой последний номер, если изменений нет
+HEARTBEAT_INTERVAL = 1.0
+# Через сколько секунд follower переподключается после обрыва связи
+RECONNECT_DELAY = 1.0
+
+
+# Отправляет сообщения строками JSON
+def send_messages(connection, messages):
+    payload = b''.join(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n' for message in messages)
+    connection.sendall(payload)
+
+
+# Основной экземпляр: нумерует изменения и рассылает их ведомым
+class ReplicationPrimary:
+    def __init__(self, engine, host='127.0.0.1', port=6001, backlog_size=100000):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        # Идентификатор запуска: после перезапуска primary нумерация начинается заново,
+        # и ведомые по смене идентификатора понимают, что нужна полная копия
+        self.run_id = uuid.uuid4().hex
+        # Номер последнего изменения
+        self.seq = 0
+        # Последние изменения для догоняющих ведомых: backlog[i] имеет номер backlog_start + i
+        self.backlog = []
+        self.backlog_start = 1
+        self.backlog_size = backlog_size
+        self.condition = threading.Condition()
+        # Подключенные ведомые: адрес -> номер последнего отправленного изменения
+        self.followers = {}
+        # Изменения каждого шарда передаются primary прямо под блокировкой шарда,
+        # поэтому порядок изменений одного ключа сохраняется
+        engine.set_change_listener(self.publish)
+
+    # Нумерует изменения и добавляет их в очередь рассылки
+    def publish(self, records):
+        now = time.time()
+        with self.condition:
+            for record in records:
+                self.seq += 1
+                self.backlog.append((self.seq, now, record))
+            # Старые изменения отбрасываем пачкой, чтобы не сдвигать список на каждой записи
+            overflow = len(self.backlog) - self.backlog_size
+            if overflow > self.backlog_size // 2:
+                del self.backlog[:overflow]
+                self.backlog_start += overflow
+            self.condition.notify_all()
+
+    def start(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen()
+        threading.Thread(target=self.accept_loop, args=(server,), daemon=True).start()
+
+    def accept_loop(self, server):
+        while True:
+            connection, address = server.accept()
+            threading.Thread(target=self.serve_follower, args=(connection, address), daemon=True).start()
+
+    # Полная копия данных и номер изменения, на котором она снята
+    # На время копирования блокируются все шарды, чтобы копия была согласованной
+    def take_snapshot(self):
+        shards = self.engine.shards
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            with self.condition:
+                seq = self.seq
+            records = []
+            for shard in shards:
+                expire_times = shard.expirations.expire_times
+                for key, value in shard.items():
+                    record = {'op': 'set', 'key': key, 'value': value}
+                    if key in expire_times:
+                        record['expire_at'] = expire_times[key]
+                    records.append(record)
+            return seq, records
+        finally:
+            for shard in shards:
+                shard.lock.release()
+
+    # Отправляет ведомому полную копию, возвращает ее номер
+    def send_snapshot(self, connection):
+        seq, records = self.take_snapshot()
+        send_messages(connection, [{'snapshot': seq, 'run_id': self.run_id}])
+        for start in range(0, len(records), 1000):
+            send_messages(connection, [{'record': record} for record in records[start:start + 1000]])
+        send_messages(connection, [{'snapshot_end': seq}])
+        return seq
+
+    # Изменения после номера position или None, если они уже вытеснены из очереди
+    def records_after(self, position):
+        if position + 1 < self.backlog_start:
+            return None
+        return self.backlog[position + 1 - self.backlog_start:]
+
+    def serve_follower(self, connection, address):
+        name = f'{address[0]}:{address[1]}'
+        try:
+            request = json.loads(connection.makefile('rb').readline())
+            position = request.get('sync', -1)
+            # Догоняем по очереди изменений, если ведомый отстал ненамного, иначе - полная копия
+            with self.condition:
+                can_continue = (request.get('run_id') == self.run_id and 0 <= position <= self.seq
+                                and self.records_after(position) is not None)
+            if not can_continue:
+                position = self.send_snapshot(connection)
+
+            while True:
+                with self.condition:
+                    self.followers[name] = position
+                    if self.seq == position:
+                        self.condition.wait(HEARTBEAT_INTERVAL)
+                    pending = self.records_after(position)
+                    seq = self.seq
+                if pending is None:
+                    # Ведомый отстал сильнее, чем хранит очередь
+                    position = self.send_snapshot(connection)
+                elif pending:
+                    send_messages(connection, [
+                        {'seq': number, 'time': created, 'record': record}
+                        for number, created, record in pending
+                    ])
+                    position = pending[-1][0]
+                else:
+                    send_messages(connection, [{'heartbeat': seq, 'time': time.time()}])
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.condition:
+                self.followers.pop(name, None)
+            connection.close()
+
+    # Состояние репликации для маршрута /replication
+    def status(self):
+        with self.condition:
+            return {
+                'role': 'primary',
+                'run_id': self.run_id,
+                'seq': self.seq,
+                'backlog_start': self.backlog_start,
+                'backlog_size': len(self.backlog),
+                'followers': [
+                    {'address': name, 'sent_seq': position, 'lag_records': self.seq - position}
+                    for name, position in self.followers.items()
+                ],
+            }
+
+
+# Ведомый экземпляр: получает поток изменений от primary и применяет его к своему хранилищу
+class ReplicationFollower:
+    def __init__(self, engine, host='127.0.0.1', port=6001):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        # Идентификатор primary и номер последнего примененного изменения
+        self.run_id = None
+        self.applied_seq = -1
+        # Последний известный номер изменения на primary
+        self.primary_seq = -1
+        # Время на primary для последнего примененного изменения
+        self.applied_time = None
+        self.last_message_time = None
+        # 'connecting', 'syncing' (получает полную копию) или 'streaming'
+        self.state = 'connecting'
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    # Подключается к primary и переподключается после обрыва,
+    # продолжая с последнего примененного номера
+    def run(self):
+        while True:
+            try:
+                with socket.create_connection((self.host, self.port)) as connection:
+                    send_messages(connection, [{'sync': self.applied_seq, 'run_id': self.run_id}])
+                    self.receive(connection.makefile('rb'))
+            except (OSError, ValueError):
+                pass
+            self.state = 'connecting'
+            time.sleep(RECONNECT_DELAY)
+
+    def receive(self, stream):
+        snapshot_records = None
+        for line in stream:
+            message = json.loads(line)
+            now = time.time()
+            with self.lock:
+                self.last_message_time = now
+
+            if 'snapshot' in message:
+                # Полная копия: старые данные заменяются целиком
+                self.state = 'syncing'
+                snapshot_records = []
+                with self.lock:
+                    self.run_id = message['run_id']
+            elif 'snapshot_end' in message:
+                self.engine.replace_all(snapshot_records)
+                snapshot_records = None
+                with self.lock:
+                    self.applied_seq = message['snapshot_end']
+                    self.primary_seq = max(self.primary_seq, self.applied_seq)
+                    self.applied_time = now
+                self.state = 'streaming'
+            elif snapshot_records is not None:
+                snapshot_records.append(message['record'])
+            elif 'seq' in message:
+                self.engine.apply_records([message['record']])
+                with self.lock:
+                    self.applied_seq = message['seq']
+                    self.primary_seq = max(self.primary_seq, message['seq'])
+                    self.applied_time = message['time']
+            elif 'heartbeat' in message:
+                with self.lock:
+                    self.primary_seq = max(self.primary_seq, message['heartbeat'])
+                    if self.applied_seq >= self.primary_seq:
+                        self.applied_time = message['time']
+        raise ValueError('Соединение с primary закрыто')
+
+    # Состояние репликации и отставание для маршрута /replication
+    def status(self):
+        now = time.time()
+        with self.lock:
+            lag_records = max(self.primary_seq - self.applied_seq, 0)
+            return {
+                'role': 'follower',
+                'primary': f'{self.host}:{self.port}',
+                'state': self.state,
+                'run_id': self.run_id,
+                'applied_seq': self.applied_seq,
+                'primary_seq': self.primary_seq,
+                # Отставание в изменениях и в секундах: сколько времени назад
+                # на primary было сделано последнее примененное изменение
+                'lag_records': lag_records,
+                'lag_seconds': (now - self.applied_time) if lag_records and self.applied_time else 0.0,
+                'last_message_age': (now - self.last_message_time) if self.last_message_time else None,
+            }
@@ -0,0 +1,184 @@
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+
+# Бинарный снимок хранилища с каталогом ключей
+#
+# Устройство файла (все числа little-endian):
+# [заголовок][значения в JSON][ключи в UTF-8][каталог][сроки жизни]
+# Каталог - записи фиксированного размера, отсортированные по ключу,
+# поэтому ключ ищется двоичным поиском прямо в отображенном в память файле,
+# а значение разбирается из JSON только при обращении к нему
+
+# Сигнатура формата
+MAGIC = b'KVSNAP01'
+# Заголовок: сигнатура, количество ключей, суммарный размер ключей и значений,
+# смещение ключей, смещение каталога, смещение сроков жизни, количество ключей с TTL
+HEADER = struct.Struct('<8sQQQQQQ')
+# Запись каталога: смещение и длина ключа, смещение и длина значения
+ENTRY = struct.Struct('<QIQI')
+# Запись срока жизни: номер ключа в каталоге и время истечения
+TTL_ENTRY = struct.Struct('<Qd')
+
+
+# Записывает снимок атомарно (временный файл, затем rename)
+# entries - пары (ключ, значение в виде байтов JSON), отсортированные по ключу
+# Порядок строк Python совпадает с порядком их байтов в UTF-8, поэтому сортировки по str достаточно
+def write_snapshot(path, entries, expire_times):
+    tmp_path = path + '.tmp'
+    keys_blob = bytearray()
+    directory = bytearray()
+    ttl_section = bytearray()
+    count = 0
+    data_bytes = 0
+
+    with open(tmp_path, 'wb') as file:
+        # Место под заголовок заполняется в конце, когда известны смещения
+        file.write(b'\0' * HEADER.size)
+        offset = HEADER.size
+        for key, value_bytes in entries:
+            key_bytes = key.encode('utf-8')
+            file.write(value_bytes)
+            directory += ENTRY.pack(len(keys_blob), len(key_bytes), offset, len(value_bytes))
+            keys_blob += key_bytes
+            if key in expire_times:
+                ttl_section += TTL_ENTRY.pack(count, expire_times[key])
+            offset += len(value_bytes)
+            data_bytes += len(key_bytes) + len(value_bytes)
+            count += 1
+
+        keys_offset = offset
+        directory_offset = keys_offset + len(keys_blob)
+        ttl_offset = directory_offset + len(directory)
+        file.write(keys_blob)
+        file.write(directory)
+        file.write(ttl_section)
+
+        file.seek(0)
+        file.write(HEADER.pack(
+            MAGIC, count, data_bytes, keys_offset, directory_offset, ttl_offset, len(ttl_section) // TTL_ENTRY.size
+        ))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+# Значение в виде байтов JSON для записи в снимок
+def encode_value(value):
+    return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+# Бинарный снимок, открытый через mmap
+# Открытие занимает постоянное время: читается только заголовок,
+# а ключи и значения берутся из файла по мере обращения к ним
+class BinarySnapshot:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.count, self.data_bytes, self.keys_offset,
+         self.directory_offset, self.ttl_offset, self.ttl_count) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{path} не является бинарным снимком хранилища')
+
+    def __len__(self):
+        return self.count
+
+    # Запись каталога с номером index: (смещение ключа, длина ключа, смещение значения, длина значения)
+    def entry(self, index):
+        return ENTRY.unpack_from(self.mm, self.directory_offset + index * ENTRY.size)
+
+    def key_bytes(self, index):
+        key_offset, key_length, _, _ = self.entry(index)
+        start = self.keys_offset + key_offset
+        return self.mm[start:start + key_length]
+
+    def key(self, index):
+        return self.key_bytes(index).decode('utf-8')
+
+    # Значение ключа с номером index в виде байтов JSON (без разбора)
+    def raw_value(self, index):
+        _, _, value_offset, value_length = self.entry(index)
+        return self.mm[value_offset:value_offset + value_length]
+
+    # Приблизительный размер пары ключ-значение, как в статистике хранилища
+    def entry_size(self, index):
+        _, key_length, _, value_length = self.entry(index)
+        return key_length + value_length
+
+    # Номер ключа в каталоге или -1, двоичный поиск за O(log n)
+    def find(self, key):
+        target = key.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.key_bytes(low) == target:
+            return low
+        return -1
+
+    # Возвращает (найден ли ключ, значение), значение разбирается из JSON только здесь
+    def get(self, key):
+        index = self.find(key)
+        if index < 0:
+            return False, None
+        return True, json.loads(self.raw_value(index))
+
+    # Время истечения ключей с TTL, читается только раздел сроков жизни
+    def expire_times(self):
+        result = {}
+        for i in range(self.ttl_count):
+            index, expire_at = TTL_ENTRY.unpack_from(self.mm, self.ttl_offset + i * TTL_ENTRY.size)
+            result[self.key(index)] = expire_at
+        return result
+
+    # Все пары (ключ, значение в байтах JSON) в порядке каталога
+    def raw_items(self):
+        for index in range(self.count):
+            yield self.key(index), self.raw_value(index)
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+# Объединяет бинарный снимок с изменениями поверх него в один отсортированный поток пар
+# data - измененные значения, deleted - удаленные ключи снимка
+def merge_entries(base, data, deleted):
+    overlay = ((key, encode_value(data[key])) for key in sorted(data))
+    if base is None:
+        return overlay
+    base_entries = (
+        (key, value_bytes) for key, value_bytes in base.raw_items()
+        if key not in data and key not in deleted
+    )
+    return heapq.merge(base_entries, overlay, key=lambda entry: entry[0])
+
+
+# Переводит снимок из data.json (и expires.json) в бинарный формат
+def convert_json(json_path, snapshot_path, expires_path=None):
+    with open(json_path, 'r') as file:
+        data = json.load(file)
+    expire_times = {}
+    if expires_path and os.path.exists(expires_path):
+        with open(expires_path, 'r') as file:
+            expire_times = json.load(file)
+    write_snapshot(snapshot_path, merge_entries(None, data, set()), expire_times)
+    return len(data)
+
+
+if __name__ == '__main__':
+    # Конвертер: python snapshot.py data.json data.snap [expires.json]
+    if len(sys.argv) not in (3, 4):
+        print("Используй команду: python snapshot.py <data.json> <data.snap> [expires.json]")
+        sys.exit(1)
+
+    converted = convert_json(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None)
+    print(f"Сконвертировано ключей: {converted}")
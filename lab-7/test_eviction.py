@@ -0,0 +1,93 @@
+import pytest
+from engine import ShardedEngine, ValueTooLarge
+from eviction import POLICIES, create_policy
+
+
+# Хранилище во временной папке без группового коммита и fsync, чтобы тесты шли быстро
+def create_engine(tmp_path, policy, **options):
+    return ShardedEngine(data_dir=str(tmp_path), eviction_policy=policy, group_commit=False, fsync=False,
+                         **options)
+
+
+# Только что записанный ключ остается в хранилище, вытесняется один из старых
+@pytest.mark.parametrize("policy", list(POLICIES))
+def test_new_key_survives_eviction(tmp_path, policy):
+    engine = create_engine(tmp_path, policy, max_keys=2)
+    engine.set('a', 1)
+    engine.set('b', 2)
+    for _ in range(3):
+        engine.get('a')
+        engine.get('b')
+    engine.set('c', 3)
+
+    assert engine.get('c') == (True, 3)
+    assert engine.get_stats()['keys'] == 2
+    assert engine.get_stats()['evictions'] == 1
+
+
+# Когда хранилище заполнено, каждый новый ключ все равно сохраняется
+@pytest.mark.parametrize("policy", list(POLICIES))
+def test_store_keeps_accepting_new_keys(tmp_path, policy):
+    engine = create_engine(tmp_path, policy, max_keys=3)
+    for i in range(10):
+        engine.set(f'key-{i}', i)
+        assert engine.get(f'key-{i}') == (True, i)
+    assert engine.get_stats()['keys'] == 3
+
+
+# Вытесняется ключ, выбранный политикой: для LRU - самый давний, для LFU - самый редкий
+@pytest.mark.parametrize("policy,evicted", [
+    ('lru', 'a'),   # к 'a' обращались раньше, чем к 'b'
+    ('lfu', 'b'),   # 'a' прочитан 3 раза, 'b' - 1 раз
+])
+def test_policy_picks_victim(tmp_path, policy, evicted):
+    engine = create_engine(tmp_path, policy, max_keys=2)
+    engine.set('a', 1)
+    engine.set('b', 2)
+    for _ in range(3):
+        engine.get('a')
+    engine.get('b')
+    engine.set('c', 3)
+
+    assert engine.exists(evicted) is False
+    assert engine.exists('c') is True
+
+
+# Значение больше ограничения объема отклоняется и не вытесняет остальные ключи
+@pytest.mark.parametrize("policy", list(POLICIES))
+def test_oversized_value_rejected(tmp_path, policy):
+    engine = create_engine(tmp_path, policy, max_bytes=100)
+    engine.set('a', 'x' * 10)
+    engine.set('b', 'y' * 10)
+    with pytest.raises(ValueTooLarge):
+        engine.set('big', 'z' * 200)
+
+    assert engine.exists('big') is False
+    assert engine.get('a') == (True, 'x' * 10)
+    assert engine.get('b') == (True, 'y' * 10)
+    assert engine.get_stats()['evictions'] == 0
+
+
+# Исключенные ключи не выбираются, пока есть другие
+@pytest.mark.parametrize("policy", list(POLICIES))
+def test_victim_skips_excluded(policy):
+    eviction = create_policy(policy)
+    for key in ('a', 'b', 'c'):
+        eviction.touch(key)
+    assert eviction.victim({'a', 'b'}) == 'c'
+    assert eviction.victim({'a', 'b', 'c'}) is None
+    eviction.remove('c')
+    assert eviction.victim({'a'}) == 'b'
+
+
+# Холодные ключи вытесняются раньше ключей, к которым обращались, а известные ключи не меняют места
+@pytest.mark.parametrize("policy", ['lru', 'lfu'])
+def test_add_cold_key_is_next_victim(policy):
+    eviction = create_policy(policy)
+    eviction.touch('a')
+    eviction.touch('b')
+    eviction.add_cold('c')
+    assert eviction.victim() == 'c'
+    eviction.add_cold('a')
+    eviction.remove('c')
+    assert eviction.victim() == 'a'
@@ -0,0 +1,63 @@
+import json
+import os
+
+import pytest
+from engine import ShardedEngine, set_record, shard_files, split_limit
+
+
+def create_engine(tmp_path, shard_count, **options):
+    return ShardedEngine(shard_count=shard_count, data_dir=str(tmp_path), group_commit=False, fsync=False,
+                         **options)
+
+
+# Доли шардов в сумме дают ровно общее ограничение
+@pytest.mark.parametrize("total,count", [(10, 16), (16, 16), (17, 4), (100, 3), (0, 4)])
+def test_split_limit_sums_to_total(total, count):
+    limits = [split_limit(total, count, index) for index in range(count)]
+    assert sum(limits) == total
+    assert max(limits) - min(limits) <= 1
+
+
+# Общее количество ключей не превышает KV_MAX_KEYS
+def test_total_keys_within_limit(tmp_path):
+    engine = create_engine(tmp_path, 4, max_keys=10)
+    for i in range(200):
+        engine.set(f'key-{i}', i)
+    assert engine.get_stats()['keys'] <= 10
+
+
+# Ограничение меньше количества шардов дало бы шарды без ограничения
+def test_limit_below_shard_count_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        create_engine(tmp_path, 16, max_keys=10)
+
+
+# Файлы новой раскладки от прерванного переноса не попадают в данные
+def test_reshard_ignores_stale_layout(tmp_path):
+    engine = create_engine(tmp_path, 1)
+    engine.set('kept', 1)
+    engine.set('deleted', 2)
+    engine.delete('deleted')
+    engine.shards[0].save_snapshot()
+
+    # Перенос на 2 шарда прервался до записи shards.json: в его файлах есть удаленный позже ключ
+    for index in range(2):
+        snapshot_name, _, _ = shard_files(index, 2)
+        with open(os.path.join(tmp_path, snapshot_name), 'w', encoding='utf-8') as f:
+            json.dump({'deleted': 2, 'stale': 3}, f)
+
+    engine = create_engine(tmp_path, 2)
+    assert engine.get('kept') == (True, 1)
+    assert engine.exists('deleted') is False
+    assert engine.exists('stale') is False
+
+
+# close() сохраняет очередь группового коммита и останавливает поток-писатель
+def test_close_saves_pending_changes(tmp_path):
+    engine = ShardedEngine(shard_count=2, data_dir=str(tmp_path), fsync=False)
+    engine.mset_nowait([set_record(f'key-{i}', i) for i in range(100)])
+    engine.close()
+    assert all(not shard.committer.thread.is_alive() for shard in engine.shards if shard.committer.thread)
+
+    engine = create_engine(tmp_path, 2)
+    assert engine.get_stats()['keys'] == 100
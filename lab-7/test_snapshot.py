@@ -0,0 +1,87 @@
+import time
+
+import pytest
+import engine
+from engine import ShardedEngine
+
+
+def create_engine(tmp_path, **options):
+    return ShardedEngine(data_dir=str(tmp_path), snapshot_format='binary', group_commit=False, fsync=False,
+                         **options)
+
+
+# Изменения, сделанные пока бинарный снимок пишется без блокировки, не теряются ни в памяти, ни на диске
+def test_changes_during_snapshot_survive(tmp_path, monkeypatch):
+    store = create_engine(tmp_path)
+    store.set('kept', 1)
+    store.set('updated', 1)
+    store.set('deleted', 1)
+    shard = store.shards[0]
+    shard.save_snapshot()
+
+    real_write = engine.write_snapshot
+
+    def write_with_changes(path, entries, expire_times):
+        store.set('updated', 2)
+        store.set('added', 3)
+        store.delete('deleted')
+        # Повторный снимок во время записи не начинается
+        shard.save_snapshot()
+        real_write(path, entries, expire_times)
+
+    monkeypatch.setattr(engine, 'write_snapshot', write_with_changes)
+    shard.save_snapshot()
+    monkeypatch.setattr(engine, 'write_snapshot', real_write)
+
+    expected = {'kept': (True, 1), 'updated': (True, 2), 'added': (True, 3), 'deleted': (False, None)}
+    assert {key: store.get(key) for key in expected} == expected
+    assert store.get_stats()['keys'] == 3
+
+    store = create_engine(tmp_path)
+    assert {key: store.get(key) for key in expected} == expected
+    assert store.get_stats()['keys'] == 3
+
+
+# Ключи бинарного снимка вытесняются после перезапуска, даже если к ним не обращались
+def test_snapshot_keys_evictable_after_reload(tmp_path):
+    store = create_engine(tmp_path, max_keys=3)
+    for key in ('a', 'b', 'c'):
+        store.set(key, key)
+    store.shards[0].save_snapshot()
+
+    store = create_engine(tmp_path, max_keys=3)
+    store.set('d', 'd')
+    assert store.get_stats()['keys'] == 3
+    assert store.get_stats()['evictions'] == 1
+    assert store.get('d') == (True, 'd')
+
+
+# Ключи снимка добавляются в политику вытеснения фоновым потоком, а не при открытии
+def test_snapshot_keys_seeded_in_background(tmp_path):
+    store = create_engine(tmp_path, max_keys=10)
+    for key in ('a', 'b', 'c'):
+        store.set(key, key)
+    store.shards[0].save_snapshot()
+
+    shard = create_engine(tmp_path, max_keys=10).shards[0]
+    deadline = time.monotonic() + 5
+    while shard.seed_position is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert shard.seed_position is None
+    assert set(shard.eviction.order) == {'a', 'b', 'c'}
+
+
+# Ключи снимка, к которым не обращались после запуска, вытесняются раньше прочитанных
+@pytest.mark.parametrize("policy", ['lru', 'lfu'])
+def test_cold_snapshot_keys_evicted_first(tmp_path, policy):
+    store = create_engine(tmp_path, max_keys=3, eviction_policy=policy)
+    for key in ('a', 'b', 'c'):
+        store.set(key, key)
+    store.shards[0].save_snapshot()
+
+    store = create_engine(tmp_path, max_keys=3, eviction_policy=policy)
+    store.get('a')
+    store.set('d', 'd')
+    assert store.get('a') == (True, 'a')
+    assert store.get('d') == (True, 'd')
+    assert store.get_stats()['evictions'] == 1
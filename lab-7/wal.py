@@ -0,0 +1,139 @@
+import json
+import os
+
+
+# Атомарно записывает объект в JSON-файл
+# Сначала пишем во временный файл, затем переименовываем его поверх старого,
+# поэтому при сбое посреди записи старый файл остается целым
+def atomic_write_json(path, obj):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(obj, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+# Читает словарь из JSON-файла, если файла нет - возвращает пустой словарь
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+# Журнал операций (write-ahead log) для хранилища ключ-значение
+# Каждое изменение дописывается в конец журнала одной строкой JSON,
+# а время от времени журнал сворачивается в снимок (snapshot)
+class WriteAheadLog:
+    def __init__(self, log_path, snapshot_path, expires_path, compact_every=10000, fsync=True):
+        # Файл журнала, куда дописываются операции
+        self.log_path = log_path
+        # Файл снимка со всем словарем на момент последнего сворачивания
+        self.snapshot_path = snapshot_path
+        # Файл снимка со временем истечения ключей, у которых задан TTL
+        self.expires_path = expires_path
+        # Минимальное количество записей в журнале для сворачивания
+        self.compact_every = compact_every
+        # Сбрасывать ли данные на диск после каждой записи
+        self.fsync = fsync
+        # Количество записей в журнале после последнего сворачивания
+        self.records = 0
+        self.file = None
+
+    # Восстанавливает словарь: читает снимок и применяет к нему журнал
+    # Возвращает (словарь, время истечения ключей с TTL)
+    def load(self):
+        data = load_json(self.snapshot_path)
+        expire_times = load_json(self.expires_path)
+
+        self.recover(lambda record: self.apply(data, expire_times, record))
+        # Время истечения ключей, которых нет в словаре, не нужно
+        expire_times = {key: expire_at for key, expire_at in expire_times.items() if key in data}
+        return data, expire_times
+
+    # Применяет к состоянию все записи журнала функцией apply
+    def recover(self, apply):
+        self.records = 0
+        if os.path.exists(self.log_path):
+            for record in self.replay():
+                apply(record)
+                self.records += 1
+
+    # Читает записи журнала по одной
+    # Недописанная последняя строка (сбой во время записи) отрезается
+    def replay(self):
+        good_offset = 0
+        with open(self.log_path, 'rb') as file:
+            for line in file:
+                # Строка без перевода строки в конце - запись оборвалась
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                good_offset += len(line)
+                yield record
+
+        # Обрезаем поврежденный хвост, чтобы новые записи шли после целых
+        if os.path.getsize(self.log_path) > good_offset:
+            with open(self.log_path, 'r+b') as file:
+                file.truncate(good_offset)
+
+    # Применяет одну запись журнала к словарю и времени истечения ключей
+    @staticmethod
+    def apply(data, expire_times, record):
+        key = record['key']
+        if record['op'] == 'set':
+            data[key] = record['value']
+            # Запись без expire_at снимает прежний TTL
+            if record.get('expire_at') is not None:
+                expire_times[key] = record['expire_at']
+            else:
+                expire_times.pop(key, None)
+        elif record['op'] == 'delete':
+            data.pop(key, None)
+            expire_times.pop(key, None)
+
+    # Дописывает записи в конец журнала
+    # Стоимость пропорциональна размеру записей, а не всего хранилища
+    def append(self, *records):
+        if self.file is None:
+            self.file = open(self.log_path, 'ab')
+        payload = b''.join(
+            json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+            for record in records
+        )
+        self.file.write(payload)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.records += len(records)
+
+    # Нужно ли свернуть журнал
+    # Сворачиваем, когда журнал стал длиннее самого словаря,
+    # так что в среднем на одну запись приходится O(1) работы
+    def needs_compaction(self, data_size):
+        return self.records >= max(self.compact_every, data_size)
+
+    # Сворачивает журнал: сохраняет снимок словаря и очищает журнал
+    def compact(self, data, expire_times):
+        # Снимки пишутся атомарно, поэтому сбой не испортит предыдущие
+        # Если сбой случится до очистки журнала, при запуске он просто
+        # применится к новым снимкам повторно и даст тот же результат
+        atomic_write_json(self.expires_path, expire_times)
+        atomic_write_json(self.snapshot_path, data)
+        self.truncate()
+
+    # Очищает журнал после того, как его записи попали в снимок
+    def truncate(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.log_path, 'wb')
+        self.records = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
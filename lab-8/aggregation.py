@@ -0,0 +1,122 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from reader import detect_format, read_range, read_transaction_chunks, split_ranges
+
+# Подсчет сумм по категориям, в том числе параллельный на нескольких процессах
+#
+# Суммы считаются в копейках (целые числа), поэтому частичные суммы частей файла
+# складываются точно и в любом порядке дают тот же результат, что и последовательный подсчет
+
+# На сколько частей на каждый процесс делится файл JSON Lines
+PARTS_PER_WORKER = 4
+# Сколько транзакций в одной части JSON-массива (его читает основной процесс)
+ARRAY_PART_SIZE = 50000
+
+
+# Сумма в копейках
+def to_kopecks(amount):
+    return round(amount * 100)
+
+
+# Предупреждение о превышении порога
+# position - номер транзакции в файле (с 1), на которой сумма категории впервые превысила порог
+def print_alert(category, position, transaction, warning_threshold):
+    print(f"\nВнимание: расходы в категории '{category}' превысили {warning_threshold} руб. "
+          f"(транзакция №{position} от {transaction.get('timestamp')})")
+
+
+# Часть файла для одного процесса:
+# ("range", путь, начало, конец) - диапазон байтов файла JSON Lines
+# ("items", список транзакций) - пакет, прочитанный основным процессом
+def read_part(part):
+    if part[0] == "range":
+        return read_range(*part[1:])
+    return part[1]
+
+
+# Частичные суммы одной части (выполняется в процессе пула)
+# Возвращает (количество транзакций, суммы по категориям, максимумы нарастающих сумм по категориям)
+# По максимуму видно, превысила ли категория порог внутри части, даже если суммы бывают отрицательными
+def aggregate_part(part):
+    count = 0
+    totals = {}
+    peaks = {}
+    for transaction in read_part(part):
+        category = transaction["category"]
+        total = totals.get(category, 0) + to_kopecks(transaction["amount"])
+        totals[category] = total
+        if category not in peaks or total > peaks[category]:
+            peaks[category] = total
+        count += 1
+    return count, totals, peaks
+
+
+# Объединяет частичные суммы частей в порядке файла
+class TotalsMerger:
+    def __init__(self, warning_threshold):
+        self.warning_threshold = warning_threshold
+        self.threshold = to_kopecks(warning_threshold)
+        # Суммы по категориям в копейках
+        self.category_totals = {}
+        # Предупреждения: (категория, номер транзакции)
+        self.alerts = []
+        self.warned_categories = set()
+        # Сколько транзакций в уже объединенных частях
+        self.position = 0
+
+    def merge(self, part, result):
+        count, totals, peaks = result
+        crossing = [
+            category for category, peak in peaks.items()
+            if category not in self.warned_categories and self.category_totals.get(category, 0) + peak > self.threshold
+        ]
+        if crossing:
+            self.find_alerts(part, crossing)
+
+        for category, total in totals.items():
+            self.category_totals[category] = self.category_totals.get(category, 0) + total
+        self.position += count
+
+    # Перечитывает часть, в которой категории впервые превысили порог, и находит нужные транзакции
+    # Такое бывает не чаще одного раза на категорию, поэтому перечитывание почти ничего не стоит
+    def find_alerts(self, part, categories):
+        running = {category: self.category_totals.get(category, 0) for category in categories}
+        for index, transaction in enumerate(read_part(part)):
+            category = transaction["category"]
+            if category not in running:
+                continue
+            running[category] += to_kopecks(transaction["amount"])
+            if running[category] > self.threshold:
+                del running[category]
+                self.warned_categories.add(category)
+                self.alerts.append((category, self.position + index + 1))
+                print_alert(category, self.position + index + 1, transaction, self.warning_threshold)
+                if not running:
+                    break
+
+
+# Считает суммы по категориям на workers процессах
+# Возвращает (суммы по категориям в копейках, предупреждения) - те же, что у последовательного подсчета
+def parallel_totals(path, workers, warning_threshold=10000):
+    if detect_format(path) == "lines":
+        # Каждый процесс сам читает свой диапазон байтов файла
+        parts = (("range", path, start, end) for start, end in split_ranges(path, workers * PARTS_PER_WORKER))
+    else:
+        # JSON-массив нельзя разрезать по байтам, поэтому его читает основной процесс и раздает пакеты
+        parts = (("items", chunk) for chunk in read_transaction_chunks(path, ARRAY_PART_SIZE))
+
+    merger = TotalsMerger(warning_threshold)
+    with ProcessPoolExecutor(workers) as pool:
+        # Части объединяются в порядке файла; одновременно в работе не больше двух частей на процесс,
+        # чтобы пакеты JSON-массива не накапливались в памяти
+        pending = deque()
+        for part in parts:
+            pending.append((part, pool.submit(aggregate_part, part)))
+            if len(pending) >= workers * 2:
+                done_part, future = pending.popleft()
+                merger.merge(done_part, future.result())
+        while pending:
+            done_part, future = pending.popleft()
+            merger.merge(done_part, future.result())
+    return merger.category_totals, merger.alerts
@@ -0,0 +1,121 @@
+import contextlib
+import gc
+import io
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from aggregation import print_alert, to_kopecks
+from columnar import CategoryDictionary, ColumnarTotals, TransactionBatch, encode_batch
+from pipeline import BATCH_SIZE
+
+# Память и скорость подсчета сумм по категориям: список словарей против колоночных пакетов NumPy
+# - словари: цикл по транзакциям, как в transaction_processor
+# - колонки, пакеты: ColumnarTotals по пакетам из BATCH_SIZE транзакций, как в processor.py --columnar
+# - колонки, один массив: ColumnarTotals по всем транзакциям сразу
+# Суммы и предупреждения всех способов сравниваются между собой
+#
+# Запуск: python benchmark_columnar.py [количество транзакций]
+
+CATEGORIES = ["Супермаркеты", "Кафе и рестораны", "Одежда и обувь",
+              "Цифровой контент", "Образование", "Сотовая связь"]
+
+
+# Текущий объем памяти процесса в байтах (Linux)
+def current_rss():
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * 4096
+
+
+def create_transactions(count):
+    rng = random.Random(7)
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "timestamp": str(start + timedelta(microseconds=i * 1000003)),
+            "category": rng.choice(CATEGORIES),
+            "amount": round(rng.uniform(1, 5000), 2),
+        }
+        for i in range(count)
+    ]
+
+
+# Суммы по списку словарей, как в transaction_processor
+def dict_totals(transactions, warning_threshold):
+    category_totals = {}
+    warned_categories = set()
+    threshold = to_kopecks(warning_threshold)
+    alerts = []
+    for position, transaction in enumerate(transactions, 1):
+        category = transaction["category"]
+        total = category_totals.get(category, 0) + to_kopecks(transaction["amount"])
+        category_totals[category] = total
+        if total > threshold and category not in warned_categories:
+            print_alert(category, position, transaction, warning_threshold)
+            alerts.append((category, position))
+            warned_categories.add(category)
+    return category_totals, alerts
+
+
+def columnar_totals(batches, dictionary, warning_threshold):
+    totals = ColumnarTotals(dictionary, warning_threshold)
+    for batch in batches:
+        totals.add(batch)
+    return totals.category_totals(), totals.alerts
+
+
+# Выполняет функцию без вывода в консоль, возвращает (результат, секунды)
+def measure(function, *args):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 7
+    # Порог примерно на середине данных, чтобы предупреждения считались по всему объему
+    warning_threshold = count * 2500 / len(CATEGORIES) / 2
+
+    rss_before = current_rss()
+    transactions = create_transactions(count)
+    dict_bytes = current_rss() - rss_before
+
+    expected, dict_time = measure(dict_totals, transactions, warning_threshold)
+
+    dictionary = CategoryDictionary()
+    started = time.perf_counter()
+    batches = [encode_batch(transactions[start:start + BATCH_SIZE], dictionary)
+               for start in range(0, count, BATCH_SIZE)]
+    encode_time = time.perf_counter() - started
+    columnar_bytes = sum(batch.nbytes for batch in batches)
+    del transactions
+    gc.collect()
+
+    batched, batched_time = measure(columnar_totals, batches, dictionary, warning_threshold)
+    whole = TransactionBatch(
+        dictionary,
+        np.concatenate([batch.categories for batch in batches]),
+        np.concatenate([batch.timestamps for batch in batches]),
+        np.concatenate([batch.amounts for batch in batches]),
+    )
+    single, single_time = measure(columnar_totals, [whole], dictionary, warning_threshold)
+
+    print(f"Транзакций: {count}")
+    print(f"{'представление':<24}{'память, МБ':>12}{'байт/тр.':>10}{'подсчет, с':>12}{'тр/с':>14}  совпадает")
+    rows = [
+        ("словари", dict_bytes, dict_time, expected),
+        ("колонки, пакеты", columnar_bytes, batched_time, batched),
+        ("колонки, один массив", whole.nbytes, single_time, single),
+    ]
+    for name, size, seconds, result in rows:
+        print(f"{name:<24}{size / 2 ** 20:>12.1f}{size / count:>10.1f}{seconds:>12.3f}{count / seconds:>14.0f}"
+              f"  {result == expected}")
+    print(f"Перевод словарей в колонки: {encode_time:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+from persistence import FlushPolicy, JsonLinesWriter
+
+# Скорость записи транзакций в файл JSON Lines в зависимости от размера сброса на диск
+# Для каждого размера пакета (--flush-count в generator.py) транзакции пишутся через JsonLinesWriter
+# с fsync после каждого сброса и без него. Чем больше пакет, тем реже fsync и выше скорость,
+# но тем больше транзакций теряется при сбое (не больше одного пакета).
+#
+# Запуск: python benchmark_flush.py [количество транзакций] [размеры пакетов через запятую]
+
+CATEGORIES = ["Супермаркеты", "Кафе и рестораны", "Одежда и обувь",
+              "Цифровой контент", "Образование", "Сотовая связь"]
+# Сколько сбросов делается на один замер: при маленьких пакетах и fsync транзакций пишется меньше
+MAX_FLUSHES = 2000
+
+# Заранее созданные транзакции, чтобы замерять запись, а не генерацию
+rng = random.Random(1)
+POOL = [
+    {"timestamp": "2025-01-01 12:00:00.000001", "category": rng.choice(CATEGORIES),
+     "amount": round(rng.uniform(1, 5000), 2)}
+    for _ in range(1000)
+]
+
+
+# Пишет count транзакций пакетами по batch_size, возвращает (транзакций в секунду, сбросов)
+def measure(path, count, batch_size, sync):
+    if os.path.exists(path):
+        os.remove(path)
+    writer = JsonLinesWriter(path, FlushPolicy(max_count=batch_size, max_interval=None), sync=sync)
+    started = time.perf_counter()
+    written = 0
+    while written < count:
+        size = min(len(POOL), batch_size, count - written)
+        writer.write(POOL[:size])
+        written += size
+    writer.close()
+    return count / (time.perf_counter() - started), writer.flush_count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    sizes = [int(size) for size in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 10, 100, 1000, 10000]
+    path = os.path.join(tempfile.mkdtemp(prefix="tx-flush-"), "transactions.jsonl")
+
+    print(f"{'пакет':>8}{'fsync, тр/с':>14}{'без fsync, тр/с':>18}{'сбросов':>10}  потеря при сбое")
+    for batch_size in sizes:
+        # При маленьких пакетах ограничиваем количество сбросов, чтобы замер не шел минутами
+        measured = min(count, batch_size * MAX_FLUSHES)
+        synced, flushes = measure(path, measured, batch_size, sync=True)
+        unsynced, _ = measure(path, measured, batch_size, sync=False)
+        print(f"{batch_size:>8}{synced:>14.0f}{unsynced:>18.0f}{flushes:>10}  до {batch_size} транзакций",
+              flush=True)
+
+
+if __name__ == "__main__":
+    main()
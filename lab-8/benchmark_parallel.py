@@ -0,0 +1,78 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from aggregation import parallel_totals
+from pipeline import BatchQueue
+from processor import transaction_loader, transaction_processor
+
+# Ускорение подсчета сумм по категориям на нескольких процессах
+# Сравнивает последовательную обработку (processor.py) с parallel_totals на 1, 2, 4 ... процессах
+# и проверяет, что суммы и предупреждения (вместе с номерами транзакций) совпадают
+#
+# Запуск: python benchmark_parallel.py [количество транзакций] [максимум процессов]
+
+CATEGORIES = ["Супермаркеты", "Кафе и рестораны", "Одежда и обувь",
+              "Цифровой контент", "Образование", "Сотовая связь"]
+
+
+# Создает файл JSON Lines со случайными транзакциями (seed фиксирован)
+def create_file(path, count):
+    rng = random.Random(42)
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(count):
+            file.write(json.dumps({
+                "timestamp": f"2025-01-01 00:00:{i % 60:02d}",
+                "category": rng.choice(CATEGORIES),
+                "amount": round(rng.uniform(1, 5000), 2),
+            }, ensure_ascii=False) + "\n")
+
+
+async def run_sequential(path, warning_threshold):
+    queue = BatchQueue()
+    _, result = await asyncio.gather(
+        transaction_loader(queue, path),
+        transaction_processor(queue, warning_threshold),
+    )
+    return result
+
+
+# Выполняет функцию без вывода в консоль, возвращает (результат, секунды)
+def measure(function, *args):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    # Порог примерно на середине файла, чтобы предупреждения приходились на разные части
+    warning_threshold = count * 2500 / len(CATEGORIES) / 2
+
+    path = os.path.join(tempfile.mkdtemp(prefix="tx-bench-"), "transactions.jsonl")
+    create_file(path, count)
+    print(f"Транзакций: {count}, файл: {os.path.getsize(path) // 2 ** 20} МБ, ядер: {os.cpu_count()}")
+
+    expected, sequential_time = measure(lambda: asyncio.run(run_sequential(path, warning_threshold)))
+    print(f"{'процессов':>10}{'секунд':>10}{'ускорение':>11}{'на ядро':>10}  совпадает")
+    print(f"{'-':>10}{sequential_time:>10.2f}{1:>10.2f}x{'-':>10}  последовательно")
+
+    workers = 1
+    while workers <= max_workers:
+        result, seconds = measure(parallel_totals, path, workers, warning_threshold)
+        speedup = sequential_time / seconds
+        print(f"{workers:>10}{seconds:>10.2f}{speedup:>10.2f}x{speedup / workers:>10.2f}  {result == expected}",
+              flush=True)
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import asyncio
+import random
+import sys
+import time
+
+from pipeline import BATCH_SIZE, BatchQueue
+
+# Сравнение передачи транзакций через очередь (транзакций в секунду):
+# - по одной: неограниченная asyncio.Queue, один await put() на транзакцию (прежняя схема)
+# - пакетами: ограниченная BatchQueue, один await put() на пакет из BATCH_SIZE транзакций
+# Обработчик в обоих случаях считает суммы по категориям, как transaction_processor
+#
+# Запуск: python benchmark_queue.py [количества транзакций через запятую]
+
+CATEGORIES = ["Супермаркеты", "Кафе и рестораны", "Одежда и обувь",
+              "Цифровой контент", "Образование", "Сотовая связь"]
+
+# Заранее созданные транзакции, чтобы замерять очередь, а не генерацию
+rng = random.Random(1)
+POOL = [
+    {"timestamp": "2025-01-01 12:00:00", "category": rng.choice(CATEGORIES), "amount": round(rng.uniform(1, 5000), 2)}
+    for _ in range(BATCH_SIZE)
+]
+
+
+def add_to_totals(category_totals, transaction):
+    category = transaction["category"]
+    category_totals[category] = category_totals.get(category, 0) + transaction["amount"]
+
+
+async def single_producer(queue, count, depth):
+    for i in range(count):
+        await queue.put(POOL[i % len(POOL)])
+        depth[0] = max(depth[0], queue.qsize())
+    await queue.put(None)
+
+
+async def single_consumer(queue, category_totals):
+    while True:
+        transaction = await queue.get()
+        if transaction is None:
+            break
+        add_to_totals(category_totals, transaction)
+
+
+async def batch_producer(queue, count):
+    for start in range(0, count, BATCH_SIZE):
+        size = min(BATCH_SIZE, count - start)
+        await queue.put(POOL[:size])
+    await queue.close()
+
+
+async def batch_consumer(queue, category_totals):
+    while True:
+        batch = await queue.get()
+        if batch is None:
+            break
+        for transaction in batch:
+            add_to_totals(category_totals, transaction)
+
+
+# Возвращает (транзакций в секунду, максимальная глубина очереди в транзакциях)
+async def run_single(count):
+    queue = asyncio.Queue()
+    depth = [0]
+    started = time.perf_counter()
+    await asyncio.gather(single_producer(queue, count, depth), single_consumer(queue, {}))
+    return count / (time.perf_counter() - started), depth[0]
+
+
+async def run_batched(count):
+    queue = BatchQueue()
+    started = time.perf_counter()
+    await asyncio.gather(batch_producer(queue, count), batch_consumer(queue, {}))
+    return count / (time.perf_counter() - started), queue.metrics.max_depth
+
+
+def main():
+    counts = [int(count) for count in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10 ** 4, 10 ** 6, 10 ** 7]
+
+    print(f"Размер пакета: {BATCH_SIZE}")
+    print(f"{'транзакций':>12}{'по одной, тр/с':>18}{'глубина':>12}"
+          f"{'пакетами, тр/с':>18}{'глубина':>10}{'ускорение':>11}")
+    for count in counts:
+        single_rate, single_depth = asyncio.run(run_single(count))
+        batch_rate, batch_depth = asyncio.run(run_batched(count))
+        print(f"{count:>12}{single_rate:>18.0f}{single_depth:>12}{batch_rate:>18.0f}{batch_depth:>10}"
+              f"{batch_rate / single_rate:>10.1f}x", flush=True)
+
+
+if __name__ == "__main__":
+    main()
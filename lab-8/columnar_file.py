@@ -0,0 +1,346 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from columnar import CategoryDictionary, TransactionBatch, encode_batch
+from reader import read_transaction_chunks
+
+# Бинарный колоночный файл транзакций
+#
+# Устройство файла (все числа little-endian):
+# [сигнатура][блок 1][блок 2]...[каталог блоков][названия категорий][окончание]
+# Блок - несколько тысяч транзакций по колонкам: коды категорий (uint16), время (int64, микросекунды
+# от 1970-01-01) и суммы (float64). Каталог хранит для каждого блока смещение, число строк
+# и минимум/максимум времени и суммы, поэтому отбор по времени пропускает целые блоки, не читая их.
+# Окончание в конце файла указывает на каталог. При дописывании файл обрезается до старого каталога,
+# и новые блоки, каталог и окончание пишутся на его место, поэтому мертвых байтов в файле не остается.
+# Старый каталог с названиями и окончанием перед обрезкой сохраняется в файл <путь>.footer:
+# если запись оборвалась, он возвращается на место, и в файле остаются все ранее закрытые записи.
+# Окончание хранит CRC32 каталога с названиями: окончание, которое указывает на перезаписанные
+# при дописывании байты, не считается целым.
+# Файл открывается через mmap, а колонки блоков читаются как массивы NumPy без копирования.
+
+# Сигнатура формата (в начале и в конце файла), версия 002 - окончание с контрольной суммой
+MAGIC = b"TXCOL002"
+# Окончание: смещение каталога, количество блоков, длина названий категорий,
+# CRC32 каталога с названиями, сигнатура
+TRAILER = struct.Struct("<QQQI4x8s")
+# Запись каталога о блоке
+DIRECTORY_ENTRY = np.dtype([
+    ("offset", "<u8"),
+    ("rows", "<u8"),
+    ("min_time", "<i8"),
+    ("max_time", "<i8"),
+    ("min_amount", "<f8"),
+    ("max_amount", "<f8"),
+])
+# Сколько транзакций в одном блоке
+CHUNK_ROWS = 65536
+
+
+# Является ли файл колоночным
+def is_columnar(path):
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+# Смещения колонок в блоке из rows строк: (коды категорий, время, суммы)
+# Колонки выровнены по 8 байт
+def column_offsets(offset, rows):
+    times_offset = offset + (rows * 2 + 7) // 8 * 8
+    return offset, times_offset, times_offset + rows * 8
+
+
+# Проверяет окончание footer - байты от начала каталога до конца окончания
+# Окончание целое, если заканчивается сигнатурой, каталог с названиями занимают ровно место перед ним
+# и их контрольная сумма совпадает
+def valid_footer(footer):
+    if len(footer) < TRAILER.size:
+        return False
+    _, chunk_count, names_length, checksum, magic = TRAILER.unpack_from(footer, len(footer) - TRAILER.size)
+    body_length = len(footer) - TRAILER.size
+    return (magic == MAGIC and chunk_count * DIRECTORY_ENTRY.itemsize + names_length == body_length
+            and zlib.crc32(footer[:body_length]) == checksum)
+
+
+# Конец последнего целого окончания в данных файла (None - ни одного окончания)
+def footer_end(data):
+    end = len(data)
+    while end >= len(MAGIC) + TRAILER.size:
+        directory_offset = TRAILER.unpack_from(data, end - TRAILER.size)[0]
+        if len(MAGIC) <= directory_offset < end and valid_footer(data[directory_offset:end]):
+            return end
+        # Ищем предыдущую сигнатуру - возможный конец более раннего окончания
+        found = data.rfind(MAGIC, len(MAGIC), end - 1)
+        if found == -1:
+            return None
+        end = found + len(MAGIC)
+    return None
+
+
+# Читает каталог и названия категорий по окончанию файла, которое заканчивается в end
+def read_footer(data, end=None):
+    end = len(data) if end is None else end
+    directory_offset, chunk_count, names_length, _, magic = TRAILER.unpack_from(data, end - TRAILER.size)
+    if magic != MAGIC:
+        raise ValueError("Колоночный файл не закрыт: нет окончания с каталогом блоков")
+    directory = np.frombuffer(data, dtype=DIRECTORY_ENTRY, count=chunk_count, offset=directory_offset)
+    names_offset = directory_offset + directory.nbytes
+    names = json.loads(bytes(data[names_offset:names_offset + names_length]).decode("utf-8"))
+    return directory_offset, directory, names
+
+
+# Возвращает на место окончание, сохраненное перед дописыванием, если дописывание оборвалось
+# Если в файле есть целое окончание (запись закрылась или не успела начаться) или копия не дописана
+# (тогда файл еще не обрезался), копия просто удаляется
+# Возвращает, сколько байтов незакрытой записи отрезано
+def restore_footer(path, backup_path):
+    with open(backup_path, "rb") as file:
+        footer = file.read()
+    dropped = 0
+    with open(path, "r+b") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            intact = footer_end(data) is not None
+        if not intact and valid_footer(footer):
+            directory_offset = TRAILER.unpack_from(footer, len(footer) - TRAILER.size)[0]
+            file.seek(directory_offset)
+            file.write(footer)
+            file.truncate()
+            file.flush()
+            os.fsync(file.fileno())
+            dropped = max(0, size - directory_offset)
+    os.remove(backup_path)
+    return dropped
+
+
+# Сбрасывает на диск запись папки с файлом path (создание и удаление файлов в ней)
+def fsync_directory(path):
+    descriptor = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+# Запись колоночного файла, в том числе дописывание к существующему
+class ColumnarWriter:
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        # Копия старого окончания на время дописывания
+        self.backup_path = path + ".footer"
+        self.chunk_rows = chunk_rows
+        self.dictionary = CategoryDictionary()
+        self.directory = []
+        # Пакеты, которые еще не набрали целый блок
+        self.pending = []
+        self.pending_rows = 0
+        # Сколько байтов незакрытой записи отрезано при открытии
+        self.recovered_bytes = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            if os.path.exists(self.backup_path):
+                self.recovered_bytes = restore_footer(path, self.backup_path)
+            # Дописывание: читаем каталог и названия, новые блоки пойдут на место старого каталога
+            # Читается только окончание и каталог, а не весь файл
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(MAGIC)] != MAGIC:
+                    raise ValueError(f"{path} не является колоночным файлом")
+                size = len(data)
+                end = footer_end(data)
+                if end is not None:
+                    directory_offset, directory, names = read_footer(data, end)
+                    self.directory = [tuple(entry) for entry in directory.tolist()]
+                    del directory
+                    footer = data[directory_offset:end]
+                else:
+                    # Ни одна запись не была закрыта: в файле нет целых данных
+                    end, names = len(MAGIC), []
+                    directory_offset, footer = end, b""
+            for name in names:
+                self.dictionary.encode(name)
+            if end < size:
+                # Предыдущая запись оборвалась: отрезаем ее блоки после последнего целого окончания
+                self.recovered_bytes += size - end
+            if footer:
+                with open(self.backup_path, "wb") as file:
+                    file.write(footer)
+                    file.flush()
+                    os.fsync(file.fileno())
+                fsync_directory(path)
+            self.file = open(path, "r+b")
+            # Обрезка сбрасывается на диск до первого нового блока: иначе после сбоя в файле могли бы
+            # остаться и старое окончание, и новые блоки поверх каталога, на который оно указывает
+            self.file.truncate(directory_offset)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.seek(directory_offset)
+        else:
+            self.file = open(path, "wb")
+            self.file.write(MAGIC)
+
+    # Добавляет транзакции-словари, целые блоки сразу записываются в файл
+    def write(self, transactions):
+        if not transactions:
+            return
+        self.write_batch(encode_batch(transactions, self.dictionary))
+
+    # Добавляет колоночный пакет; коды категорий переводятся в коды словаря файла
+    def write_batch(self, batch):
+        if not len(batch):
+            return
+        if batch.dictionary is not self.dictionary:
+            codes = np.array([self.dictionary.encode(name) for name in batch.dictionary.names], dtype=np.uint16)
+            batch = TransactionBatch(self.dictionary, codes[batch.categories], batch.timestamps, batch.amounts)
+        self.pending.append(batch)
+        self.pending_rows += len(batch)
+        if self.pending_rows >= self.chunk_rows:
+            self.flush_chunks(final=False)
+
+    def flush_chunks(self, final):
+        categories = np.concatenate([batch.categories.astype(np.uint16) for batch in self.pending])
+        timestamps = np.concatenate([batch.timestamps for batch in self.pending])
+        amounts = np.concatenate([batch.amounts for batch in self.pending])
+
+        start = 0
+        while len(amounts) - start >= self.chunk_rows or final and start < len(amounts):
+            end = min(start + self.chunk_rows, len(amounts))
+            self.write_chunk(categories[start:end], timestamps[start:end], amounts[start:end])
+            start = end
+
+        # Остаток меньше блока ждет следующих транзакций
+        rest = TransactionBatch(self.dictionary, categories[start:], timestamps[start:], amounts[start:])
+        self.pending = [rest] if len(rest) else []
+        self.pending_rows = len(rest)
+
+    def write_chunk(self, categories, timestamps, amounts):
+        offset = self.file.tell()
+        # Блок начинается со смещения, кратного 8: после старого окончания оно может быть любым
+        if offset % 8:
+            self.file.write(b"\0" * (-offset % 8))
+            offset = self.file.tell()
+        rows = len(amounts)
+        _, times_offset, amounts_offset = column_offsets(offset, rows)
+        self.file.write(categories.astype("<u2").tobytes())
+        self.file.write(b"\0" * (times_offset - offset - rows * 2))
+        self.file.write(timestamps.astype("<i8").tobytes())
+        self.file.write(amounts.astype("<f8").tobytes())
+        self.directory.append((
+            offset, rows,
+            int(timestamps.min()), int(timestamps.max()),
+            float(amounts.min()), float(amounts.max()),
+        ))
+
+    # Колоночный файл сохраняется целыми блоками и при закрытии, сброса по времени у него нет
+    def flush_timeout(self):
+        return None
+
+    # Записывает оставшиеся транзакции, каталог и окончание
+    def close(self):
+        if self.pending:
+            self.flush_chunks(final=True)
+        directory = np.array(self.directory, dtype=DIRECTORY_ENTRY)
+        names = json.dumps(self.dictionary.names, ensure_ascii=False).encode("utf-8")
+        directory_offset = self.file.tell()
+        body = directory.tobytes() + names
+        self.file.write(body)
+        self.file.write(TRAILER.pack(directory_offset, len(directory), len(names), zlib.crc32(body), MAGIC))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        # Новое окончание на диске, копия старого больше не нужна
+        if os.path.exists(self.backup_path):
+            os.remove(self.backup_path)
+
+
+# Колоночный файл, открытый через mmap
+class ColumnarFile:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            # Отображение остается действительным и после закрытия файла
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} не является колоночным файлом")
+        # Если дописывание оборвалось, читаются данные до последнего целого окончания
+        end = footer_end(self.mm)
+        if end is None:
+            raise ValueError("Колоночный файл не закрыт: нет окончания с каталогом блоков")
+        _, self.directory, names = read_footer(self.mm, end)
+        self.dictionary = CategoryDictionary()
+        for name in names:
+            self.dictionary.encode(name)
+        # Сколько блоков пропущено при последнем чтении с отбором по времени
+        self.skipped_chunks = 0
+
+    def __len__(self):
+        return int(self.directory["rows"].sum())
+
+    # Блок с номером index: колонки - массивы прямо над отображенным файлом, без копирования
+    def chunk(self, index):
+        entry = self.directory[index]
+        rows = int(entry["rows"])
+        categories_offset, times_offset, amounts_offset = column_offsets(int(entry["offset"]), rows)
+        return TransactionBatch(
+            self.dictionary,
+            np.frombuffer(self.mm, dtype="<u2", count=rows, offset=categories_offset),
+            np.frombuffer(self.mm, dtype="<i8", count=rows, offset=times_offset),
+            np.frombuffer(self.mm, dtype="<f8", count=rows, offset=amounts_offset),
+        )
+
+    # Пакеты транзакций со временем в [start_time, end_time) (микросекунды, None - без границы)
+    # Блоки, которые по минимуму и максимуму времени не пересекают интервал, не читаются
+    def batches(self, start_time=None, end_time=None):
+        self.skipped_chunks = 0
+        for index, entry in enumerate(self.directory):
+            if (start_time is not None and entry["max_time"] < start_time
+                    or end_time is not None and entry["min_time"] >= end_time):
+                self.skipped_chunks += 1
+                continue
+
+            batch = self.chunk(index)
+            # Блок целиком внутри интервала - отдаем как есть
+            if ((start_time is None or entry["min_time"] >= start_time)
+                    and (end_time is None or entry["max_time"] < end_time)):
+                yield batch
+                continue
+
+            mask = np.ones(len(batch), dtype=bool)
+            if start_time is not None:
+                mask &= batch.timestamps >= start_time
+            if end_time is not None:
+                mask &= batch.timestamps < end_time
+            yield TransactionBatch(self.dictionary, batch.categories[mask], batch.timestamps[mask], batch.amounts[mask])
+
+    # Транзакции в виде словарей (для кода, который работает со словарями)
+    def transactions(self):
+        for batch in self.batches():
+            for index in range(len(batch)):
+                yield batch.transaction(index)
+
+
+# Переводит файл JSON Lines или JSON-массив в колоночный файл
+def convert_json(json_path, columnar_path):
+    if os.path.exists(columnar_path):
+        os.remove(columnar_path)
+    writer = ColumnarWriter(columnar_path)
+    count = 0
+    for chunk in read_transaction_chunks(json_path):
+        writer.write(chunk)
+        count += len(chunk)
+    writer.close()
+    return count
+
+
+if __name__ == "__main__":
+    # Конвертер: python columnar_file.py transactions.jsonl transactions.col
+    if len(sys.argv) != 3:
+        print("Используй команду: python columnar_file.py <transactions.jsonl|transactions.json> <transactions.col>")
+        sys.exit(1)
+
+    converted = convert_json(sys.argv[1], sys.argv[2])
+    print(f"Сконвертировано транзакций: {converted}, размер файла: {os.path.getsize(sys.argv[2])} байт")
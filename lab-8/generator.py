@@ -1,18 +1,37 @@
+import argparse
 import asyncio
-import json
+import os
 import random
+import time
 from datetime import datetime
 
+from live import stop_event
+from metrics import PipelineMetrics, print_stages, profiling
+from persistence import FlushPolicy, JsonLinesWriter
+from pipeline import BATCH_SIZE, BatchQueue, print_metrics
+
+# Колоночный формат (--format columnar) и быстрая генерация (--count) используют NumPy
+try:
+    from columnar_file import ColumnarWriter
+    from synthetic import SyntheticSpec, parse_distribution, write_columnar, write_jsonl
+except ImportError:
+    ColumnarWriter = None
+
 # Название файла со всеми транзакциями
-file_name = "transactions.json"
+# Формат JSON Lines: одна транзакция в строке, новые транзакции дописываются в конец файла
+file_name = "transactions.jsonl"
+# Файл в бинарном колоночном формате
+columnar_file_name = "transactions.col"
+# В режиме --live пакет транзакций отправляется раз в столько секунд
+LIVE_TICK = 0.1
+
+# Список возможных категорий расходов
+categories = ["Супермаркеты", "Кафе и рестораны", "Одежда и обувь",
+              "Цифровой контент", "Образование", "Сотовая связь"]
 
 
 # Генерирует одну финансовую транзакцию
 def generate_transaction():
-    # Список возможных категорий расходов
-    categories = ["Супермаркеты", "Кафе и рестораны", "Одежда и обувь",
-                  "Цифровой контент", "Образование", "Сотовая связь"]
-
     return {
         # Дата и время в момент генерации
         "timestamp": str(datetime.now()),
@@ -23,79 +42,222 @@ def generate_transaction():
     }
 
 
-# Загружает существующие транзакции из файла
-def load_existing_transactions():
-    try:
-        with open(file_name, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return []  # Файл не существует, возвращаем пустой список
+# Генерирует транзакции и помещает их в очередь (источник данных в реактивном потоке)
+# Транзакции передаются пакетами по batch_size штук
+# metrics - PipelineMetrics: этапы generate и enqueue (ожидание места в очереди)
+async def transaction_publisher(transaction_queue, total_count, batch_size=BATCH_SIZE, metrics=None):
+    print(f"Начинаем генерацию {total_count} транзакций...")
 
+    for start in range(0, total_count, batch_size):
+        # Генерируем пакет транзакций
+        started = time.perf_counter()
+        batch = [generate_transaction() for _ in range(min(batch_size, total_count - start))]
+        if metrics is not None:
+            metrics.record("generate", started, len(batch))
 
-# Сохраняет пакет транзакций в файл, когда накопилось 10 штук
-async def save_transaction_package(transactions):
-    # Загружаем существующие транзакции
-    existing_transactions = load_existing_transactions()
+        # Помещаем пакет в очередь
+        # "Потребитель" будет забирать транзакции отсюда
+        started = time.perf_counter()
+        await transaction_queue.put(batch)
+        if metrics is not None:
+            metrics.record("enqueue", started, len(batch))
 
-    # Добавляем новые транзакции к существующим
-    all_transactions = existing_transactions + transactions
+    # Отправляем сигнал завершения в очередь
+    await transaction_queue.close()
+    print(f"Генерация завершена. Создано {total_count} транзакций")
 
-    # Сохраняем обновленные данные в файл, indent делает json читабельным в файле
-    with open(file_name, "w") as file:
-        json.dump(all_transactions, file, indent=1)
 
-    # Вывод в консоль после сохранения
-    print(f"Сохранено {len(transactions)} транзакций. Всего в файле: {len(all_transactions)}")
+# Генерирует транзакции непрерывно со скоростью rate транзакций в секунду (режим --live)
+# total_count=None - до остановки по Ctrl+C
+async def live_publisher(transaction_queue, rate, stop, total_count=None, metrics=None):
+    print(f"Генерация {rate} транзакций в секунду, Ctrl+C - остановка...")
+    batch_size = max(1, round(rate * LIVE_TICK))
+    generated = 0
+    next_time = time.monotonic()
 
+    while not stop.is_set() and (total_count is None or generated < total_count):
+        size = batch_size if total_count is None else min(batch_size, total_count - generated)
+        started = time.perf_counter()
+        batch = [generate_transaction() for _ in range(size)]
+        if metrics is not None:
+            metrics.record("generate", started, size)
+        await transaction_queue.put(batch)
+        generated += size
 
-# Генерирует транзакции и помещает их в очередь (источник данных в реактивном потоке)
-async def transaction_publisher(transaction_queue, total_count):
-    print(f"Начинаем генерацию {total_count} транзакций...")
+        # Ждем времени следующего пакета, чтобы держать заданную скорость
+        next_time += size / rate
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
 
-    for i in range(total_count):
-        # Генерируем одну транзакцию
-        transaction = generate_transaction()
+    await transaction_queue.close()
+    print(f"Генерация завершена. Создано {generated} транзакций")
 
-        # Помещаем транзакцию в очередь
-        # "Потребитель" будет забирать транзакции отсюда
-        await transaction_queue.put(transaction)
 
-    # Отправляем сигнал завершения в очередь
-    await transaction_queue.put(None)
-    print(f"Генерация завершена. Создано {total_count} транзакций")
+# Обрабатывает транзакции из очереди (потребитель данных в реактивном потоке)
+# writer - запись в файл: JsonLinesWriter или ColumnarWriter
+# JsonLinesWriter сам решает, когда сбросить накопленные транзакции на диск (FlushPolicy),
+# а если новых транзакций нет, буфер сбрасывается по времени
+# metrics - PipelineMetrics: этап write (запись пакета вместе со сбросами на диск)
+async def transaction_subscriber(transaction_queue, writer, metrics=None):
+    # Сколько транзакций сохранено за запуск
+    saved_count = 0
 
+    try:
+        while True:
+            # Ждем следующий пакет транзакций из очереди, но не дольше, чем до сброса буфера по времени
+            try:
+                batch = await asyncio.wait_for(transaction_queue.get(), writer.flush_timeout())
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(writer.flush)
+                continue
 
-# Обрабатывает транзакции из очереди (потребитель данных в реактивном потоке)
-async def transaction_subscriber(transaction_queue):
-    # Хранилище для накопления транзакций
-    storage = []
+            # Если получили None, это сигнал завершения
+            if batch is None:
+                break
 
-    while True:
-        # Ждем следующую транзакцию из очереди
-        # Выполняется, когда появляются данные
-        transaction = await transaction_queue.get()
+            # Запись и fsync выполняются в отдельном потоке, чтобы не останавливать цикл событий
+            started = time.perf_counter()
+            await asyncio.to_thread(writer.write, batch)
+            if metrics is not None:
+                metrics.record("write", started, len(batch))
+            saved_count += len(batch)
+    finally:
+        # Сохраняем оставшиеся транзакции; колоночный файл дописывает неполный блок и каталог блоков
+        writer.close()
 
-        # Если получили None, это сигнал завершения
-        if transaction is None:
-            break
+    # Вывод в консоль после сохранения
+    print(f"Сохранено {saved_count} транзакций в файл {writer.path}")
 
-        # Добавляем транзакцию в хранилище
-        storage.append(transaction)
 
-        # Если накопилось 10 транзакций, сохраняем их
-        if len(storage) >= 10:
-            await save_transaction_package(storage)
-            storage = []  # Очищаем хранилище
+# Разбирает аргументы командной строки
+def parse_args():
+    parser = argparse.ArgumentParser(description="Генерация транзакций")
+    parser.add_argument("--format", choices=["jsonl", "columnar"], default="jsonl",
+                        help=f"формат файла: {file_name} (по умолчанию) или бинарный колоночный {columnar_file_name}")
+    parser.add_argument("--live", action="store_true",
+                        help="генерировать непрерывно и сразу дописывать в файл (для processor.py --follow)")
+    parser.add_argument("--rate", type=float, default=100,
+                        help="транзакций в секунду в режиме --live (по умолчанию 100)")
+    parser.add_argument("--count", type=int,
+                        help="сколько транзакций сгенерировать без вопроса в консоли, быстро, блоками NumPy "
+                             "(в режиме --live - сколько сгенерировать до остановки)")
+    parser.add_argument("--seed", type=int, help="seed генератора случайных чисел: тот же seed - тот же файл")
+    parser.add_argument("--distribution",
+                        help='доли категорий для --count, например "Супермаркеты=5,Образование=1" '
+                             "(по умолчанию шесть категорий поровну)")
+    parser.add_argument("--start", default="2025-01-01",
+                        help="начало интервала времени транзакций для --count (по умолчанию 2025-01-01)")
+    parser.add_argument("--end", default="2026-01-01",
+                        help="конец интервала времени транзакций для --count (по умолчанию 2026-01-01)")
+    parser.add_argument("--workers", type=int, default=1, help="количество процессов для --count (по умолчанию 1)")
+    parser.add_argument("--output", help=f"файл для --count (по умолчанию {file_name} или {columnar_file_name})")
+    parser.add_argument("--flush-count", type=int, default=1000,
+                        help="сбрасывать файл JSON Lines на диск каждые N транзакций (по умолчанию 1000)")
+    parser.add_argument("--flush-bytes", type=int,
+                        help="сбрасывать файл JSON Lines на диск, когда накопится N байт (по умолчанию не задано)")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="сбрасывать файл JSON Lines на диск не реже, чем раз в N секунд (по умолчанию 1)")
+    parser.add_argument("--no-fsync", action="store_true",
+                        help="не ждать записи на диск (fsync) после сброса: быстрее, но сбой системы потеряет данные")
+    parser.add_argument("--metrics",
+                        help="файл для метрик этапов и очереди: .json - JSON, иначе текстовый формат Prometheus")
+    parser.add_argument("--profile", help="профилировать запуск через cProfile и сохранить профиль в файл")
+    return parser.parse_args()
 
-    # Сохраняем оставшиеся транзакции (если они есть)
-    if storage:
-        await save_transaction_package(storage)
+
+# Создает запись в файл по аргументам командной строки
+# В файле JSON Lines поврежденный после сбоя конец обрезается при открытии
+# metrics - PipelineMetrics для этапа flush (сброс на диск) в файле JSON Lines
+def create_writer(args, policy, metrics=None):
+    if args.format == "columnar":
+        writer = ColumnarWriter(columnar_file_name)
+    else:
+        writer = JsonLinesWriter(file_name, policy, sync=not args.no_fsync, metrics=metrics)
+    if writer.recovered_bytes:
+        print(f"Файл {writer.path} был поврежден при сбое: отрезано {writer.recovered_bytes} байт незаписанных данных")
+    return writer
+
+
+# Быстрая генерация --count транзакций без очереди: блоки NumPy сразу дописываются в файл
+def generate_file(args, metrics):
+    if ColumnarWriter is None:
+        print("Для генерации с --count нужен NumPy: pip install numpy")
+        return
+    if args.count <= 0 or args.workers <= 0:
+        print("Количество транзакций и процессов должно быть положительным числом")
+        return
+
+    try:
+        names, weights = parse_distribution(args.distribution)
+        spec = SyntheticSpec(args.count, args.seed or 0, names, weights, args.start, args.end)
+        path = args.output or (columnar_file_name if args.format == "columnar" else file_name)
+        print(f"Генерация {args.count} транзакций в файл {path} на {args.workers} процессах...")
+        started = time.perf_counter()
+        if args.format == "columnar":
+            write_columnar(spec, ColumnarWriter(path), args.workers)
+        else:
+            write_jsonl(spec, path, args.workers)
+        metrics.record("generate", started, args.count)
+        elapsed = time.perf_counter() - started
+    except Exception as error:
+        print(f"Произошла ошибка: {error}")
+        return
+
+    print(f"Генерация завершена за {elapsed:.1f} с ({args.count / elapsed:.0f} транзакций/с), "
+          f"размер файла: {os.path.getsize(path) / 2 ** 20:.0f} МБ")
+
+
+# Выводит метрики конвейера и сохраняет отчет в файл metrics_path, если он задан
+def report_metrics(metrics, metrics_path):
+    if metrics.queue_metrics is not None:
+        print_metrics(metrics.queue_metrics)
+    print_stages(metrics)
+    if metrics_path:
+        metrics.write(metrics_path)
+        print(f"Метрики сохранены в {metrics_path}")
 
 
 async def main():
+    args = parse_args()
+    # С --profile весь запуск идет под cProfile
+    with profiling(args.profile):
+        await run(args)
+
+
+async def run(args):
+    if args.format == "columnar" and ColumnarWriter is None:
+        print("Для колоночного формата нужен NumPy: pip install numpy")
+        return
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.count is not None and not args.live:
+        metrics = PipelineMetrics("generator")
+        generate_file(args, metrics)
+        report_metrics(metrics, args.metrics)
+        return
+
     # Создаем очередь для транзакций
     # Главный элемент реактивной системы - через него передаются данные
-    transaction_queue = asyncio.Queue()
+    # Очередь ограничена и передает пакеты транзакций
+    transaction_queue = BatchQueue()
+    # Метрики этапов и очереди
+    metrics = PipelineMetrics("generator", transaction_queue.metrics)
+
+    if args.live:
+        if args.format != "jsonl" or args.rate <= 0:
+            print("Режим --live пишет только в файл JSON Lines с положительной скоростью --rate")
+            return
+        # Каждый пакет сразу дописывается в файл, чтобы обработчик видел его без задержки
+        await asyncio.gather(
+            live_publisher(transaction_queue, args.rate, stop_event(), args.count, metrics),
+            transaction_subscriber(transaction_queue, create_writer(args, FlushPolicy(max_count=1), metrics), metrics)
+        )
+        report_metrics(metrics, args.metrics)
+        return
 
     # Запрашиваем количество транзакций у пользователя
     try:
@@ -112,10 +274,15 @@ async def main():
         # Запускаем производителя и потребителя параллельно
         # Работают одновременно и общаются через очередь
         await asyncio.gather(
-            transaction_publisher(transaction_queue, total_count),
-            transaction_subscriber(transaction_queue)
+            transaction_publisher(transaction_queue, total_count, metrics=metrics),
+            transaction_subscriber(
+                transaction_queue,
+                create_writer(args, FlushPolicy(args.flush_count, args.flush_bytes, args.flush_interval), metrics),
+                metrics
+            )
         )
 
+        report_metrics(metrics, args.metrics)
     except Exception as error:
         print(f"Произошла ошибка: {error}")
 
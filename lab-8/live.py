@@ -0,0 +1,263 @@
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import deque
+from datetime import datetime
+
+from aggregation import print_alert, to_kopecks
+from pipeline import BATCH_SIZE
+
+# Непрерывная обработка: processor.py --follow читает файл JSON Lines, в который дописывает generator.py --live
+#
+# - Файл читается с сохраненного смещения, в обработку идут только целые строки:
+#   строка, которую генератор еще дописывает, читается на следующем проходе
+# - Состояние (смещение, суммы, предупреждения) периодически сохраняется в файл контрольной точки,
+#   после перезапуска обработка продолжается с этого смещения, а не с начала файла
+# - Задержка считается от времени транзакции (момент генерации) до ее обработки
+
+# Как часто проверять, появились ли новые строки (секунды)
+POLL_INTERVAL = 0.2
+# Как часто сохранять контрольную точку (секунды)
+CHECKPOINT_INTERVAL = 1.0
+# Как часто выводить состояние обработки (секунды)
+STATUS_INTERVAL = 10.0
+# Сколько последних задержек хранится для перцентилей
+LATENCY_SAMPLES = 10000
+
+
+# Пакет транзакций и смещение в файле сразу после его последней строки
+class LiveBatch(list):
+    def __init__(self, transactions, end_offset):
+        super().__init__(transactions)
+        self.end_offset = end_offset
+
+
+# Чтение новых строк в конце файла JSON Lines
+class FileTail:
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        self.file = None
+
+    # Возвращает пакет до size новых транзакций (пустой, если новых строк нет)
+    def read_batch(self, size=BATCH_SIZE):
+        if self.file is None:
+            if not os.path.exists(self.path):
+                return LiveBatch([], self.offset)
+            self.file = open(self.path, "rb")
+
+        if os.path.getsize(self.path) < self.offset:
+            raise ValueError(f"Файл {self.path} стал короче сохраненного смещения {self.offset}: "
+                             f"он был перезаписан, удалите контрольную точку")
+
+        self.file.seek(self.offset)
+        transactions = []
+        offset = self.offset
+        for line in self.file:
+            # Строка без перевода строки еще дописывается генератором
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                transactions.append(json.loads(line.decode("utf-8")))
+                if len(transactions) >= size:
+                    break
+        self.offset = offset
+        return LiveBatch(transactions, offset)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+# Задержки от генерации транзакции до обработки (секунды)
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=LATENCY_SAMPLES)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    # Перцентиль по последним задержкам, percent от 0 до 100
+    def percentile(self, percent):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, len(values) * percent // 100)]
+
+    def report(self):
+        return {
+            "count": self.count,
+            "average": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50": round(self.percentile(50), 4),
+            "p99": round(self.percentile(99), 4),
+            "max": round(self.max, 4),
+        }
+
+
+# Задержка транзакции: время генерации записано генератором через datetime.now()
+def transaction_latency(transaction, now):
+    return now - datetime.fromisoformat(transaction["timestamp"]).timestamp()
+
+
+# Состояние непрерывной обработки, которое сохраняется в контрольной точке
+class LiveTotals:
+    def __init__(self, path, warning_threshold=10000):
+        self.path = path
+        self.warning_threshold = warning_threshold
+        self.threshold = to_kopecks(warning_threshold)
+        # Смещение в файле, до которого все транзакции уже учтены
+        self.offset = 0
+        # Номер последней учтенной транзакции в файле
+        self.position = 0
+        # Суммы по категориям в копейках
+        self.category_totals = {}
+        # Предупреждения: пары (категория, номер транзакции)
+        self.alerts = []
+        self.latency = LatencyStats()
+        self.alert_latency = LatencyStats()
+
+    # Учитывает пакет транзакций и сдвигает смещение на его конец
+    def add(self, batch):
+        now = time.time()
+        warned = {category for category, _ in self.alerts}
+        for transaction in batch:
+            self.position += 1
+            category = transaction["category"]
+            total = self.category_totals.get(category, 0) + to_kopecks(transaction["amount"])
+            self.category_totals[category] = total
+            latency = transaction_latency(transaction, now)
+            self.latency.add(latency)
+
+            if total > self.threshold and category not in warned:
+                print_alert(category, self.position, transaction, self.warning_threshold)
+                print(f"Задержка от генерации до предупреждения: {latency:.3f} с")
+                self.alert_latency.add(latency)
+                self.alerts.append((category, self.position))
+                warned.add(category)
+        self.offset = batch.end_offset
+
+    # Сохраняет контрольную точку: сначала во временный файл, потом заменяет старую
+    # Поэтому после сбоя на диске остается либо старая, либо новая точка целиком
+    def save(self, checkpoint_path):
+        temporary_path = checkpoint_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({
+                "file": os.path.abspath(self.path),
+                "offset": self.offset,
+                "position": self.position,
+                "category_totals": self.category_totals,
+                "alerts": self.alerts,
+            }, file, ensure_ascii=False)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, checkpoint_path)
+
+    # Загружает состояние из контрольной точки, если она есть
+    def load(self, checkpoint_path):
+        if not os.path.exists(checkpoint_path):
+            return False
+        with open(checkpoint_path, "r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+        if checkpoint["file"] != os.path.abspath(self.path):
+            raise ValueError(f"Контрольная точка {checkpoint_path} относится к файлу {checkpoint['file']}")
+        self.offset = checkpoint["offset"]
+        self.position = checkpoint["position"]
+        self.category_totals = checkpoint["category_totals"]
+        self.alerts = [tuple(alert) for alert in checkpoint["alerts"]]
+        return True
+
+
+# Выводит задержки от генерации до обработки
+def print_latency(state):
+    report = state.latency.report()
+    print(f"Задержка обработки: в среднем {report['average']} с, p50 {report['p50']} с, "
+          f"p99 {report['p99']} с, максимум {report['max']} с ({report['count']} транзакций)")
+    if state.alert_latency.count:
+        report = state.alert_latency.report()
+        print(f"Задержка предупреждений: в среднем {report['average']} с, максимум {report['max']} с")
+
+
+# Событие остановки по Ctrl+C или SIGTERM
+# Там, где обработчики сигналов цикла событий недоступны (Windows), Ctrl+C отменяет программу,
+# и контрольная точка сохраняется в finally обработчика
+def stop_event():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    return stop
+
+
+# Читает новые транзакции из файла и отправляет их в очередь, пока не пришла остановка
+# metrics - PipelineMetrics: этапы read и enqueue
+async def live_loader(transaction_queue, tail, stop, poll_interval=POLL_INTERVAL, metrics=None):
+    try:
+        while not stop.is_set():
+            started = time.perf_counter()
+            batch = await asyncio.to_thread(tail.read_batch)
+            if batch:
+                if metrics is not None:
+                    metrics.record("read", started, len(batch))
+                started = time.perf_counter()
+                await transaction_queue.put(batch)
+                if metrics is not None:
+                    metrics.record("enqueue", started, len(batch))
+                continue
+            # Новых строк нет: ждем и проверяем снова
+            try:
+                await asyncio.wait_for(stop.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        tail.close()
+        await transaction_queue.close()
+
+
+# Обрабатывает транзакции по мере поступления и сохраняет контрольные точки
+# metrics - PipelineMetrics: этапы process и checkpoint; вместе с контрольной точкой
+# отчет метрик обновляется в файле metrics_path, если он задан
+async def live_processor(transaction_queue, state, checkpoint_path, metrics=None, metrics_path=None):
+    print(f"Следим за файлом {state.path} с транзакции №{state.position + 1} (смещение {state.offset})...")
+    last_checkpoint = last_status = time.monotonic()
+    saved_offset = state.offset
+    try:
+        while True:
+            batch = await transaction_queue.get()
+            if batch is None:
+                break
+            started = time.perf_counter()
+            state.add(batch)
+            if metrics is not None:
+                metrics.record("process", started, len(batch))
+
+            now = time.monotonic()
+            if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                started = time.perf_counter()
+                state.save(checkpoint_path)
+                if metrics is not None:
+                    metrics.record("checkpoint", started)
+                    if metrics_path:
+                        metrics.write(metrics_path)
+                saved_offset = state.offset
+                last_checkpoint = now
+            if now - last_status >= STATUS_INTERVAL:
+                print(f"\nОбработано транзакций: {state.position}")
+                print_latency(state)
+                last_status = now
+    finally:
+        # Сохраняем то, что успели учесть, в том числе при отмене программы
+        if state.offset != saved_offset:
+            state.save(checkpoint_path)
+    return state
@@ -0,0 +1,131 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+# Метрики конвейера транзакций: время этапов, глубина очереди, транзакций в секунду
+#
+# Этапы замеряются на пакет, а не на транзакцию: два вызова perf_counter на пакет
+# и счетчики в списке, поэтому метрики можно не выключать при обычной работе.
+# Отчет пишется в JSON (файл .json) или в текстовом формате Prometheus (остальные файлы),
+# например для textfile collector в node_exporter.
+
+# Сколько строк профиля выводится в консоль
+PROFILE_LINES = 20
+
+
+# Время этапов конвейера: название -> [вызовов, транзакций, секунд, максимум секунд за вызов]
+class PipelineMetrics:
+    def __init__(self, name, queue_metrics=None):
+        # Название программы: generator или processor (префикс метрик Prometheus)
+        self.name = name
+        self.queue_metrics = queue_metrics
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    # Учитывает один вызов этапа: started - время начала по perf_counter, records - транзакций в вызове
+    def record(self, stage, started, records=0):
+        seconds = time.perf_counter() - started
+        counters = self.stages.get(stage)
+        if counters is None:
+            counters = self.stages[stage] = [0, 0, 0.0, 0.0]
+        counters[0] += 1
+        counters[1] += records
+        counters[2] += seconds
+        if seconds > counters[3]:
+            counters[3] = seconds
+
+    def report(self):
+        stages = {}
+        for stage, (calls, records, seconds, max_seconds) in self.stages.items():
+            stages[stage] = {
+                "calls": calls,
+                "records": records,
+                "seconds": round(seconds, 6),
+                "max_seconds": round(max_seconds, 6),
+                "records_per_second": round(records / seconds) if seconds else 0,
+            }
+        report = {
+            "name": self.name,
+            "elapsed_seconds": round(time.perf_counter() - self.started, 3),
+            "stages": stages,
+        }
+        if self.queue_metrics is not None:
+            report["queue"] = self.queue_metrics.report()
+            report["queue"]["depth_samples"] = [
+                [round(moment - self.started, 3), depth] for moment, depth in self.queue_metrics.depth_samples
+            ]
+        return report
+
+    # Отчет в текстовом формате Prometheus
+    def prometheus(self):
+        report = self.report()
+        prefix = f"tx_{self.name}"
+        lines = []
+
+        def metric(name, metric_type, help_text, values):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for labels, value in values:
+                lines.append(f"{prefix}_{name}{labels} {value}")
+
+        stages = report["stages"]
+        metric("stage_calls_total", "counter", "Calls of a pipeline stage",
+               [(f'{{stage="{stage}"}}', values["calls"]) for stage, values in stages.items()])
+        metric("stage_records_total", "counter", "Transactions passed through a pipeline stage",
+               [(f'{{stage="{stage}"}}', values["records"]) for stage, values in stages.items()])
+        metric("stage_seconds_total", "counter", "Time spent in a pipeline stage",
+               [(f'{{stage="{stage}"}}', values["seconds"]) for stage, values in stages.items()])
+        metric("stage_max_seconds", "gauge", "Longest single call of a pipeline stage",
+               [(f'{{stage="{stage}"}}', values["max_seconds"]) for stage, values in stages.items()])
+        if "queue" in report:
+            queue = report["queue"]
+            metric("queue_records_total", "counter", "Transactions taken from the queue", [("", queue["items"])])
+            metric("queue_depth", "gauge", "Transactions waiting in the queue", [("", queue["depth"])])
+            metric("queue_max_depth", "gauge", "Largest queue depth", [("", queue["max_depth"])])
+            metric("queue_records_per_second", "gauge", "Queue throughput", [("", queue["items_per_second"])])
+        metric("elapsed_seconds", "gauge", "Time since the start", [("", report["elapsed_seconds"])])
+        return "\n".join(lines) + "\n"
+
+    # Записывает отчет в файл: сначала во временный, потом заменяет старый,
+    # чтобы тот, кто читает файл, не увидел его наполовину записанным
+    def write(self, path):
+        if path.endswith(".json"):
+            text = json.dumps(self.report(), ensure_ascii=False, indent=2)
+        else:
+            text = self.prometheus()
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temporary_path, path)
+
+
+# Выводит время этапов
+def print_stages(metrics):
+    for stage, values in metrics.report()["stages"].items():
+        print(f"Этап {stage}: {values['seconds']:.3f} с, вызовов {values['calls']}, "
+              f"транзакций {values['records']} ({values['records_per_second']} транзакций/с)")
+
+
+# Профилирует код внутри with через cProfile и сохраняет результат в path (None - без профиля)
+# Профиль покрывает поток цикла событий; работа в asyncio.to_thread видна в метриках этапов
+@contextmanager
+def profiling(path):
+    if path is None:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        print(output.getvalue())
+        print(f"Профиль сохранен в {path} (просмотр: python -m pstats {path})")
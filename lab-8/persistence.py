@@ -0,0 +1,141 @@
+import json
+import os
+import time
+
+# Надежная запись транзакций в файл JSON Lines
+#
+# Транзакции копятся в буфере и дописываются в конец файла одним вызовом write, после которого
+# данные сбрасываются на диск (fsync). Когда сбрасывать буфер, решает FlushPolicy:
+# по количеству транзакций, по размеру в байтах или по времени с первой несохраненной транзакции.
+#
+# Старые строки файла не перезаписываются, поэтому сбой может повредить только конец файла:
+# последнюю строку без перевода строки или строки последнего сброса, которые не дошли до диска.
+# При открытии файла recover_jsonl проверяет конец файла и обрезает его до последней целой строки.
+# В результате каждая транзакция в файле либо есть целиком и один раз, либо ее нет.
+
+# Сколько байтов в конце файла проверяется при восстановлении
+RECOVERY_WINDOW = 1 << 20
+
+
+# Когда сбрасывать буфер на диск: при max_count транзакциях, max_bytes байтах
+# или через max_interval секунд после первой несохраненной транзакции (None - условие не используется)
+class FlushPolicy:
+    def __init__(self, max_count=1000, max_bytes=None, max_interval=1.0):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval
+
+    def should_flush(self, count, size, age):
+        return (self.max_count is not None and count >= self.max_count
+                or self.max_bytes is not None and size >= self.max_bytes
+                or self.max_interval is not None and age >= self.max_interval)
+
+
+# Позиция после последнего перевода строки до позиции end (0 - перевода строки нет)
+# Файл читается с конца окнами по RECOVERY_WINDOW байтов
+def last_line_end(file, end):
+    position = end
+    while position > 0:
+        start = max(0, position - RECOVERY_WINDOW)
+        file.seek(start)
+        found = file.read(position - start).rfind(b"\n")
+        if found != -1:
+            return start + found + 1
+        position = start
+    return 0
+
+
+# Обрезает поврежденный конец файла JSON Lines
+# Недописанная последняя строка (без перевода строки) отрезается целиком, какой бы длинной она ни была,
+# а строки в последних RECOVERY_WINDOW байтах перед ней проверяются: файл обрезается перед первой строкой,
+# которая не разбирается как JSON
+# Возвращает количество отрезанных байтов
+def recover_jsonl(path):
+    if not os.path.exists(path):
+        return 0
+
+    with open(path, "r+b") as file:
+        size = file.seek(0, os.SEEK_END)
+        complete_end = last_line_end(file, size)
+        start = max(0, complete_end - RECOVERY_WINDOW)
+        file.seek(start)
+        tail = file.read(complete_end - start)
+        # Первая строка окна могла начаться до него, проверку начинаем со следующей
+        position = 0 if start == 0 else tail.find(b"\n") + 1
+
+        valid_end = position
+        while position < len(tail):
+            end = tail.find(b"\n", position)
+            line = tail[position:end]
+            if line.strip():
+                try:
+                    json.loads(line.decode("utf-8"))
+                except ValueError:
+                    break
+            position = valid_end = end + 1
+
+        torn = size - (start + valid_end)
+        if torn:
+            file.truncate(start + valid_end)
+            file.flush()
+            os.fsync(file.fileno())
+        return torn
+
+
+# Дописывает транзакции в файл JSON Lines по правилам FlushPolicy
+# metrics - PipelineMetrics для этапа flush (запись буфера и fsync)
+class JsonLinesWriter:
+    def __init__(self, path, policy=None, sync=True, metrics=None):
+        self.path = path
+        self.policy = policy or FlushPolicy()
+        # Сбрасывать ли данные на диск после каждой записи (fsync)
+        self.sync = sync
+        self.recovered_bytes = recover_jsonl(path)
+        self.file = open(path, "ab")
+        self.buffer = []
+        self.buffer_count = 0
+        self.buffer_bytes = 0
+        # Когда в буфер попала первая несохраненная транзакция
+        self.buffer_started = None
+        # Статистика: сколько раз буфер сброшен на диск
+        self.flush_count = 0
+        self.metrics = metrics
+
+    def write(self, transactions):
+        if not transactions:
+            return
+        lines = "".join(json.dumps(transaction, ensure_ascii=False) + "\n" for transaction in transactions)
+        data = lines.encode("utf-8")
+        if self.buffer_started is None:
+            self.buffer_started = time.monotonic()
+        self.buffer.append(data)
+        self.buffer_count += len(transactions)
+        self.buffer_bytes += len(data)
+        if self.policy.should_flush(self.buffer_count, self.buffer_bytes, time.monotonic() - self.buffer_started):
+            self.flush()
+
+    # Через сколько секунд буфер нужно сбросить по времени (None - ждать не нужно)
+    def flush_timeout(self):
+        if self.buffer_started is None or self.policy.max_interval is None:
+            return None
+        return max(0.0, self.buffer_started + self.policy.max_interval - time.monotonic())
+
+    def flush(self):
+        if not self.buffer:
+            return
+        started = time.perf_counter()
+        self.file.write(b"".join(self.buffer))
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        if self.metrics is not None:
+            self.metrics.record("flush", started, self.buffer_count)
+        self.buffer = []
+        self.buffer_count = 0
+        self.buffer_bytes = 0
+        self.buffer_started = None
+        self.flush_count += 1
+
+    def close(self):
+        self.flush()
+        self.file.close()
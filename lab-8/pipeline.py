@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+# Очередь между источником и обработчиком транзакций (общая для generator.py и processor.py)
+# Через очередь передаются не отдельные транзакции, а списки (пакеты) транзакций:
+# переключение между корутинами приходится на пакет, а не на каждую транзакцию
+# Очередь ограничена, поэтому источник ждет, если обработчик не успевает, и память не растет
+
+# Сколько транзакций в одном пакете
+BATCH_SIZE = int(os.getenv("TX_BATCH_SIZE", "1000"))
+# Сколько пакетов может ждать в очереди
+QUEUE_BATCHES = int(os.getenv("TX_QUEUE_BATCHES", "16"))
+# Глубина очереди запоминается не чаще, чем раз в столько секунд
+DEPTH_SAMPLE_INTERVAL = 0.1
+# Сколько последних замеров глубины хранится
+DEPTH_SAMPLES = 600
+
+
+# Метрики очереди: глубина и пропускная способность
+class QueueMetrics:
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        # Сколько транзакций и пакетов прошло через очередь
+        self.items = 0
+        self.batches = 0
+        # Текущее и максимальное количество транзакций в очереди
+        self.depth = 0
+        self.max_depth = 0
+        # Сумма глубин после каждой вставки, чтобы посчитать среднюю глубину
+        self.depth_total = 0
+        # Глубина во времени: пары (perf_counter, глубина), последние DEPTH_SAMPLES замеров
+        self.depth_samples = deque(maxlen=DEPTH_SAMPLES)
+        self.last_sample = 0.0
+
+    def on_put(self, count):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        self.depth += count
+        if now - self.last_sample >= DEPTH_SAMPLE_INTERVAL:
+            self.depth_samples.append((now, self.depth))
+            self.last_sample = now
+        self.max_depth = max(self.max_depth, self.depth)
+        self.depth_total += self.depth
+        self.batches += 1
+
+    def on_get(self, count):
+        self.depth -= count
+        self.items += count
+        self.finished = time.perf_counter()
+
+    def report(self):
+        elapsed = (self.finished - self.started) if self.started is not None and self.finished else 0.0
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "seconds": round(elapsed, 3),
+            "items_per_second": round(self.items / elapsed) if elapsed else 0,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "average_depth": round(self.depth_total / self.batches) if self.batches else 0,
+        }
+
+
+# Ограниченная очередь пакетов транзакций
+# Конец потока обозначается None, как и раньше
+class BatchQueue:
+    def __init__(self, max_batches=QUEUE_BATCHES):
+        self.queue = asyncio.Queue(maxsize=max_batches)
+        self.metrics = QueueMetrics()
+
+    # Помещает пакет (список транзакций), ждет, если очередь заполнена
+    async def put(self, batch):
+        await self.queue.put(batch)
+        self.metrics.on_put(len(batch))
+
+    # Сообщает обработчику, что транзакций больше не будет
+    async def close(self):
+        await self.queue.put(None)
+
+    # Возвращает следующий пакет или None, если поток закончился
+    async def get(self):
+        batch = await self.queue.get()
+        if batch is not None:
+            self.metrics.on_get(len(batch))
+        return batch
+
+
+# Выводит метрики очереди
+def print_metrics(metrics):
+    report = metrics.report()
+    print(f"\nОчередь: {report['items']} транзакций в {report['batches']} пакетах за {report['seconds']} с "
+          f"({report['items_per_second']} транзакций/с), "
+          f"глубина: максимум {report['max_depth']}, в среднем {report['average_depth']}")
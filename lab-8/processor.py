@@ -1,22 +1,31 @@
+import argparse
 import asyncio
 import json
+import os
+import time
 
-# Название файла со всеми транзакциями
-file_name = "transactions.json"
+from aggregation import parallel_totals, print_alert, to_kopecks
+from live import FileTail, LiveTotals, live_loader, live_processor, print_latency, stop_event
+from metrics import PipelineMetrics, print_stages, profiling
+from pipeline import BatchQueue, print_metrics
+from reader import choose_file, detect_format, read_transaction_chunks
+from windows import WindowedTotals, format_micros, parse_duration
 
+# Колоночный режим (--columnar) использует NumPy, без него доступен обычный режим
+# Колоночный файл (transactions.col) тоже читается только с NumPy
+try:
+    from columnar import CategoryDictionary, ColumnarTotals, TransactionBatch, encode_batch, parse_time
+    from columnar_file import ColumnarFile, is_columnar
+except ImportError:
+    CategoryDictionary = None
 
-# Загружает все транзакции из файла
-def load_transactions_from_file():
-    try:
-        with open(file_name, "r") as file:
-            transactions = json.load(file)
-            return transactions
-    except FileNotFoundError:
-        print(f"Файл {file_name} не найден")
-        return []
+
+# Файл контрольной точки для режима --follow
+checkpoint_file_name = "processor_checkpoint.json"
 
 
 # Выводит итоговую информацию по категориям
+# Суммы хранятся в копейках
 def print_summary(category_totals):
     print("\nИтоги по категориям:")
 
@@ -30,85 +39,337 @@ def print_summary(category_totals):
         total_all_categories += amount
 
     for category, amount in category_totals.items():
-        print(f"{category} - {amount:.2f} руб.")
+        print(f"{category} - {amount / 100:.2f} руб.")
 
-    print(f"\nОбщая сумма: {total_all_categories:.2f} руб.")
+    print(f"\nОбщая сумма: {total_all_categories / 100:.2f} руб.")
 
 
-# Загружает транзакции из файла и отправляет их в очередь
-async def transaction_loader(transaction_queue):
+# Читает следующий пакет транзакций, в колоночном режиме переводит его в колонки
+def next_chunk(chunks, dictionary):
+    chunk = next(chunks, None)
+    if chunk is not None and dictionary is not None:
+        return encode_batch(chunk, dictionary)
+    return chunk
 
-    transactions = load_transactions_from_file()
 
-    if not transactions:
-        print("Нет транзакций для обработки")
-        await transaction_queue.put(None)
+# Загружает транзакции из файла и отправляет их в очередь
+# dictionary - словарь категорий для колоночного режима, без него в очередь идут списки словарей
+# metrics - PipelineMetrics: этапы read (чтение и разбор) и enqueue (ожидание места в очереди)
+async def transaction_loader(transaction_queue, path, dictionary=None, metrics=None):
+    if not os.path.exists(path):
+        print(f"Файл {path} не найден")
+        await transaction_queue.close()
         return
 
-    print(f"Загружено {len(transactions)} транзакций")
-
-    for transaction in transactions:
-        # Помещаем каждую транзакцию в очередь для обработки
-        await transaction_queue.put(transaction)
+    loaded_count = 0
+    chunks = read_transaction_chunks(path)
+    try:
+        while True:
+            # Очередной пакет транзакций разбирается в отдельном потоке, чтобы не останавливать цикл событий
+            # Следующий пакет читается только после того, как предыдущий поместился в очередь
+            started = time.perf_counter()
+            chunk = await asyncio.to_thread(next_chunk, chunks, dictionary)
+            if chunk is None:
+                break
+            if metrics is not None:
+                metrics.record("read", started, len(chunk))
+            # Помещаем пакет в очередь для обработки
+            started = time.perf_counter()
+            await transaction_queue.put(chunk)
+            if metrics is not None:
+                metrics.record("enqueue", started, len(chunk))
+            loaded_count += len(chunk)
+    finally:
+        chunks.close()
+
+    if not loaded_count:
+        print("Нет транзакций для обработки")
+    else:
+        print(f"Загружено {loaded_count} транзакций из файла {path}")
 
     # Отправляем сигнал завершения загрузки
-    await transaction_queue.put(None)
+    await transaction_queue.close()
+
+
+# Загружает колоночный файл: блоки отображаются в память и идут в очередь без разбора и копирования
+# Блоки, которые не попадают в интервал времени [start_time, end_time), пропускаются по каталогу
+async def columnar_loader(transaction_queue, path, start_time=None, end_time=None, metrics=None):
+    columnar_file = ColumnarFile(path)
+    loaded_count = 0
+    for batch in columnar_file.batches(start_time, end_time):
+        started = time.perf_counter()
+        await transaction_queue.put(batch)
+        if metrics is not None:
+            metrics.record("enqueue", started, len(batch))
+        loaded_count += len(batch)
+
+    print(f"Загружено {loaded_count} транзакций из колоночного файла {path}, "
+          f"пропущено блоков: {columnar_file.skipped_chunks} из {len(columnar_file.directory)}")
+    await transaction_queue.close()
 
 
 # Обрабатывает транзакции из очереди (реактивный обработчик)
-async def transaction_processor(transaction_queue, warning_threshold=10000):
+# Возвращает (суммы по категориям в копейках, предупреждения: пары (категория, номер транзакции))
+# windows - WindowedTotals для сумм по окнам времени (None - без окон)
+# metrics - PipelineMetrics: этапы dequeue (ожидание пакета) и process (подсчет)
+async def transaction_processor(transaction_queue, warning_threshold=10000, windows=None, metrics=None):
     print("Начинаем обработку транзакций...")
 
     # Словарь для хранения сумм по категориям
+    # Суммы в копейках складываются точно, поэтому совпадают с параллельным подсчетом
     category_totals = {}
     # Словарь для отслеживания, по каким категориям уже было предупреждение
     warned_categories = {}
+    threshold = to_kopecks(warning_threshold)
+    alerts = []
+    # Номер текущей транзакции в файле
+    position = 0
+    # Суммы для колоночных пакетов
+    columnar_totals = None
 
     while True:
-        # Ждем следующую транзакцию из очереди
-        transaction = await transaction_queue.get()
+        # Ждем следующий пакет транзакций из очереди
+        started = time.perf_counter()
+        batch = await transaction_queue.get()
 
         # Если получили None, это сигнал завершения
-        if transaction is None:
+        if batch is None:
             break
+        if metrics is not None:
+            metrics.record("dequeue", started, len(batch))
+        started = time.perf_counter()
+
+        # Колоночный пакет: суммы считаются векторно, без цикла по транзакциям
+        if CategoryDictionary is not None and isinstance(batch, TransactionBatch):
+            if columnar_totals is None:
+                columnar_totals = ColumnarTotals(batch.dictionary, warning_threshold)
+            if windows is not None:
+                windows.add_batch(batch, columnar_totals.position + 1)
+            columnar_totals.add(batch)
+            if metrics is not None:
+                metrics.record("process", started, len(batch))
+            continue
+
+        if windows is not None:
+            windows.add_batch(batch, position + 1)
+
+        for transaction in batch:
+            position += 1
+            # Извлекаем данные из транзакции
+            category = transaction["category"]
+            amount = to_kopecks(transaction["amount"])
+
+            # Добавляем сумму к категории
+            if category not in category_totals:
+                category_totals[category] = 0
+                warned_categories[category] = False
+
+            category_totals[category] += amount
+
+            # Проверяем, не превысила ли категория порог
+            if category_totals[category] > threshold and not warned_categories[category]:
+                print_alert(category, position, transaction, warning_threshold)
+                alerts.append((category, position))
+                warned_categories[category] = True
+
+        if metrics is not None:
+            metrics.record("process", started, len(batch))
+
+    if windows is not None:
+        # Конец потока: оставшиеся окна закрываются
+        windows.finish()
+
+    if columnar_totals is not None:
+        return columnar_totals.category_totals(), columnar_totals.alerts
+    return category_totals, alerts
+
+
+# Создает WindowedTotals по аргументам командной строки
+# Закрытые окна дописываются в файл report_path построчно в JSON: начало, конец, суммы в рублях
+def create_windows(args, report_file):
+    def on_close(start, end, totals):
+        if report_file is None:
+            return
+        report_file.write(json.dumps({
+            "start": format_micros(start),
+            "end": format_micros(end),
+            "totals": {category: amount / 100 for category, amount in totals.items()},
+        }, ensure_ascii=False) + "\n")
+
+    return WindowedTotals(
+        parse_duration(args.window),
+        parse_duration(args.slide) if args.slide else None,
+        parse_duration(args.lateness),
+        args.window_threshold,
+        on_close,
+    )
+
+
+def print_windows(windows):
+    print(f"\nОкон закрыто: {windows.closed_count}, "
+          f"предупреждений по окнам: {len(windows.alerts)}, "
+          f"опоздавших транзакций отброшено: {windows.late_count}")
+
+
+# Разбирает аргументы командной строки
+def parse_args():
+    parser = argparse.ArgumentParser(description="Подсчет расходов по категориям")
+    parser.add_argument("file", nargs="?", help="файл с транзакциями (JSON Lines или JSON-массив)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="количество процессов для параллельного подсчета (по умолчанию 1 - без пула)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="передавать транзакции колонками NumPy и считать суммы векторно")
+    parser.add_argument("--since", help="учитывать транзакции с этого времени (только для колоночного файла)")
+    parser.add_argument("--until", help="учитывать транзакции до этого времени (только для колоночного файла)")
+    parser.add_argument("--window", help="суммы по окнам времени заданной длины, например 1h или 1d")
+    parser.add_argument("--slide", help="шаг скользящих окон, например 10m (по умолчанию равен длине окна)")
+    parser.add_argument("--lateness", default="0s",
+                        help="насколько транзакция может опоздать и все еще попасть в окно (по умолчанию 0s)")
+    parser.add_argument("--window-threshold", type=float,
+                        help="порог предупреждения по категории за одно окно, руб.")
+    parser.add_argument("--window-report", help="файл, в который пишутся суммы закрытых окон (JSON Lines)")
+    parser.add_argument("--follow", action="store_true",
+                        help="обрабатывать новые транзакции, которые дописываются в файл JSON Lines (Ctrl+C - выход)")
+    parser.add_argument("--checkpoint", default=checkpoint_file_name,
+                        help=f"контрольная точка для --follow (по умолчанию {checkpoint_file_name})")
+    parser.add_argument("--metrics",
+                        help="файл для метрик этапов и очереди: .json - JSON, иначе текстовый формат Prometheus")
+    parser.add_argument("--profile", help="профилировать запуск через cProfile и сохранить профиль в файл")
+    return parser.parse_args()
+
+
+# Выводит метрики конвейера и сохраняет отчет в файл metrics_path, если он задан
+def report_metrics(metrics, metrics_path):
+    if metrics.queue_metrics is not None:
+        print_metrics(metrics.queue_metrics)
+    print_stages(metrics)
+    if metrics_path:
+        metrics.write(metrics_path)
+        print(f"Метрики сохранены в {metrics_path}")
+
+
+# Непрерывная обработка файла JSON Lines, в который дописывает generator.py --live
+# Продолжает с контрольной точки, если она есть
+async def follow(path, checkpoint_path, metrics_path=None):
+    if os.path.exists(path) and os.path.getsize(path) > 0 and detect_format(path) != "lines":
+        print("Режим --follow работает только с файлом JSON Lines")
+        return
 
-        # Извлекаем данные из транзакции
-        category = transaction["category"]
-        amount = transaction["amount"]
+    try:
+        state = LiveTotals(path)
+        if state.load(checkpoint_path):
+            print(f"Продолжаем с контрольной точки {checkpoint_path}")
+        transaction_queue = BatchQueue()
+        metrics = PipelineMetrics("processor", transaction_queue.metrics)
+        stop = stop_event()
+        await asyncio.gather(
+            live_loader(transaction_queue, FileTail(path, state.offset), stop, metrics=metrics),
+            live_processor(transaction_queue, state, checkpoint_path, metrics, metrics_path)
+        )
+    except Exception as error:
+        print(f"Произошла ошибка: {error}")
+        return
 
-        # Добавляем сумму к категории
-        if category not in category_totals:
-            category_totals[category] = 0
-            warned_categories[category] = False
+    print_summary(state.category_totals)
+    print_latency(state)
+    report_metrics(metrics, metrics_path)
 
-        category_totals[category] += amount
 
-        # Проверяем, не превысила ли категория порог
-        if category_totals[category] > warning_threshold and not warned_categories[category]:
-            print(f"\nВнимание: расходы в категории '{category}' превысили {warning_threshold} руб.")
-            warned_categories[category] = True
+async def main():
+    args = parse_args()
+    # С --profile весь запуск идет под cProfile
+    with profiling(args.profile):
+        await run(args)
 
-    # После обработки всех транзакций выводим итоги
-    print_summary(category_totals)
 
+async def run(args):
+    path = choose_file(args.file)
 
-async def main():
-    # Создаем очередь для транзакций
-    # Главный элемент реактивной системы - через него передаются данные
-    transaction_queue = asyncio.Queue()
+    if args.columnar and CategoryDictionary is None:
+        print("Для режима --columnar нужен NumPy: pip install numpy")
+        return
+    # Колоночный файл определяется по сигнатуре в начале
+    columnar_input = CategoryDictionary is not None and os.path.exists(path) and is_columnar(path)
+    if (args.since or args.until) and not columnar_input:
+        print("Отбор по времени (--since, --until) работает только для колоночного файла")
+        return
+    if args.window and args.workers > 1 and not columnar_input:
+        print("Окна времени (--window) считаются только без пула процессов")
+        return
+
+    if args.follow:
+        await follow(path, args.checkpoint, args.metrics)
+        return
 
+    report_file = None
     try:
+        windows = None
+        if args.window:
+            if args.window_report:
+                report_file = open(args.window_report, "w", encoding="utf-8")
+            windows = create_windows(args, report_file)
+        elif args.slide or args.window_threshold is not None or args.window_report:
+            print("Параметры окон (--slide, --lateness, --window-threshold, --window-report) требуют --window")
+            return
+
+        if columnar_input:
+            # Колоночный файл уже обрабатывается векторно, пул процессов ему не нужен
+            transaction_queue = BatchQueue()
+            metrics = PipelineMetrics("processor", transaction_queue.metrics)
+            start_time = parse_time(args.since) if args.since else None
+            end_time = parse_time(args.until) if args.until else None
+            _, (category_totals, _) = await asyncio.gather(
+                columnar_loader(transaction_queue, path, start_time, end_time, metrics),
+                transaction_processor(transaction_queue, windows=windows, metrics=metrics)
+            )
+            print_summary(category_totals)
+            if windows is not None:
+                print_windows(windows)
+            report_metrics(metrics, args.metrics)
+            return
+
+        if args.workers > 1:
+            if not os.path.exists(path):
+                print(f"Файл {path} не найден")
+                return
+            # Файл делится на части, которые считают процессы пула
+            print(f"Параллельная обработка транзакций на {args.workers} процессах...")
+            # Этапы внутри процессов пула не замеряются, только подсчет целиком
+            metrics = PipelineMetrics("processor")
+            started = time.perf_counter()
+            category_totals, _ = await asyncio.to_thread(parallel_totals, path, args.workers)
+            metrics.record("aggregate", started)
+            print_summary(category_totals)
+            report_metrics(metrics, args.metrics)
+            return
+
+        # Создаем очередь для транзакций
+        # Главный элемент реактивной системы - через него передаются данные
+        # Очередь ограничена и передает пакеты транзакций,
+        # поэтому файл читается не быстрее, чем идет обработка
+        transaction_queue = BatchQueue()
+        # Метрики этапов и очереди
+        metrics = PipelineMetrics("processor", transaction_queue.metrics)
+
         # Запускаем загрузку и обработку параллельно
         # Работают одновременно и общаются через очередь
-        await asyncio.gather(
-            transaction_loader(transaction_queue),
-            transaction_processor(transaction_queue)
+        _, (category_totals, _) = await asyncio.gather(
+            transaction_loader(transaction_queue, path, CategoryDictionary() if args.columnar else None, metrics),
+            transaction_processor(transaction_queue, windows=windows, metrics=metrics)
         )
 
+        # После обработки всех транзакций выводим итоги
+        print_summary(category_totals)
+        if windows is not None:
+            print_windows(windows)
+        report_metrics(metrics, args.metrics)
     except Exception as error:
         print(f"Произошла ошибка: {error}")
+    finally:
+        if report_file is not None:
+            report_file.close()
 
 
 if __name__ == "__main__":
     # Запускаем асинхронную программу
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
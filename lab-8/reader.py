@@ -0,0 +1,146 @@
+import json
+import os
+from itertools import islice
+
+from pipeline import BATCH_SIZE
+
+# Чтение файлов с транзакциями (общее для processor.py и параллельной обработки)
+
+# Название файла со всеми транзакциями
+# JSON Lines (одна транзакция в строке), его пишет generator.py
+file_name = "transactions.jsonl"
+# Файл в старом формате (JSON-массив), читается, если нового файла нет
+legacy_file_name = "transactions.json"
+# Бинарный колоночный файл (generator.py --format columnar)
+columnar_file_name = "transactions.col"
+
+
+# Выбирает файл для обработки: заданный путь, иначе первый существующий из файлов
+# в формате JSON Lines, колоночном формате и старом формате
+def choose_file(path=None):
+    if path:
+        return path
+    for name in (file_name, columnar_file_name, legacy_file_name):
+        if os.path.exists(name):
+            return name
+    return file_name
+
+
+# Сколько символов читается из файла за раз
+READ_BLOCK_SIZE = 1 << 16
+
+
+# Читает элементы JSON-массива по одному, не загружая весь файл
+# В памяти остается только текущий блок файла и недочитанный элемент
+def iter_json_array(file):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    started = False
+
+    while True:
+        # Пропускаем пробелы, а внутри массива и запятые между элементами
+        separators = " \t\r\n," if started else " \t\r\n"
+        while position < len(buffer) and buffer[position] in separators:
+            position += 1
+
+        # Данные кончились, но элемент не разобран - читаем следующий блок
+        if position == len(buffer):
+            if eof:
+                raise ValueError("Файл оборвался до конца JSON-массива")
+            block = file.read(READ_BLOCK_SIZE)
+            eof = not block
+            buffer = buffer[position:] + block
+            position = 0
+            continue
+
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("Файл не является JSON-массивом")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Элемент оборвался на границе блока
+            if eof:
+                raise
+            end = None
+        # Число в конце блока могло оборваться, поэтому такой элемент тоже дочитываем
+        if end is None or end == len(buffer) and not eof:
+            block = file.read(READ_BLOCK_SIZE)
+            eof = not block
+            buffer = buffer[position:] + block
+            position = 0
+            continue
+
+        position = end
+        yield value
+
+
+# Формат файла по содержимому: '[' в начале - JSON-массив ("array"), иначе JSON Lines ("lines")
+def detect_format(path):
+    with open(path, "r", encoding="utf-8") as file:
+        first_char = file.read(1)
+        while first_char.isspace():
+            first_char = file.read(1)
+    return "array" if first_char == "[" else "lines"
+
+
+# Читает транзакции из файла по одной
+# В обоих форматах файл читается частями, поэтому память не зависит от его размера
+def read_transactions(path):
+    file_format = detect_format(path)
+    with open(path, "r", encoding="utf-8") as file:
+        if file_format == "array":
+            yield from iter_json_array(file)
+            return
+
+        # JSON Lines: файл читается построчно
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+# Читает транзакции из файла списками по size штук
+def read_transaction_chunks(path, size=BATCH_SIZE):
+    transactions = read_transactions(path)
+    try:
+        while True:
+            chunk = list(islice(transactions, size))
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        transactions.close()
+
+
+# Делит файл JSON Lines на parts диапазонов байтов примерно одинакового размера
+# Возвращает список пар (начало, конец)
+def split_ranges(path, parts):
+    size = os.path.getsize(path)
+    bounds = [size * i // parts for i in range(parts + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+
+# Читает транзакции из диапазона байтов [start, end) файла JSON Lines
+# Диапазону принадлежат строки, которые начинаются внутри него,
+# поэтому соседние диапазоны вместе читают каждую строку ровно один раз
+def read_range(path, start, end):
+    with open(path, "rb") as file:
+        position = start
+        if start > 0:
+            # Пропускаем строку, которая началась в предыдущем диапазоне
+            file.seek(start - 1)
+            position = start - 1 + len(file.readline())
+        for line in file:
+            if position >= end:
+                break
+            position += len(line)
+            if line.strip():
+                yield json.loads(line.decode("utf-8"))
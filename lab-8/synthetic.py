@@ -0,0 +1,193 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from columnar import CategoryDictionary, TransactionBatch, parse_time
+from persistence import recover_jsonl
+
+# Быстрая генерация больших объемов тестовых транзакций (generator.py --count N)
+#
+# Транзакции создаются блоками по CHUNK_SIZE штук сразу в массивах NumPy, без словаря на каждую транзакцию.
+# Блок с номером index генерируется своим генератором случайных чисел от (seed, index),
+# поэтому файл зависит только от параметров и seed, но не от количества процессов.
+# Время транзакций идет по возрастанию: блок занимает свою долю интервала [start, end).
+#
+# Строки JSON Lines собираются как байтовая матрица: у всех строк одинаковая длина,
+# а короткие названия категорий и суммы дополнены пробелами (пробелы между элементами JSON допустимы)
+
+# Сколько транзакций в одном блоке генерации
+CHUNK_SIZE = 1 << 20
+# Категории по умолчанию, как в generate_transaction
+DEFAULT_CATEGORIES = ["Супермаркеты", "Кафе и рестораны", "Одежда и обувь",
+                      "Цифровой контент", "Образование", "Сотовая связь"]
+# Суммы в копейках: от 1 до 5000 рублей, как в generate_transaction
+MIN_AMOUNT = 100
+MAX_AMOUNT = 500000
+
+
+# Разбирает распределение категорий вида "Супермаркеты=5,Образование=1"
+# Возвращает (названия, доли); без распределения - категории по умолчанию поровну
+def parse_distribution(text=None):
+    if not text:
+        return list(DEFAULT_CATEGORIES), np.full(len(DEFAULT_CATEGORIES), 1 / len(DEFAULT_CATEGORIES))
+
+    names = []
+    weights = []
+    for item in text.split(","):
+        name, _, weight = item.rpartition("=")
+        if not name.strip() or name.strip() in names:
+            raise ValueError(f"Неверная категория в распределении: {item}")
+        names.append(name.strip())
+        weights.append(float(weight))
+    weights = np.array(weights)
+    if (weights < 0).any() or weights.sum() <= 0:
+        raise ValueError("Доли категорий должны быть неотрицательными, хотя бы одна - больше нуля")
+    return names, weights / weights.sum()
+
+
+# Параметры генерации
+class SyntheticSpec:
+    def __init__(self, count, seed=0, names=None, weights=None, start="2025-01-01", end="2026-01-01"):
+        self.count = count
+        self.seed = seed
+        if names is None:
+            names, weights = parse_distribution()
+        self.names = names
+        self.weights = weights
+        # Интервал времени в микросекундах от 1970-01-01
+        self.start_time = parse_time(start)
+        self.end_time = parse_time(end)
+        if self.end_time <= self.start_time:
+            raise ValueError("Конец интервала времени должен быть позже начала")
+
+    def chunk_count(self):
+        return (self.count + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+
+# Генерирует блок index: (коды категорий, время в микросекундах, суммы в копейках)
+def generate_chunk(spec, index):
+    rng = np.random.default_rng([spec.seed, index])
+    first = index * CHUNK_SIZE
+    size = min(CHUNK_SIZE, spec.count - first)
+
+    categories = rng.choice(len(spec.names), size=size, p=spec.weights).astype(np.uint16)
+    # Блок занимает долю интервала времени, пропорциональную его номерам транзакций
+    span = spec.end_time - spec.start_time
+    chunk_start = spec.start_time + span * first // spec.count
+    chunk_end = spec.start_time + span * (first + size) // spec.count
+    timestamps = np.sort(rng.integers(chunk_start, max(chunk_end, chunk_start + 1), size=size))
+    kopecks = rng.integers(MIN_AMOUNT, MAX_AMOUNT + 1, size=size)
+    return categories, timestamps, kopecks
+
+
+# Записывает в столбцы matrix[:, first:first + width] десятичные цифры чисел values
+# leading_spaces - ведущие нули заменяются пробелами (кроме последней цифры)
+def put_digits(matrix, first, width, values, leading_spaces=False):
+    for position in range(width):
+        power = 10 ** (width - 1 - position)
+        digits = (values // power % 10).astype(np.uint8) + ord("0")
+        if leading_spaces and position < width - 1:
+            digits[values < power] = ord(" ")
+        matrix[:, first + position] = digits
+
+
+# Собирает строки JSON Lines для блока одной байтовой матрицей
+def format_jsonl(names, categories, timestamps, kopecks):
+    # Названия категорий в JSON, дополненные пробелами до одной длины
+    encoded = [json.dumps(name, ensure_ascii=False).encode("utf-8") for name in names]
+    name_width = max(len(name) for name in encoded)
+    name_table = np.array([list(name.ljust(name_width)) for name in encoded], dtype=np.uint8)
+    amount_digits = len(str(MAX_AMOUNT // 100))
+
+    parts = [
+        (b'{"timestamp": "', None),
+        (b"YYYY-MM-DD HH:MM:SS.ffffff", "timestamp"),
+        (b'", "category": ', None),
+        (b" " * name_width, "category"),
+        (b', "amount": ', None),
+        (b" " * amount_digits + b".00", "amount"),
+        (b"}\n", None),
+    ]
+    template = b"".join(text for text, _ in parts)
+    offsets = {}
+    position = 0
+    for text, field in parts:
+        if field:
+            offsets[field] = position
+        position += len(text)
+
+    matrix = np.empty((len(kopecks), len(template)), dtype=np.uint8)
+    matrix[:] = np.frombuffer(template, dtype=np.uint8)
+
+    # Дата и время по частям: дни -> год, месяц, день; остаток дня -> часы, минуты, секунды, микросекунды
+    days = timestamps.astype("datetime64[us]").astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    years = months.astype("datetime64[Y]")
+    day_micros = timestamps - days.astype("datetime64[us]").astype(np.int64)
+    column = offsets["timestamp"]
+    put_digits(matrix, column, 4, years.astype(np.int64) + 1970)
+    put_digits(matrix, column + 5, 2, months.astype(np.int64) - years.astype("datetime64[M]").astype(np.int64) + 1)
+    put_digits(matrix, column + 8, 2, days.astype(np.int64) - months.astype("datetime64[D]").astype(np.int64) + 1)
+    put_digits(matrix, column + 11, 2, day_micros // 3600000000)
+    put_digits(matrix, column + 14, 2, day_micros // 60000000 % 60)
+    put_digits(matrix, column + 17, 2, day_micros // 1000000 % 60)
+    put_digits(matrix, column + 20, 6, day_micros % 1000000)
+
+    column = offsets["category"]
+    matrix[:, column:column + name_width] = name_table[categories]
+
+    column = offsets["amount"]
+    put_digits(matrix, column, amount_digits, kopecks // 100, leading_spaces=True)
+    put_digits(matrix, column + amount_digits + 1, 2, kopecks % 100)
+    return matrix.tobytes()
+
+
+# Генерирует блок в нужном формате (выполняется в процессе пула)
+# JSON Lines - готовые байты строк, колоночный формат - массивы колонок
+def generate_part(spec, index, file_format):
+    categories, timestamps, kopecks = generate_chunk(spec, index)
+    if file_format == "jsonl":
+        return format_jsonl(spec.names, categories, timestamps, kopecks)
+    return categories, timestamps, kopecks / 100
+
+
+# Генерирует блоки по порядку, на workers процессах, если их больше одного
+# Одновременно в работе не больше двух блоков на процесс, поэтому память не зависит от количества транзакций
+def generate_parts(spec, file_format, workers=1):
+    if workers <= 1:
+        for index in range(spec.chunk_count()):
+            yield generate_part(spec, index, file_format)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for index in range(spec.chunk_count()):
+            pending.append(pool.submit(generate_part, spec, index, file_format))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# Дописывает spec.count транзакций в файл JSON Lines
+# Поврежденный после сбоя конец файла сначала обрезается, в конце данные сбрасываются на диск
+def write_jsonl(spec, path, workers=1):
+    recover_jsonl(path)
+    with open(path, "ab") as file:
+        for lines in generate_parts(spec, "jsonl", workers):
+            file.write(lines)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+# Дописывает spec.count транзакций в колоночный файл через writer (ColumnarWriter)
+def write_columnar(spec, writer, workers=1):
+    dictionary = CategoryDictionary()
+    for name in spec.names:
+        dictionary.encode(name)
+    for categories, timestamps, amounts in generate_parts(spec, "columnar", workers):
+        writer.write_batch(TransactionBatch(dictionary, categories, timestamps, amounts))
+    writer.close()
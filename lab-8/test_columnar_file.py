@@ -0,0 +1,63 @@
+import os
+
+import pytest
+from columnar_file import TRAILER, ColumnarFile, ColumnarWriter
+
+
+def transactions(count, prefix="c"):
+    return [{"category": f"{prefix}{i % 5}", "timestamp": "2024-01-01 00:00:00", "amount": float(i)}
+            for i in range(count)]
+
+
+def write_session(path, count, prefix="c"):
+    writer = ColumnarWriter(path, chunk_rows=100)
+    writer.write(transactions(count, prefix))
+    writer.close()
+
+
+# Дописывание занимает место старого каталога, и файл не растет на мертвые окончания
+def test_append_reuses_footer_space(tmp_path):
+    appended = str(tmp_path / "appended.col")
+    for _ in range(3):
+        write_session(appended, 200)
+
+    single = str(tmp_path / "single.col")
+    writer = ColumnarWriter(single, chunk_rows=100)
+    for _ in range(3):
+        writer.write(transactions(200))
+    writer.close()
+
+    assert len(ColumnarFile(appended)) == 600
+    assert os.path.getsize(appended) == os.path.getsize(single)
+    assert not os.path.exists(appended + ".footer")
+
+
+# Если дописывание оборвалось, старое окончание возвращается, и ранее закрытые записи читаются
+def test_interrupted_append_restores_footer(tmp_path):
+    path = str(tmp_path / "data.col")
+    write_session(path, 250)
+
+    writer = ColumnarWriter(path, chunk_rows=100)
+    writer.write(transactions(350, "new"))
+    # Сбой: блоки записаны, а каталог и окончание - нет
+    writer.file.flush()
+    writer.file.close()
+
+    writer = ColumnarWriter(path, chunk_rows=100)
+    assert writer.recovered_bytes > 0
+    assert writer.dictionary.names == [f"c{i}" for i in range(5)]
+    writer.close()
+    assert len(ColumnarFile(path)) == 250
+
+
+# Окончание с неверной контрольной суммой каталога не считается целым
+def test_corrupted_directory_rejected(tmp_path):
+    path = str(tmp_path / "data.col")
+    write_session(path, 250)
+    with open(path, "r+b") as file:
+        directory_offset = TRAILER.unpack_from(file.read()[-TRAILER.size:])[0]
+        file.seek(directory_offset)
+        file.write(b"\xff")
+
+    with pytest.raises(ValueError):
+        ColumnarFile(path)
@@ -0,0 +1,50 @@
+import json
+
+import persistence
+from persistence import JsonLinesWriter, recover_jsonl
+
+
+def write_lines(path, records, tail=b""):
+    with open(path, "wb") as file:
+        for record in records:
+            file.write(json.dumps(record).encode("utf-8") + b"\n")
+        file.write(tail)
+
+
+# Недописанная строка длиннее окна восстановления отрезается целиком
+def test_torn_tail_longer_than_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "RECOVERY_WINDOW", 64)
+    path = str(tmp_path / "data.jsonl")
+    records = [{"id": i} for i in range(10)]
+    tail = b'{"id": 10, "note": "' + b"x" * 500
+    write_lines(path, records, tail)
+
+    assert recover_jsonl(path) == len(tail)
+    with open(path, "rb") as file:
+        assert [json.loads(line) for line in file] == records
+
+
+# Строка, которая не разбирается как JSON, отрезается вместе со всем, что после нее
+def test_invalid_line_truncated(tmp_path):
+    path = str(tmp_path / "data.jsonl")
+    records = [{"id": i} for i in range(3)]
+    write_lines(path, records, b'{"id": \n{"id": 4}\n')
+
+    writer = JsonLinesWriter(path, sync=False)
+    assert writer.recovered_bytes == len(b'{"id": \n{"id": 4}\n')
+    writer.write([{"id": 3}])
+    writer.close()
+    with open(path, "rb") as file:
+        assert [json.loads(line) for line in file] == records + [{"id": 3}]
+
+
+# Файл без единого перевода строки отрезается полностью
+def test_single_torn_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "RECOVERY_WINDOW", 16)
+    path = str(tmp_path / "data.jsonl")
+    tail = b'{"id": 1, "note": "' + b"y" * 100
+    write_lines(path, [], tail)
+
+    assert recover_jsonl(path) == len(tail)
+    with open(path, "rb") as file:
+        assert file.read() == b""
@@ -0,0 +1,136 @@
+import heapq
+import re
+from datetime import datetime, timedelta
+
+from aggregation import to_kopecks
+
+# Суммы по категориям в окнах времени, которые считаются по мере поступления транзакций
+#
+# Окно длиной size начинается в моменты, кратные slide (от 1970-01-01, время без часового пояса):
+# - slide == size: неперекрывающиеся окна (например, по часам или по дням)
+# - slide < size: скользящие окна (например, последние 10 минут с шагом в минуту),
+#   транзакция попадает в size / slide окон
+#
+# Транзакции могут приходить не по порядку времени. Окно закрывается, когда
+# водяной знак (наибольшее увиденное время минус lateness) доходит до его конца:
+# до этого опоздавшие транзакции еще попадают в окно, после - отбрасываются и считаются.
+# В памяти хранятся только открытые окна, их число зависит от size, slide и lateness,
+# а не от количества транзакций.
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Единицы длительности: "90s", "10m", "1h", "1d"
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+DURATION_PATTERN = re.compile(r"^(\d+)([smhd])$")
+
+
+# Длительность вида "10m" в микросекундах
+def parse_duration(text):
+    match = DURATION_PATTERN.match(text.strip().lower())
+    if not match:
+        raise ValueError(f"Неверная длительность: {text} (примеры: 90s, 10m, 1h, 1d)")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)] * 1000000
+
+
+# Время транзакции ("2025-01-01 10:00:00.123456") в микросекундах от 1970-01-01
+def to_micros(timestamp):
+    return (datetime.fromisoformat(timestamp) - EPOCH) // MICROSECOND
+
+
+def format_micros(micros):
+    return str(EPOCH + timedelta(microseconds=micros))
+
+
+class WindowedTotals:
+    def __init__(self, size, slide=None, lateness=0, warning_threshold=None, on_close=None):
+        # Длина окна, шаг начала окон и допустимое опоздание в микросекундах
+        self.size = size
+        self.slide = slide or size
+        if self.size % self.slide:
+            raise ValueError("Длина окна должна делиться на шаг окон")
+        self.lateness = lateness
+        self.warning_threshold = warning_threshold
+        self.threshold = to_kopecks(warning_threshold) if warning_threshold is not None else None
+        # Функция, которая получает закрытое окно: (начало, конец, суммы по категориям в копейках)
+        self.on_close = on_close
+
+        # Открытые окна: начало -> суммы по категориям в копейках
+        self.open_windows = {}
+        # Начала открытых окон для закрытия по порядку
+        self.starts = []
+        # Категории, по которым в окне уже было предупреждение: начало -> множество
+        self.warned = {}
+        self.watermark = None
+        self.alerts = []
+        # Статистика: закрытые окна и отброшенные опоздавшие транзакции
+        self.closed_count = 0
+        self.late_count = 0
+
+    # Добавляет транзакцию: время в микросекундах, категория, сумма в копейках
+    # position - номер транзакции в файле для текста предупреждения
+    def add(self, micros, category, kopecks, position=None):
+        late = False
+        # Начала всех окон, в которые попадает время: от последнего к первому
+        start = micros - micros % self.slide
+        while start > micros - self.size:
+            if self.watermark is not None and start + self.size <= self.watermark:
+                # Окно уже закрыто, транзакция опоздала больше, чем на lateness
+                late = True
+            else:
+                self.add_to_window(start, micros, category, kopecks, position)
+            start -= self.slide
+        if late:
+            self.late_count += 1
+
+        # Сдвигаем водяной знак и закрываем окна, которые до него закончились
+        watermark = micros - self.lateness
+        if self.watermark is None or watermark > self.watermark:
+            self.watermark = watermark
+            self.close_windows(watermark)
+
+    def add_to_window(self, start, micros, category, kopecks, position):
+        totals = self.open_windows.get(start)
+        if totals is None:
+            totals = self.open_windows[start] = {}
+            heapq.heappush(self.starts, start)
+        total = totals.get(category, 0) + kopecks
+        totals[category] = total
+
+        if self.threshold is not None and total > self.threshold:
+            warned = self.warned.setdefault(start, set())
+            if category not in warned:
+                warned.add(category)
+                self.alerts.append((category, start, position))
+                print(f"\nВнимание: расходы в категории '{category}' за окно {format_micros(start)} - "
+                      f"{format_micros(start + self.size)} превысили {self.warning_threshold} руб. "
+                      f"(транзакция №{position} от {format_micros(micros)})")
+
+    # Закрывает окна, которые закончились не позже watermark (None - все окна)
+    def close_windows(self, watermark=None):
+        while self.starts and (watermark is None or self.starts[0] + self.size <= watermark):
+            start = heapq.heappop(self.starts)
+            totals = self.open_windows.pop(start)
+            self.warned.pop(start, None)
+            self.closed_count += 1
+            if self.on_close is not None:
+                self.on_close(start, start + self.size, totals)
+
+    # Добавляет пакет транзакций: список словарей или колоночный пакет
+    # first_position - номер первой транзакции пакета в файле
+    def add_batch(self, batch, first_position):
+        if isinstance(batch, list):
+            for offset, transaction in enumerate(batch):
+                self.add(to_micros(transaction["timestamp"]), transaction["category"],
+                         to_kopecks(transaction["amount"]), first_position + offset)
+            return
+
+        # Колоночный пакет: колонки переводятся в списки целиком, без словаря на каждую транзакцию
+        names = batch.dictionary.names
+        rows = zip(batch.timestamps.tolist(), batch.categories.tolist(), batch.amounts.tolist())
+        for offset, (micros, code, amount) in enumerate(rows):
+            self.add(micros, names[code], to_kopecks(amount), first_position + offset)
+
+    # Закрывает все оставшиеся окна в конце потока
+    def finish(self):
+        self.close_windows()